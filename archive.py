@@ -0,0 +1,85 @@
+import os
+import re
+import threading
+from settings_store import atomic_write
+
+# Matches the '_[VIDEO_ID].ext' suffix of the yt-dlp output template
+FILENAME_ID_PATTERN = re.compile(r'_\[([a-zA-Z0-9_-]{11})\]\.[^.]+$')
+
+def filename_to_id(filename):
+    '''
+    Extract the YouTube video ID embedded in a downloaded filename, or None if it has none
+    '''
+    match = FILENAME_ID_PATTERN.search(filename)
+    if match:
+        return match.group(1)
+    return None
+
+class DownloadArchive:
+    def __init__(self, archive_path):
+        '''
+        Persistent index of downloaded YouTube video IDs, so the downloader can skip known videos before
+        any network or FFmpeg work. Stored in yt-dlp's download archive format ("youtube VIDEO_ID" per line)
+        '''
+        self.archive_path = archive_path
+        self.ids = {}
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.archive_path):
+            return
+        with open(self.archive_path, 'r', encoding='utf-8') as archive_file:
+            for line in archive_file:
+                parts = line.split()
+                if len(parts) == 2 and parts[0] == 'youtube':
+                    self.ids[parts[1]] = None
+
+    def sync(self, files):
+        # Rebuild from the library listing, which is the source of truth, and only rewrite the file if it changed
+        ids = {}
+        for filename in files:
+            video_id = filename_to_id(filename)
+            if video_id:
+                ids[video_id] = filename
+        with self.lock:
+            changed = ids.keys() != self.ids.keys()
+            self.ids = ids
+            if changed:
+                self._write()
+
+    def _write(self):
+        with atomic_write(self.archive_path) as archive_file:
+            archive_file.writelines(f'youtube {video_id}\n' for video_id in self.ids)
+
+    def has(self, video_id):
+        return video_id in self.ids
+
+    def get_file(self, video_id):
+        return self.ids.get(video_id)
+
+    def add(self, filename):
+        video_id = filename_to_id(filename)
+        if not video_id:
+            return
+        with self.lock:
+            is_new = video_id not in self.ids
+            self.ids[video_id] = filename
+            if is_new:
+                with open(self.archive_path, 'a', encoding='utf-8') as archive_file:
+                    archive_file.write(f'youtube {video_id}\n')
+
+    def remove(self, filename):
+        self.remove_files([filename])
+
+    def remove_files(self, filenames):
+        # Removing takes a rewrite of the whole file, so many files at once only rewrite it once
+        video_ids = [filename_to_id(filename) for filename in filenames]
+        with self.lock:
+            removed = False
+            for video_id in video_ids:
+                if video_id in self.ids:
+                    del self.ids[video_id]
+                    removed = True
+            if removed:
+                self._write()
@@ -0,0 +1,70 @@
+import queue
+import threading
+
+class BackgroundJob:
+    def __init__(self):
+        '''
+        Work run on a background thread, usually across a pool, whose results are handed to the main thread through a queue.
+        Subclasses do the work in _run, passing each result to _put, and store results in _apply, which drain calls.
+        A job that has finished can be started again
+        '''
+        self.results = queue.Queue()
+        self.thread = None
+        self.executor = None # Set by _run if it uses a pool, so cancel can drop the work still queued in it. _run shuts it down
+        self.cancelled = threading.Event()
+        self.running = False # Until the main thread has drained the end of the last run
+
+    def _start(self, *args):
+        # Results of the last run, including its end, are applied first so they can't be mistaken for this one's
+        self.drain()
+        self.cancelled.clear()
+        self.running = True
+        self.thread = threading.Thread(target=self._thread, args=args, daemon=True)
+        self.thread.start()
+
+    def _thread(self, *args):
+        try:
+            self._run(*args)
+        except Exception as e:
+            print(f'Error in {type(self).__name__}: {e}')
+        finally:
+            self.results.put(None)
+
+    def _run(self, *args):
+        raise NotImplementedError
+
+    def _pool(self, executor):
+        # Makes executor the one cancel shuts down, returning it for _run to shut down itself once done
+        self.executor = executor
+        return executor
+
+    def _put(self, result):
+        self.results.put(result)
+
+    def _apply(self, result):
+        raise NotImplementedError
+
+    def drain(self):
+        '''
+        Applies the results finished so far on the main thread, and returns them
+        '''
+        drained = []
+        while True:
+            try:
+                result = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if result is None:
+                self.running = False
+                continue
+            self._apply(result)
+            drained.append(result)
+        return drained
+
+    def is_active(self):
+        return self.running
+
+    def cancel(self):
+        self.cancelled.set()
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
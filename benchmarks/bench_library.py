@@ -0,0 +1,172 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from tracks import Playlist
+from settings_store import SettingsStore, atomic_write_json
+
+# A silent MPEG-1 Layer III frame: 32 kbps, 44.1 kHz, joint stereo, 104 bytes
+FRAME_HEADER = bytes([0xFF, 0xFB, 0x10, 0x44])
+FRAME_LENGTH = 144 * 32000 // 44100
+FRAME = FRAME_HEADER + bytes(FRAME_LENGTH - len(FRAME_HEADER))
+ID_CHARS = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_-'
+WORDS = ['love', 'night', 'summer', 'blue', 'dance', 'heart', 'fire', 'dream', 'city', 'rain',
+         'gold', 'wild', 'light', 'river', 'song', 'home', 'road', 'star', 'time', 'ocean']
+VISIBLE_ROWS = 30 # Rows the track list renders when a playlist is shown
+
+def make_library(base_path, size, seed=0, frames=8, warm=True):
+    '''
+    Create a synthetic library of size fake downloads named like yt-dlp output, each a few valid MP3 frames,
+    with settings holding ten playlists. With warm, the metadata cache is filled in as after a previous run
+    '''
+    rng = random.Random(seed)
+    filepath = os.path.join(base_path, 'files')
+    os.makedirs(filepath)
+    data = FRAME * frames
+    files = []
+    for i in range(size):
+        title = '_'.join(rng.choice(WORDS).capitalize() for _ in range(rng.randint(1, 4)))
+        video_id = ''.join(rng.choice(ID_CHARS) for _ in range(11))
+        filename = f'{title}_{i}_[{video_id}].mp3'
+        with open(os.path.join(filepath, filename), 'wb') as audio_file:
+            audio_file.write(data)
+        files.append(filename)
+
+    playlists = {f'Playlist {i}': rng.sample(files, size // 10) for i in range(10)}
+    atomic_write_json(os.path.join(base_path, 'settings.json'), {
+        'current playlist': 'Playlist 0',
+        'current track': files[0],
+        'queue position': 0,
+        'track position': 0.0,
+        'shuffle': False,
+        'volume': 0.5,
+        'fade': 1000,
+        'crossfade': True,
+        'download workers': 4,
+        'transcode workers': 2,
+        'playlists': playlists,
+    })
+
+    if warm:
+        length = frames * 1152 / 44100
+        entries = {}
+        for filename in files:
+            stat = os.stat(os.path.join(filepath, filename))
+            entries[filename] = {'length': length, 'bitrate': 32000, 'sample rate': 44100, 'tags': {},
+                                 'mtime': stat.st_mtime, 'size': stat.st_size}
+        atomic_write_json(os.path.join(base_path, 'metadata.json'), entries)
+    return files
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return 1000 * (time.perf_counter() - start), result
+
+def bench_playlist(files, ops, seed=0):
+    '''
+    Playlist operations on the "All" playlist of the library, in ms
+    '''
+    names = [file[:file.index('[') - 1].replace('_', ' ') for file in files]
+    sample = random.Random(seed).sample(range(len(files)), min(ops, len(files)))
+    results = {}
+    playlist = Playlist('All')
+
+    def add():
+        for name, file in zip(names, files):
+            playlist.add_track(name, file)
+    results['add_track'], _ = timed(add)
+    results['shuffle_queue'], _ = timed(playlist.shuffle_queue)
+    results['unshuffle_queue'], _ = timed(playlist.unshuffle_queue)
+
+    def remove():
+        for i in sample:
+            playlist.remove_track(names[i])
+    results[f'remove_track x{len(sample)}'], _ = timed(remove)
+    return results
+
+def bench_engine(base_path, repeats):
+    '''
+    Library load, playlist switching and settings I/O through the headless engine, in ms
+    '''
+    from engine import MusicEngine
+    results = {}
+    # Loading settings and setting up playlists both happen when the engine is created
+    results['setup (load settings + setup playlists)'], engine = timed(MusicEngine, base_path)
+    engine.indexer.cancel()
+
+    def change_playlists():
+        # The engine side of change_playlist, plus the rows the track list reads to draw a window's worth
+        for name in ['All'] + list(engine.playlists):
+            queue = engine.set_current_playlist(name).get_queue()
+            rows = [queue[i] for i in range(min(VISIBLE_ROWS, len(queue)))]
+        return rows
+    results['change_playlist x11'], _ = timed(change_playlists)
+
+    store = SettingsStore(engine.settings_path)
+    results['load settings'] = min(timed(store.load)[0] for _ in range(repeats))
+    results['save settings'] = min(timed(engine.save_settings)[0] for _ in range(repeats))
+    results['add + remove 100 journaled edits'], _ = timed(journal_edits, engine)
+    engine.close()
+    return results
+
+def journal_edits(engine):
+    playlist = engine.playlists['Playlist 9']
+    tracks = [track for track in engine.tracks if not playlist.has_file(track)][:100]
+    for track in tracks:
+        engine.add_to_playlist('Playlist 9', track)
+    for track in tracks:
+        engine.remove_from_playlist('Playlist 9', track)
+
+def git_version():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(sizes, ops, repeats, warm, seed):
+    report = {
+        'version': git_version(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'warm metadata cache': warm,
+        'results': {},
+    }
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as base_path:
+            generate_ms, files = timed(make_library, base_path, size, seed, 8, warm)
+            results = {'generate library': generate_ms}
+            results.update(bench_playlist(files, ops, seed))
+            try:
+                results.update(bench_engine(base_path, repeats))
+            except ImportError as e:
+                # The engine needs the app's dependencies (pygame, mutagen, yt-dlp)
+                results['engine skipped'] = str(e)
+            report['results'][str(size)] = results
+        print(f'{size} tracks done', file=sys.stderr)
+    return report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark library loading, playlist operations and settings I/O on synthetic libraries')
+    parser.add_argument('--sizes', default='1000,10000,100000', help='comma separated library sizes')
+    parser.add_argument('--ops', type=int, default=1000, help='number of single-track operations to time')
+    parser.add_argument('--repeats', type=int, default=5, help='repeats for settings I/O, the best is reported')
+    parser.add_argument('--cold', action='store_true', help='start without a metadata cache, so every file is indexed')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the JSON report to this file instead of stdout')
+    args = parser.parse_args()
+
+    report = run([int(size) for size in args.sizes.split(',')], args.ops, args.repeats, not args.cold, args.seed)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump(report, output_file, indent=4)
+    else:
+        print(json.dumps(report, indent=4))
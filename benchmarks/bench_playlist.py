@@ -0,0 +1,74 @@
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tracks import Playlist
+
+class ListPlaylist:
+    def __init__(self, name):
+        '''
+        The previous list-backed Playlist operations, kept here as the baseline to compare against
+        '''
+        self.name = name
+        self.queue = []
+        self.tracks = {}
+
+    def add_track(self, name, file):
+        self.tracks[name] = file
+        self.queue.append(name)
+
+    def remove_track(self, name):
+        del self.tracks[name]
+        self.queue.remove(name)
+
+    def position(self, name):
+        return self.queue.index(name)
+
+    def has_file(self, file):
+        return file in list(self.tracks.values())
+
+def bench(playlist_class, size, ops):
+    '''
+    Time add, position lookup, membership and remove for a playlist of the given size
+    '''
+    names = [f'Track {i}' for i in range(size)]
+    files = [f'Track_{i}_[{i:011d}].mp3' for i in range(size)]
+    sample = random.Random(0).sample(range(size), ops)
+    results = {}
+
+    playlist = playlist_class('Bench')
+    start = time.perf_counter()
+    for name, file in zip(names, files):
+        playlist.add_track(name, file)
+    results['add'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in sample:
+        if playlist_class is Playlist:
+            playlist.get_queue().index(names[i])
+        else:
+            playlist.position(names[i])
+    results['position'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in sample:
+        playlist.has_file(files[i])
+    results['membership'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in sample:
+        playlist.remove_track(names[i])
+    results['remove'] = time.perf_counter() - start
+    return results
+
+if __name__ == '__main__':
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    ops = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    old = bench(ListPlaylist, size, ops)
+    new = bench(Playlist, size, ops)
+    print(f'{size} tracks, {ops} operations each')
+    print(f'{"operation":<12}{"list (ms)":>12}{"indexed (ms)":>15}{"speedup":>10}')
+    for op in old:
+        print(f'{op:<12}{1000 * old[op]:>12.2f}{1000 * new[op]:>15.2f}{old[op] / new[op]:>9.1f}x')
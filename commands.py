@@ -0,0 +1,31 @@
+import queue
+
+class CommandQueue:
+    def __init__(self):
+        '''
+        Library changes requested from other threads, e.g. download workers adding the files they finished.
+        Only the main thread applies them, in batches, so the library and its playlists have a single writer
+        '''
+        self.queue = queue.Queue()
+        self.on_put = None # Called after each command is put, to wake the main thread
+
+    def put(self, command, *args):
+        # Safe to call from any thread
+        self.queue.put((command, args))
+        if self.on_put:
+            self.on_put()
+
+    def has_pending(self):
+        return not self.queue.empty()
+
+    def drain(self):
+        '''
+        Called from the main thread, returns every command queued so far in the order they were put
+        '''
+        commands = []
+        while True:
+            try:
+                commands.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return commands
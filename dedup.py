@@ -0,0 +1,110 @@
+import os
+import mmap
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from background import BackgroundJob
+from metadata import id3v2_size
+
+CHUNK_SIZE = 1 << 20
+
+def audio_range(data):
+    '''
+    Start and end of the audio in an MP3 file's bytes, leaving out the ID3v2 tag at the start and the ID3v1 tag
+    at the end, so files that only differ in their tags hash the same
+    '''
+    start, end = id3v2_size(data), len(data)
+    if end - start >= 128 and data[end - 128:end - 125] == b'TAG':
+        end -= 128
+    return min(start, end), end
+
+def hash_audio(path):
+    '''
+    Hash of the audio payload of a file, read through mmap so large files aren't copied into memory
+    '''
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as audio_file:
+        if os.fstat(audio_file.fileno()).st_size == 0:
+            return digest.hexdigest()
+        with mmap.mmap(audio_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            start, end = audio_range(data)
+            view = memoryview(data)
+            try:
+                for offset in range(start, end, CHUNK_SIZE):
+                    digest.update(view[offset:min(offset + CHUNK_SIZE, end)])
+            finally:
+                view.release()
+    return digest.hexdigest()
+
+def _hash_file(path):
+    # Runs in a pool thread, returning None for a file that can't be read
+    try:
+        stat = os.stat(path)
+        return stat.st_mtime, stat.st_size, hash_audio(path)
+    except (OSError, ValueError):
+        return None
+
+class DuplicateFinder(BackgroundJob):
+    def __init__(self, filepath, metadata, length_tolerance=1, workers=4):
+        '''
+        Finds tracks with the same audio in the background. Only tracks whose length is within length_tolerance
+        seconds of another track's are hashed (every track if it is None), and hashes are kept in the metadata cache,
+        so a second pass only hashes new or changed files. hashlib releases the GIL on large buffers, so threads are enough
+        '''
+        super().__init__()
+        self.filepath = filepath
+        self.metadata = metadata
+        self.length_tolerance = length_tolerance
+        self.workers = workers
+        self.total = 0
+        self.hashed = 0
+        self.candidates = []
+
+    def start(self, files):
+        '''
+        Start a pass over the given files, using lengths already in the metadata cache
+        '''
+        self.candidates = self._candidates(files)
+        stale = [name for name in self.candidates if self.metadata.get_hash(name) is None]
+        self.total = len(stale)
+        self.hashed = 0
+        self._start(stale)
+
+    def _candidates(self, files):
+        # Tracks can only be duplicates if their lengths are close, which is much cheaper to compare than hashes
+        lengths = sorted((self.metadata.entries[name]['length'], name) for name in files if name in self.metadata.entries)
+        if self.length_tolerance is None:
+            return sorted(name for _, name in lengths)
+        candidates = set()
+        for (length, name), (next_length, next_name) in zip(lengths, lengths[1:]):
+            if next_length - length <= self.length_tolerance:
+                candidates.add(name)
+                candidates.add(next_name)
+        return sorted(candidates)
+
+    def _run(self, stale):
+        executor = self._pool(ThreadPoolExecutor(max_workers=self.workers))
+        paths = [os.path.join(self.filepath, name) for name in stale]
+        try:
+            for name, result in zip(stale, executor.map(_hash_file, paths)):
+                if self.cancelled.is_set():
+                    break
+                if result is not None:
+                    self._put((name, *result))
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _apply(self, result):
+        name, mtime, size, audio_hash = result
+        self.metadata.set_hash(name, mtime, size, audio_hash)
+        self.hashed += 1
+
+    def groups(self):
+        '''
+        Lists of candidate files sharing the same audio hash, each sorted by name
+        '''
+        by_hash = {}
+        for name in self.candidates:
+            audio_hash = self.metadata.get_hash(name)
+            if audio_hash is not None:
+                by_hash.setdefault(audio_hash, []).append(name)
+        return [sorted(names) for names in by_hash.values() if len(names) > 1]
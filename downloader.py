@@ -0,0 +1,203 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from yt_dlp import YoutubeDL
+from yt_dlp.postprocessor import get_postprocessor
+
+class DownloadJob:
+    def __init__(self, job_id, url):
+        '''
+        State of a single video download, updated by the worker handling it
+        '''
+        self.id = job_id
+        self.url = url
+        self.status = 'queued'
+        self.filename = ''
+        self.percent = 0.0
+        self.error = None
+
+    def get_name(self):
+        return os.path.basename(self.filename) if self.filename else self.url
+
+class DownloadScheduler:
+    def __init__(self, ydl_opts, post_processors, cancel_flag, on_progress=None, workers=4, transcode_workers=2, archive=None, extract_id=None):
+        '''
+        Fans URLs and playlist entries out across a pool of download workers, each with its own YoutubeDL.
+        FFmpeg post-processing runs in a separate, smaller pool so transcodes never hold up network fetches.
+
+        Workers only record their latest state here. The UI reads it with snapshot() at its own pace,
+        so the cost on the main thread doesn't depend on how many progress updates yt-dlp reports.
+
+        Videos whose ID is already in the download archive are skipped before any network request
+        '''
+        self.ydl_opts = ydl_opts
+        self.post_processors = post_processors
+        self.cancel_flag = cancel_flag
+        self.on_progress = on_progress
+        self.workers = workers
+        self.transcode_workers = transcode_workers
+        self.archive = archive
+        self.extract_id = extract_id
+        self.jobs = []
+        self.errors = []
+        self.latest = None
+        self.version = 0
+        self.done = False
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self, urls):
+        self.jobs = []
+        self.errors = []
+        self.done = False
+        self.thread = threading.Thread(target=self._run, args=(urls,), daemon=True)
+        self.thread.start()
+        return self.thread
+
+    def snapshot(self):
+        # Consistent view of overall progress and the most recently updated job
+        with self.lock:
+            finished = sum(1 for job in self.jobs if job.status == 'finished')
+            skipped = sum(1 for job in self.jobs if job.status == 'skipped')
+            percent = sum(job.percent for job in self.jobs) / max(len(self.jobs), 1)
+            return {
+                'version': self.version,
+                'finished': finished,
+                'skipped': skipped,
+                'total': len(self.jobs),
+                'percent': percent,
+                'latest': self.latest,
+                'done': self.done,
+            }
+
+    def _notify(self, job, d):
+        with self.lock:
+            self.latest = job
+            self.version += 1
+        if self.on_progress:
+            self.on_progress(job, d)
+
+    def _run(self, urls):
+        fetch_pool = ThreadPoolExecutor(max_workers=self.workers)
+        transcode_pool = ThreadPoolExecutor(max_workers=self.transcode_workers)
+        fetches = []
+        self.transcodes = []
+        seen = set()
+        try:
+            for url in urls:
+                url = url.strip()
+                if not url:
+                    continue
+                if self.cancel_flag.is_set():
+                    break
+                for entry_url, video_id in self._expand(url):
+                    with self.lock:
+                        job = DownloadJob(len(self.jobs), entry_url)
+                        self.jobs.append(job)
+                    if video_id and (video_id in seen or (self.archive and self.archive.has(video_id))):
+                        job.status = 'skipped'
+                        job.percent = 100.0
+                        if self.archive and self.archive.get_file(video_id):
+                            job.filename = self.archive.get_file(video_id)
+                        self._notify(job, None)
+                        continue
+                    seen.add(video_id)
+                    fetches.append(fetch_pool.submit(self._fetch, job, transcode_pool))
+            wait(fetches)
+            # Transcodes are only submitted by fetch workers, so the list is complete once every fetch is done
+            wait(self.transcodes)
+        except Exception as e:
+            self.errors.append(e)
+        finally:
+            fetch_pool.shutdown(wait=False, cancel_futures=True)
+            transcode_pool.shutdown(wait=False, cancel_futures=True)
+            with self.lock:
+                self.done = True
+                self.version += 1
+
+    def _expand(self, url):
+        '''
+        Helper function resolving a playlist URL into (URL, video ID) pairs without fetching each video's metadata
+        '''
+        if 'list=' not in url and '/playlist' not in url:
+            return [(url, self.extract_id(url) if self.extract_id else None)]
+        opts = {'extract_flat': 'in_playlist', 'quiet': True}
+        with YoutubeDL(opts) as ydl:
+            info = ydl.extract_info(url, download=False)
+        entries = info.get('entries')
+        if entries is None:
+            return [(url, info.get('id'))]
+        urls = []
+        for entry in entries:
+            if entry:
+                urls.append((entry.get('url') or f'https://www.youtube.com/watch?v={entry["id"]}', entry.get('id')))
+        return urls
+
+    def _fetch_opts(self, job):
+        # Each worker downloads without post-processors, which run in the transcode pool instead
+        opts = dict(self.ydl_opts)
+        opts['postprocessors'] = []
+        opts['progress_hooks'] = [lambda d: self._progress_hook(job, d)]
+        return opts
+
+    def _fetch(self, job, transcode_pool):
+        if self.cancel_flag.is_set():
+            job.status = 'cancelled'
+            return
+        try:
+            job.status = 'downloading'
+            with YoutubeDL(self._fetch_opts(job)) as ydl:
+                info = ydl.extract_info(job.url, download=True)
+                download = (info.get('requested_downloads') or [info])[0]
+                if 'filepath' not in download:
+                    download['filepath'] = ydl.prepare_filename(download)
+            job.status = 'processing'
+            self.transcodes.append(transcode_pool.submit(self._post_process, job, download))
+        except Exception as e:
+            job.status = 'cancelled' if self.cancel_flag.is_set() else 'error'
+            job.error = e
+            if not self.cancel_flag.is_set():
+                self.errors.append(e)
+        self._notify(job, None)
+
+    def _post_process(self, job, info):
+        '''
+        Runs the configured yt-dlp post-processors (e.g. FFmpegExtractAudio), then the extra ones given to the scheduler
+        '''
+        if self.cancel_flag.is_set():
+            job.status = 'cancelled'
+            return
+        try:
+            with YoutubeDL(dict(self.ydl_opts, progress_hooks=[])) as ydl:
+                for pp_def in self.ydl_opts.get('postprocessors', []):
+                    pp_args = {key: val for key, val in pp_def.items() if key not in ('key', 'when')}
+                    pp = get_postprocessor(pp_def['key'])(ydl, **pp_args)
+                    files_to_delete, info = pp.run(info)
+                    for path in files_to_delete:
+                        if os.path.exists(path) and path != info['filepath']:
+                            os.remove(path)
+            for pp in self.post_processors:
+                _, info = pp.run(info)
+            job.filename = info['filepath']
+            job.percent = 100.0
+            job.status = 'finished'
+        except Exception as e:
+            job.status = 'error'
+            job.error = e
+            self.errors.append(e)
+        self._notify(job, None)
+
+    def _progress_hook(self, job, d):
+        '''
+        Records download progress on the job before handing it to the UI callback
+        '''
+        if self.cancel_flag.is_set():
+            raise Exception('Download cancelled by user')
+        job.filename = d.get('filename', job.filename)
+        if d['status'] == 'downloading':
+            total_bytes = d.get('total_bytes') or d.get('total_bytes_estimate')
+            if total_bytes:
+                job.percent = d.get('downloaded_bytes', 0) / total_bytes * 100
+        elif d['status'] == 'finished':
+            job.percent = 100.0
+        self._notify(job, d)
@@ -0,0 +1,1016 @@
+import re
+import os
+import sys
+import time
+import shutil
+import platform
+import random
+import threading
+from collections import deque
+from urllib.parse import urlparse, parse_qs
+from pygame import mixer
+from tracks import Playlist, LazyPlaylist, Track
+from metadata import MetadataCache
+from indexer import LibraryIndexer
+from archive import DownloadArchive, filename_to_id
+from settings_store import SettingsStore
+from library_db import LibraryDB
+from prefetch import Prefetcher
+from player import MusicPlayer, CrossfadePlayer
+from downloader import DownloadScheduler
+from watcher import LibraryWatcher, rename_steps
+from dedup import DuplicateFinder
+from loudness import LoudnessAnalyzer, loudness_gain
+from seek_index import SeekIndexCache
+from waveform import WaveformCache
+from commands import CommandQueue
+from streaming import GrowingFile, download_paths, final_filename
+from instrumentation import instruments
+
+class MusicEngine:
+
+    def __init__(self, base_path=None):
+        '''
+        The library, queue, settings, playback and download logic of Music Box, without any UI.
+        MusicBox is a Tkinter front-end over it, and scripts or benchmarks can drive it directly.
+        Audio is only initialized by start_audio(), so the library can be used on a machine without a sound device
+        '''
+        self.start_time = time.perf_counter()
+
+        # Directory Information
+        self.base_path = base_path
+        self.filepath = None
+        self.settings_path = None
+        self.metadata_path = None
+        self.archive_path = None
+        self.library_path = None
+        self.seek_path = None
+        self.waveform_path = None
+        self.__setup_directory()
+
+        # self.base_path = self.__get_user_data_dir()
+        # self.filepath = os.path.join(self.base_path, 'files')
+        # self.settings_path = os.path.join(self.base_path, 'settings.json')
+        # if not os.path.exists(self.filepath):
+        #     os.makedirs(self.filepath, exist_ok=True)
+
+        # Initialize Attributes
+        self.settings = {}
+        self.store = SettingsStore(self.settings_path)
+        self.library_db = None
+        self.library = self.store # Receives playlist edits, either the settings journal or the SQLite library
+        self.metadata = MetadataCache(self.filepath, self.metadata_path)
+        self.indexer = LibraryIndexer(self.filepath, self.metadata)
+        self.archive = DownloadArchive(self.archive_path)
+        self.prefetcher = Prefetcher(self.filepath, self.metadata)
+        self.prefetch_seconds = 10 # How long before the end of a track the next one is loaded
+        self.watcher = LibraryWatcher(self.filepath)
+        self.dedup = DuplicateFinder(self.filepath, self.metadata)
+        self.loudness = LoudnessAnalyzer(self.filepath, self.metadata)
+        self.seek_indexes = SeekIndexCache(self.seek_path, self.filepath)
+        self.waveforms = WaveformCache(self.waveform_path, self.filepath)
+        self.player = None
+        self.indexing = False # Whether the background indexer is still reading metadata
+        self.commands = CommandQueue() # Library changes from other threads, applied by apply_commands on the main thread
+
+        self.filename = ''
+        self.track_name = ''
+        self.track_pos = 0.0 # Position saved in the settings, only updated on load and save
+        self.track_info = None
+        self.track_length = 0
+        self.tracks = {}
+        self.playlists = {}
+        self.playlist_all = Playlist('All')
+        self.current_playlist = self.playlist_all
+        self.shuffle = False
+        self.shuffle_seed = None # The shuffled order is generated from this, so it is the same after a restart
+        self.history = deque(maxlen=100) # Tracks played before the current one, most recent last
+        self.volume = 0.5
+        self.fade = 1000
+        self.crossfade = True
+        self.normalize = True # Evens out loudness between tracks
+        self.is_playing = False
+        self.pending_track = None # GrowingFile of a download being played before it is in the library
+
+        self.download_workers = 4
+        self.transcode_workers = 2
+        self.play_while_downloading = False # Start playing the first track of a download as soon as its data arrives
+        self.stream_download = False # Whether the next download of this batch is still to be streamed
+        self.download_stream = None # (job id, GrowingFile) of the download being streamed
+        self.stream_lock = threading.Lock() # Guards the two above, which every download worker checks
+        self.scheduler = None
+        self.download_thread = None
+        self.stop_requested = False
+        self.cancel_flag = threading.Event()
+        self.ydl_opts = {
+            'format': 'bestaudio/best',
+            'outtmpl': '%(title).82s_[%(id)s].%(ext)s'.replace(' ', '_'),
+            'restrictfilenames': True,
+            'paths': {
+                'home': self.filepath,
+            },
+            'postprocessors': [{
+                'key': 'FFmpegExtractAudio',
+                'preferredcodec': 'mp3',
+                }],
+        }
+        # Setup Methods
+        self.__load_settings()
+        self.__setup_playlists()
+
+# Setup Functions
+
+    def __setup_directory(self):
+        '''
+        Assign directory paths based on whether program running as python file or executable
+        '''
+        if self.base_path is None:
+            if getattr(sys, 'frozen', False):
+                # Running as PyInstaller EXE
+                self.base_path = os.path.dirname(sys.executable)
+            else:
+                # Running as script
+                self.base_path = os.path.dirname(os.path.abspath(__file__))
+        self.filepath = os.path.join(self.base_path, 'files')
+        self.settings_path = os.path.join(self.base_path, 'settings.json')
+        self.metadata_path = os.path.join(self.base_path, 'metadata.json')
+        self.archive_path = os.path.join(self.base_path, 'archive.txt')
+        self.library_path = os.path.join(self.base_path, 'library.db')
+        self.seek_path = os.path.join(self.base_path, 'seek')
+        self.waveform_path = os.path.join(self.base_path, 'waveforms')
+        if not os.path.exists(self.filepath):
+            os.makedirs(self.filepath)
+
+    def __get_user_data_dir(self, app_name='MusicBox'):
+        '''
+        Supposed to use user directory for different operating systems.
+        Currently causes issues with ffmpeg and ffprobe audio codec
+        '''
+        home = os.path.expanduser('~')
+        system = platform.system()
+        if system == 'Windows':
+            appdata = os.getenv('APPDATA')
+            if appdata:
+                return os.path.join(appdata, app_name)
+            else:
+                return os.path.join(home, 'AppData', 'Roaming', app_name)
+        elif system == 'Darwin':  # macOS
+            return os.path.join(home, 'Library', 'Application Support', app_name)
+        else:  # Linux and others
+            return os.path.join(home, '.config', app_name)
+
+    def __load_settings(self):
+        '''
+        Loads settings from json file, replaying any changes journaled since it was last saved
+        '''
+        start = time.perf_counter()
+        self.settings = self.store.load()
+        load_time = time.perf_counter() - start
+        if self.settings is None:
+            self.store.reset({
+                'current playlist': 'All',
+                'current track': None,
+                'queue position': 0,
+                'track position': 0.0,
+                'shuffle': False,
+                'shuffle seed': None,
+                'volume': 0.5,
+                'fade': 1000,
+                'crossfade': True,
+                'normalize loudness': True,
+                'download workers': 4,
+                'transcode workers': 2,
+                'play while downloading': False,
+                'playlists': {
+                    'Playlist 0': [],
+                    'Playlist 1': [],
+                    'Playlist 2': [],
+                    'Playlist 3': [],
+                    'Playlist 4': [],
+                    'Playlist 5': [],
+                    'Playlist 6': [],
+                    'Playlist 7': [],
+                    'Playlist 8': [],
+                    'Playlist 9': []
+                }
+            })
+            self.settings = self.store.settings
+
+        # Timers are opt-in, and the settings load is recorded once they are on
+        if self.settings.get('instrumentation'):
+            instruments.enable(os.path.join(self.base_path, 'trace.jsonl'), self.settings.get('profile', False))
+            instruments.record('load settings', load_time)
+
+        self.filename = self.settings['current track']
+        self.track_pos = float(self.settings['track position'])
+        self.shuffle = bool(self.settings['shuffle'])
+        self.shuffle_seed = self.settings.get('shuffle seed')
+        self.volume = float(self.settings['volume'])
+        self.fade = int(self.settings['fade'])
+        self.crossfade = bool(self.settings.get('crossfade', True))
+        self.normalize = bool(self.settings.get('normalize loudness', True))
+        self.download_workers = int(self.settings.get('download workers', self.download_workers))
+        self.transcode_workers = int(self.settings.get('transcode workers', self.transcode_workers))
+        self.play_while_downloading = bool(self.settings.get('play while downloading', False))
+        if self.settings.get('library backend') == 'sqlite':
+            self.library_db = LibraryDB(self.library_path)
+            self.library = self.library_db
+
+    @instruments.timed('save settings')
+    def save_settings(self):
+        '''
+        Saves settings to json file. Playlists are already saved as they are edited, so only the
+        playback state is added before the journal is compacted into the file
+        '''
+        # Get current position of track for next boot
+        if self.track_name:
+            self.track_pos = self.get_position()
+        else:
+            self.track_pos = 0.0
+
+        # Saved in playlist order, the shuffled order is generated again from the seed
+        queue_pos = self.current_playlist.get_unshuffled_position()
+        self.store.update({
+            'current playlist': self.current_playlist.get_name(),
+            'current track': self.filename,
+            'queue position': queue_pos,
+            'track position': self.track_pos,
+            'shuffle': self.shuffle,
+            'shuffle seed': self.shuffle_seed,
+            'volume': round(self.volume, 2),
+            'fade': self.fade,
+            'crossfade': self.crossfade,
+            'normalize loudness': self.normalize,
+            'download workers': self.download_workers,
+            'transcode workers': self.transcode_workers,
+            'play while downloading': self.play_while_downloading,
+        })
+        self.store.compact()
+
+    def __setup_playlists(self):
+        '''
+        Create "All" playlist and load saved playlists from settings
+        '''
+        # Create Track objects, and add all tracks to "All" playlist
+        entries = self.indexer.scan()
+        files = [track for track, _, _ in entries]
+        for track in files:
+            self.playlist_all.add_track(self.clean_filename(track), track)
+            self.tracks[track] = Track()
+        # Forget metadata of files removed since last run, and extract it for new or changed files in the background
+        self.metadata.prune(files)
+        self.archive.sync(files)
+        self.indexing = self.indexer.start(entries)
+        # Later changes to the folder arrive from the watcher instead of another full listing
+        self.watcher.start(entries)
+        if self.filename and self.filename in self.tracks:
+            self.track_name = self.clean_filename(self.filename)
+
+        if self.library_db:
+            self.__setup_library_db(files)
+        else:
+            # Create Playlist objects and add their tracks, and add playlists to Track objects
+            missing = set()
+            for playlist, tracks in self.settings['playlists'].items():
+                self.playlists[playlist] = Playlist(playlist)
+                for track in tracks:
+                    if track in self.tracks:
+                        self.playlists[playlist].add_track(self.clean_filename(track), track)
+                        self.tracks[track].add_to_playlist(playlist)
+                    else:
+                        missing.add(track)
+            # Files deleted outside the program are dropped from saved playlists
+            for track in missing:
+                self.store.delete_track(track)
+
+        cur_playlist = self.settings['current playlist']
+        if cur_playlist in self.playlists:
+            self.current_playlist = self.playlists[cur_playlist]
+            self.current_playlist.set_queue_pos(self.settings['queue position'])
+            if self.shuffle:
+                if self.shuffle_seed is None:
+                    self.shuffle_seed = random.getrandbits(32)
+                self.current_playlist.shuffle_queue(self.shuffle_seed)
+
+    def __setup_library_db(self, files):
+        '''
+        Load playlists from the SQLite library, importing them from settings the first time it is used.
+        Playlists only read their tracks when first opened
+        '''
+        self.library_db.sync_tracks(files)
+        if self.library_db.get_value('imported settings') is None:
+            self.library_db.import_playlists(self.settings['playlists'])
+            self.library_db.set_value('imported settings', '1')
+        for playlist in self.library_db.get_playlist_names():
+            self.playlists[playlist] = LazyPlaylist(playlist, self._load_playlist)
+
+    def start_audio(self):
+        '''
+        Initializes the pygame mixer and the player for the current settings
+        '''
+        mixer.init()
+        # Overlapping crossfades need ffmpeg to decode tracks, which downloading already relies on
+        if self.crossfade and CrossfadePlayer.is_available():
+            self.player = CrossfadePlayer()
+        else:
+            self.player = MusicPlayer()
+        self.player.set_volume(self.volume)
+        # Loudness is cached alongside the metadata, so it waits for indexing if that is still running
+        if not self.indexing:
+            self.analyze_loudness(list(self.tracks))
+
+    def poll_indexer(self):
+        '''
+        Merges batches of metadata from the background indexer into the cache as they finish.
+        Returns whether indexing is done
+        '''
+        if not self.indexing:
+            return True
+        batches = self.indexer.drain()
+        done = not self.indexer.is_active()
+        if done:
+            self.indexing = False
+            self.analyze_loudness(list(self.tracks))
+        # Newly read tags become searchable in playlists that have already been searched
+        for batch in batches:
+            for track, _, _, info in batch:
+                if info['tags']:
+                    for playlist in [self.playlist_all] + list(self.playlists.values()):
+                        if playlist.search_index is not None:
+                            playlist.reindex_file(track)
+        return done
+
+    def analyze_loudness(self, files):
+        '''
+        Queues tracks for loudness analysis in the background, if normalization is on and ffmpeg is available.
+        Nothing is analyzed until start_audio, so using the library without playback never starts ffmpeg
+        '''
+        if self.player is not None and self.normalize and shutil.which('ffmpeg'):
+            self.loudness.add(files)
+
+    def poll_loudness(self):
+        '''
+        Stores the loudness measurements finished so far. Returns whether analysis is done
+        '''
+        self.loudness.drain()
+        return not self.loudness.is_active()
+
+    def poll_watcher(self):
+        '''
+        Applies the next batch of changes made to the library folder outside the program.
+        Returns whether the library changed
+        '''
+        batch = self.watcher.drain()
+        if not batch:
+            return False
+        with instruments.timer('library sync'):
+            return self.sync_library(batch)
+
+    def is_busy(self):
+        '''
+        Whether background work is running or has left results for the main thread to pick up with the poll methods
+        '''
+        return (self.indexing or self.dedup.is_active() or self.loudness.is_active() or self.is_downloading()
+                or self.watcher.has_pending() or self.commands.has_pending())
+
+    def set_wakeup(self, callback):
+        '''
+        callback is called from other threads when they leave work for the main thread while it isn't busy,
+        e.g. a file appearing in the library folder
+        '''
+        self.watcher.on_change = callback
+        self.commands.on_put = callback
+
+    def close(self):
+        '''
+        Saves settings and caches, and releases the player and library
+        '''
+        self.save_settings()
+        self.watcher.stop()
+        self.indexer.cancel()
+        self.dedup.cancel()
+        self.loudness.cancel()
+        self.waveforms.close()
+        self.seek_indexes.close()
+        self.metadata.save()
+        if self.player:
+            self.player.close()
+        if self.library_db:
+            self.library_db.close()
+        self.remove_partial_files()
+        instruments.close(os.path.join(self.base_path, 'profile.prof'))
+
+
+# Downloads
+
+    def _extract_youtube_id(self, url):
+        '''
+        Helper function to extract YouTube video ID from different formats.
+
+        Supports:
+        - https://www.youtube.com/watch?v=VIDEO_ID
+        - https://youtu.be/VIDEO_ID
+        - https://youtube.com/watch?v=VIDEO_ID
+        - https://m.youtube.com/watch?v=VIDEO_ID
+        - URLs with additional parameters
+        - Embedded URLs
+        '''
+        if not url or not isinstance(url, str):
+            return None
+
+        # Remove whitespace
+        url = url.strip()
+
+        # Pattern for youtu.be short URLs
+        youtu_be_pattern = r'(?:youtu\.be/)([a-zA-Z0-9_-]{11})'
+        match = re.search(youtu_be_pattern, url)
+        if match:
+            return match.group(1)
+
+        # Pattern for youtube.com URLs with v parameter
+        youtube_pattern = r'(?:youtube\.com.*[?&]v=)([a-zA-Z0-9_-]{11})'
+        match = re.search(youtube_pattern, url)
+        if match:
+            return match.group(1)
+
+        # Pattern for embedded URLs
+        embed_pattern = r'(?:youtube\.com/embed/)([a-zA-Z0-9_-]{11})'
+        match = re.search(embed_pattern, url)
+        if match:
+            return match.group(1)
+
+        # Fallback: try parsing as URL and extract v parameter
+        try:
+            parsed = urlparse(url)
+            if 'youtube.com' in parsed.netloc or 'youtu.be' in parsed.netloc:
+                query_params = parse_qs(parsed.query)
+                if 'v' in query_params:
+                    video_id = query_params['v'][0]
+                    # Validate video ID format (11 characters, alphanumeric + _ -)
+                    if re.match(r'^[a-zA-Z0-9_-]{11}$', video_id):
+                        return video_id
+        except:
+            pass
+
+        return None
+
+    @instruments.timed('download progress hook')
+    def _yt_progress_hook(self, job, d):
+        '''
+        Called from download workers for every progress update. Only flags work for the main thread,
+        which handles it in stop_for_download
+        '''
+        if d and d['status'] == 'downloading':
+            # Stop the current track if it is the one being downloaded again, unless it is this download playing as it arrives
+            if self.filename and d.get('info_dict', {}).get('id') == filename_to_id(self.filename) and self.pending_track is None:
+                self.stop_requested = True
+            if self.stream_download:
+                self._stream_download(job, d)
+        with self.stream_lock:
+            if self.download_stream is None or self.download_stream[0] != job.id:
+                return
+            growing = self.download_stream[1]
+        if d and d['status'] == 'finished':
+            growing.finish()
+        elif d is None and job.status in ('error', 'cancelled'):
+            growing.fail()
+
+    def _stream_download(self, job, d):
+        '''
+        Hands the first download of a batch to the main thread to be played while it arrives. Only videos
+        with a known duration are streamed, as the end of the track is timed from it
+        '''
+        duration = d.get('info_dict', {}).get('duration')
+        paths = download_paths(d)
+        if not duration or not paths:
+            return
+        with self.stream_lock:
+            if not self.stream_download:
+                return
+            self.stream_download = False
+            growing = GrowingFile(paths, final_filename(paths[-1]), duration)
+            self.download_stream = (job.id, growing)
+        self.commands.put('pending', growing)
+
+    def start_download(self, urls, post_processors):
+        '''
+        Begin download of a list of URLs on worker threads, returning the scheduler to follow progress with.
+        The post-processors run once each file is ready
+        '''
+        self.cancel_flag.clear()
+        # Streaming needs ffmpeg to decode the download, which only the crossfading player uses
+        with self.stream_lock:
+            self.stream_download = self.play_while_downloading and self.player is not None and self.player.crossfades
+            self.download_stream = None
+        self.scheduler = DownloadScheduler(self.ydl_opts, post_processors, self.cancel_flag,
+                                           self._yt_progress_hook, workers=self.download_workers, transcode_workers=self.transcode_workers,
+                                           archive=self.archive, extract_id=self._extract_youtube_id)
+        self.download_thread = self.scheduler.start(urls)
+        return self.scheduler
+
+    def is_downloading(self):
+        return self.download_thread is not None and self.download_thread.is_alive()
+
+    def stop_for_download(self):
+        '''
+        Unloads the current track if a download asked for its file to be replaced
+        '''
+        if not self.stop_requested:
+            return
+        self.stop_requested = False
+        if self.player.get_busy():
+            self.player.stop()
+            self.player.unload()
+
+    def cancel_download(self):
+        '''
+        Cancel the current download and remove any .part files
+        '''
+        self.cancel_flag.set()
+        with self.stream_lock:
+            if self.download_stream is not None:
+                self.download_stream[1].fail()
+        # If download thread is running, wait for it to finish
+        if self.is_downloading():
+            self.download_thread.join(timeout=2)  # Wait up to 2 seconds for thread to finish
+        self.remove_partial_files()
+
+    def remove_partial_files(self):
+        for fname in os.listdir(self.filepath):
+            if fname.endswith('.part'):
+                try:
+                    os.remove(os.path.join(self.filepath, fname))
+                except Exception as e:
+                    print(f'Error removing {fname}: {e}')
+
+    def queue_downloaded_track(self, filename):
+        '''
+        Called from the transcode workers once a file is ready. The library is only changed on the main
+        thread, which adds the file with the next batch in apply_commands
+        '''
+        self.commands.put('add', filename)
+
+    def apply_commands(self):
+        '''
+        Applies the library changes queued by other threads since the last call, all additions as one update.
+        Returns the files added to the library, and whether the current track changed
+        '''
+        added = []
+        changed = False
+        for command, args in self.commands.drain():
+            if command == 'add':
+                added.append(args[0])
+            elif command == 'pending':
+                self.play_pending(args[0])
+                changed = True
+        if added:
+            with instruments.timer('library commands'):
+                added = self.add_tracks(added)
+        # The watcher can add a finished download before its command arrives
+        if self.pending_track is not None and self.pending_track.filename in self.tracks:
+            changed = self._finish_pending() or changed
+        return added, changed
+
+    def add_tracks(self, files):
+        '''
+        Adds new files to the library, skipping any it already has (e.g. the watcher saw them first).
+        Returns the files that were new
+        '''
+        new = [filename for filename in dict.fromkeys(files) if filename not in self.tracks]
+        self.playlist_all.add_tracks([(self.clean_filename(filename), filename) for filename in new])
+        for filename in new:
+            self.tracks[filename] = Track()
+            self.archive.add(filename)
+        self.analyze_loudness(new)
+        return new
+
+
+# Playback
+
+    @instruments.timed('play_track')
+    def play_track(self, name, set_queue_pos=False, crossfade=False, remember=True):
+        '''
+        Finds the corresponding file in the current playlist and starts playing it.
+        With crossfade, the previous track fades out as this one fades in.
+        With remember, the previous track is added to the history that going back follows
+        '''
+        filename = self.current_playlist.get_track(name)
+        if remember and self.filename and self.filename != filename:
+            self.history.append(self.filename)
+        self.pending_track = None
+        self.track_name = name
+        self.filename = filename
+        if set_queue_pos:
+            self.current_playlist.set_queue_pos(self.current_playlist.get_queue().index(self.track_name))
+        # The next track is usually already in memory, read in the background near the end of the last one
+        prefetched = self.prefetcher.take(self.filename)
+        if prefetched:
+            self.track_info, source = prefetched
+        else:
+            with instruments.timer('metadata'):
+                self.track_info = self.metadata.get(self.filename)
+            source = os.path.join(self.filepath, self.filename)
+        instruments.count('prefetch hits' if prefetched else 'prefetch misses')
+        self.track_length = int(self.track_info['length'])
+        self.is_playing = False
+        self.player.set_gain(self.track_gain(self.filename))
+        with instruments.timer('player load'):
+            if crossfade:
+                self.player.crossfade(source, self.fade)
+            else:
+                self.player.stop()
+                self.player.unload()
+                self.player.load(source)
+                self.player.play(fade_ms=self.fade)
+        self._load_seek_index(self.filename, source)
+        self.is_playing = True
+
+    def play_pending(self, pending):
+        '''
+        Starts playing a download from the data written so far, crossfading from the current track.
+        It is swapped for the library file at the same position once that has been added
+        '''
+        if self.filename and self.filename != pending.filename:
+            self.history.append(self.filename)
+        self.pending_track = pending
+        self.track_name = self.clean_filename(pending.filename)
+        self.filename = pending.filename
+        self.track_info = {'length': pending.duration}
+        self.track_length = int(pending.duration)
+        self.is_playing = False
+        # Not measured yet, so played as it is
+        self.player.set_gain(1.0)
+        self.player.crossfade(pending, self.fade)
+        self.is_playing = True
+
+    def _finish_pending(self):
+        '''
+        Moves the download being played over to its library file, if it is still the current track.
+        Returns whether it was
+        '''
+        pending, self.pending_track = self.pending_track, None
+        if self.filename != pending.filename:
+            pending.close()
+            return False
+        if self.current_playlist.has_track(self.track_name):
+            self.current_playlist.set_queue_pos(self.current_playlist.get_queue().index(self.track_name))
+        self.track_info = self.metadata.get(self.filename)
+        self.track_length = int(self.track_info['length'])
+        source = os.path.join(self.filepath, self.filename)
+        self.player.swap(source)
+        pending.close()
+        self._load_seek_index(self.filename, source)
+        return True
+
+    @instruments.timed('transition')
+    def next_track(self, dir):
+        '''
+        Moves through the queue of the current playlist, crossfading into the track there.
+        Going back returns to the tracks that actually played, as long as they are in the playlist
+        '''
+        playlist = self.current_playlist
+        if dir < 0:
+            while self.history:
+                filename = self.history.pop()
+                name = self.clean_filename(filename)
+                if playlist.has_track(name) and playlist.get_track(name) == filename:
+                    playlist.set_queue_pos(playlist.get_queue().index(name))
+                    self.play_track(name, crossfade=True, remember=False)
+                    return name
+        track = playlist.increment_queue(dir)
+        self.play_track(track, crossfade=True, remember=dir > 0)
+        return track
+
+    def play_pause(self):
+        '''
+        Pauses the current track if it is playing, or resumes it. Returns whether it is now playing
+        '''
+        if self.player.get_busy():
+            self.player.pause()
+            self.is_playing = False
+        else:
+            self.player.unpause()
+            self.is_playing = True
+        return self.is_playing
+
+    def stop(self):
+        '''
+        Stops and unloads the current track, leaving nothing selected
+        '''
+        self.is_playing = False
+        self.pending_track = None
+        self.player.stop()
+        self.player.unload()
+        self.track_name = ''
+        self.filename = ''
+
+    def rewind(self):
+        self.player.rewind()
+
+    def seek(self, pos):
+        self.player.seek(pos)
+
+    def _load_seek_index(self, filename, source):
+        '''
+        Gives the player the track's seek index, building it in the background the first time the track is played
+        '''
+        index = self.seek_indexes.load(filename)
+        if index is not None:
+            self.player.set_seek_index(source, index)
+        else:
+            self.seek_indexes.request(filename, lambda index: self.player.set_seek_index(source, index))
+
+    def get_position(self):
+        '''
+        Seconds into the current track, as counted by the player from the audio it has played
+        '''
+        if not self.track_name:
+            return 0.0
+        # A track restored from the settings keeps its saved position until it is loaded
+        if self.player is None or self.track_info is None:
+            return self.track_pos
+        return min(self.player.get_pos(), self.track_length)
+
+    def set_volume(self, volume):
+        self.volume = volume
+        self.player.set_volume(volume)
+
+    def track_gain(self, filename):
+        '''
+        Volume multiplier evening out a track's loudness with the rest of the library, 1 until it has been measured
+        '''
+        lufs = self.metadata.get_loudness(filename)
+        if not self.normalize or lufs is None:
+            return 1.0
+        return loudness_gain(lufs)
+
+    def time_to_transition(self):
+        '''
+        Seconds until the next track should start: the end of this one, or the start of the crossfade
+        '''
+        remaining = self.track_info['length'] - self.get_position()
+        if self.player.crossfades:
+            remaining -= self.fade / 1000
+        return remaining
+
+    def track_ended(self):
+        '''
+        Whether it is time to move on to the next track, confirmed by the player where it can tell
+        '''
+        if self.player.crossfades:
+            # With overlapping crossfades the next track has to start while this one is still playing
+            return self.time_to_transition() <= 0.05 or self.player.has_ended()
+        return self.player.has_ended()
+
+    def prefetch_next(self):
+        '''
+        Loads the next track in the queue in the background, without moving to it
+        '''
+        name = self.current_playlist.peek_queue(1)
+        if name:
+            filename = self.current_playlist.get_track(name)
+            self.prefetcher.prefetch(filename)
+            self.get_waveform(filename)
+
+    def get_waveform(self, filename):
+        '''
+        The waveform peaks of a track, or None while they are being built in the background
+        '''
+        peaks = self.waveforms.load(filename)
+        if peaks is None and shutil.which('ffmpeg'):
+            self.waveforms.request(filename)
+        return peaks
+
+    def set_shuffle(self, shuffle):
+        '''
+        (Un)shuffle the current queue, preserving the current track. Shuffling picks a new seed
+        '''
+        self.shuffle = shuffle
+        if shuffle:
+            self.shuffle_seed = random.getrandbits(32)
+            self.current_playlist.shuffle_queue(self.shuffle_seed)
+        else:
+            self.current_playlist.unshuffle_queue()
+
+
+# Playlists
+
+    def set_current_playlist(self, name):
+        if name == 'All':
+            self.current_playlist = self.playlist_all
+        else:
+            self.current_playlist = self.playlists[name]
+        return self.current_playlist
+
+    def search(self, query):
+        '''
+        Tracks of the current playlist matching the query, best first
+        '''
+        return self.current_playlist.search(query, self._search_text)
+
+    def add_to_playlist(self, playlist_name, filename):
+        playlist = self.playlists[playlist_name]
+        playlist.add_track(self.clean_filename(filename), filename)
+        self.tracks[filename].add_to_playlist(playlist_name)
+        self.library.add_track(playlist_name, filename)
+
+    def remove_from_playlist(self, playlist_name, filename):
+        '''
+        Removes a track from a playlist, returning where it was in the queue
+        '''
+        playlist = self.playlists[playlist_name]
+        name = self.clean_filename(filename)
+        index = playlist.get_queue().index(name)
+        playlist.remove_track(name)
+        self.tracks[filename].remove_from_playlist(playlist_name)
+        self.library.remove_track(playlist_name, filename)
+        return index
+
+    def rename_playlist(self, oldname, newname):
+        '''
+        Renames a playlist, raising ValueError if the name can't be used
+        '''
+        if oldname == 'All':
+            raise ValueError('"All" playlist name cannot be changed.')
+        if newname in self.playlists.keys() or newname == 'All':
+            raise ValueError('Playlist name already in use.')
+        self.playlists[oldname].set_name(newname)
+        self.library.rename_playlist(oldname, newname)
+        self.playlists = {name if name != oldname else newname: playlist for name, playlist in self.playlists.items()}
+        if self.current_playlist.get_name() == newname:
+            self.current_playlist = self.playlists[newname]
+        for track in self.playlists[newname].get_tracks():
+            self.tracks[track].remove_from_playlist(oldname)
+            self.tracks[track].add_to_playlist(newname)
+
+    def delete_track(self, name):
+        '''
+        Deletes a track's file and removes it from every playlist, stopping it first if it is playing
+        '''
+        filename = self.playlist_all.get_track(name)
+        self._forget_track(filename)
+        os.remove(os.path.join(self.filepath, filename))
+
+    def sync_library(self, batch):
+        '''
+        Applies a batch of files added, removed or renamed in the library folder, keeping renamed tracks
+        in their playlists. Returns whether anything changed
+        '''
+        removed, renamed, added = set(batch.removed), dict(batch.renamed), set(batch.added)
+        if batch.rescan:
+            # The watcher lost events, so compare the whole folder with the library
+            files = {track for track, _, _ in self.indexer.scan()}
+            removed = set(self.tracks) - files
+            added = files - set(self.tracks)
+            renamed = {}
+        forget = [filename for filename in removed if filename in self.tracks]
+        renames = {}
+        # Renames are applied together, so a track can move onto a name another one is moving away from
+        moving = {old for old in renamed if old in self.tracks}
+        for old, new in renamed.items():
+            if old not in self.tracks:
+                added.add(new)
+            elif new in self.tracks and new not in moving:
+                # Moved over a track already in the library, which is the one kept
+                forget.append(old)
+            else:
+                renames[old] = new
+        self._forget_tracks(forget)
+        if renames:
+            self._rename_tracks(renames)
+        new = self.add_tracks(added)
+        return bool(forget or renames or new)
+
+    def _forget_track(self, filename):
+        self._forget_tracks([filename])
+
+    def _forget_tracks(self, filenames):
+        '''
+        Removes tracks from every playlist and cache, stopping the current one first if it is among them
+        '''
+        for filename in filenames:
+            if self.filename == filename:
+                self.stop()
+            # Removed by file, as a duplicate can share its name with the copy that is kept
+            if self.playlist_all.has_file(filename):
+                self.playlist_all.remove_file(filename)
+            playlists = self.get_track_playlists(filename)
+            for p_name in playlists:
+                playlist = self.playlists[p_name]
+                if playlist.has_file(filename):
+                    playlist.remove_file(filename)
+            del self.tracks[filename]
+            self.library.delete_track(filename)
+            self.metadata.remove(filename)
+            self.seek_indexes.remove(filename)
+            self.waveforms.remove(filename)
+        if filenames:
+            self.archive.remove_files(filenames)
+
+    def _rename_tracks(self, renames):
+        '''
+        Moves tracks to their new filenames in place, so their queue and playlist positions are kept
+        '''
+        # Renamed by file, as a track can share its name with another file that isn't renamed
+        by_playlist = {}
+        for old, new in renames.items():
+            for p_name in self.get_track_playlists(old):
+                if self.playlists[p_name].has_file(old):
+                    by_playlist.setdefault(p_name, {})[old] = (self.clean_filename(new), new)
+        self.playlist_all.rename_files({old: (self.clean_filename(new), new) for old, new in renames.items() if self.playlist_all.has_file(old)})
+        for p_name, playlist_renames in by_playlist.items():
+            self.playlists[p_name].rename_files(playlist_renames)
+        # The rest only rename one file at a time, so they are ordered to never overwrite a file that is moving too
+        for old, new in rename_steps(renames):
+            self.tracks[new] = self.tracks.pop(old)
+            self.library.rename_track(old, new)
+            self.metadata.rename(old, new)
+            self.seek_indexes.rename(old, new)
+            self.waveforms.rename(old, new)
+        self.archive.remove_files(list(renames))
+        for new in renames.values():
+            self.archive.add(new)
+        if self.filename in renames:
+            self.filename = renames[self.filename]
+            self.track_name = self.clean_filename(self.filename)
+
+    def find_duplicates(self):
+        '''
+        Starts hashing tracks in the background to find ones with the same audio, see poll_duplicates
+        '''
+        self.dedup.start(list(self.tracks))
+
+    def poll_duplicates(self):
+        '''
+        Stores the hashes finished so far. Returns the groups of duplicate files once the pass is done, otherwise None
+        '''
+        self.dedup.drain()
+        if self.dedup.is_active():
+            return None
+        # Files removed while hashing are left out
+        return [group for group in ([file for file in group if file in self.tracks] for group in self.dedup.groups()) if len(group) > 1]
+
+    def merge_duplicates(self, files):
+        '''
+        Keeps the copy of a track that is in the most playlists and deletes the others, putting the kept copy
+        in their place in any playlist it wasn't already in. Returns the kept file
+        '''
+        keep = max(files, key=lambda file: len(self.get_track_playlists(file)))
+        keep_name = self.clean_filename(keep)
+        for file in files:
+            if file == keep:
+                continue
+            for p_name in self.get_track_playlists(file):
+                playlist = self.playlists[p_name]
+                if not playlist.has_file(file):
+                    continue
+                if playlist.has_file(keep):
+                    playlist.remove_file(file)
+                else:
+                    # By file, as the merged file can share its name with a listed file that isn't merged
+                    playlist.rename_files({file: (keep_name, keep)})
+                    self.tracks[keep].add_to_playlist(p_name)
+                self.tracks[file].remove_from_playlist(p_name)
+            self.library.merge_track(file, keep)
+            self._forget_track(file)
+            os.remove(os.path.join(self.filepath, file))
+        return keep
+
+
+# Helper Functions
+
+    def _search_text(self, name, file):
+        '''
+        Helper function for the text a track is searchable by: its name, plus any tags already cached
+        '''
+        entry = self.metadata.entries.get(file)
+        if entry and entry['tags']:
+            return name + ' ' + ' '.join(entry['tags'].values())
+        return name
+
+    def _load_playlist(self, playlist):
+        '''
+        Helper function reading a playlist's tracks from the SQLite library when it is first opened
+        '''
+        return [(self.clean_filename(track), track) for track in self.library_db.get_playlist_tracks(playlist.get_name()) if track in self.tracks]
+
+    def get_track_playlists(self, filename):
+        '''
+        The names of playlists containing a track, answered by the library index when using SQLite
+        '''
+        if self.library_db:
+            return self.library_db.playlists_containing(filename)
+        # A download still playing before it is added to the library isn't in any
+        track = self.tracks.get(filename)
+        return track.get_playlists() if track else []
+
+    def clean_filename(self, file):
+        '''
+        Helper function for taking raw filename with ID and extension, and trimming to only name (based on yt_dlp default filename).
+        Files copied into the folder by hand may not have an ID, and are named after the file instead
+        '''
+        index = file.find('[')
+        if index < 1:
+            return os.path.splitext(file)[0].replace('_', ' ')
+        name = file[:index-1].replace('_', ' ')
+        return name
@@ -0,0 +1,72 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from background import BackgroundJob
+from metadata import read_metadata
+
+def _index_file(path):
+    # Runs in a worker process, returning None for a file that can't be read
+    try:
+        return read_metadata(path)
+    except Exception:
+        return None
+
+class LibraryIndexer(BackgroundJob):
+    def __init__(self, filepath, metadata, batch_size=256, workers=None):
+        '''
+        Scans the library folder and extracts metadata for new or changed files across a process pool,
+        handing results back in batches so the UI can stay responsive while a large library is indexed
+        '''
+        super().__init__()
+        self.filepath = filepath
+        self.metadata = metadata
+        self.batch_size = batch_size
+        self.workers = workers
+        self.total = 0
+        self.indexed = 0
+
+    def scan(self):
+        # os.scandir returns size and mtime alongside the name, avoiding a stat call per file on Windows
+        entries = []
+        with os.scandir(self.filepath) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith('.mp3'):
+                    stat = entry.stat()
+                    entries.append((entry.name, stat.st_mtime, stat.st_size))
+        entries.sort()
+        return entries
+
+    def start(self, entries):
+        # Only files missing from the cache, or changed since they were cached, go to the process pool
+        stale = [(name, mtime, size) for name, mtime, size in entries if not self.metadata.is_fresh(name, mtime, size)]
+        self.total = len(stale)
+        self.indexed = 0
+        if not stale:
+            return False
+        self._start(stale)
+        return True
+
+    def _run(self, stale):
+        paths = [os.path.join(self.filepath, name) for name, _, _ in stale]
+        batch = []
+        # ProcessPoolExecutor is limited to 61 workers on Windows
+        workers = self.workers or min(61, os.cpu_count() or 1)
+        executor = self._pool(ProcessPoolExecutor(max_workers=workers))
+        try:
+            chunksize = max(1, min(64, len(paths) // (4 * workers)))
+            for (name, mtime, size), info in zip(stale, executor.map(_index_file, paths, chunksize=chunksize)):
+                if self.cancelled.is_set():
+                    break
+                if info is not None:
+                    batch.append((name, mtime, size, info))
+                if len(batch) >= self.batch_size:
+                    self._put(batch)
+                    batch = []
+        finally:
+            if batch:
+                self._put(batch)
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _apply(self, batch):
+        for name, mtime, size, info in batch:
+            self.metadata.put(name, mtime, size, info)
+        self.indexed += len(batch)
@@ -0,0 +1,115 @@
+import json
+import time
+import cProfile
+import threading
+from functools import wraps
+from contextlib import contextmanager
+
+class Instrumentation:
+    def __init__(self):
+        '''
+        Opt-in timers and counters around the hot paths, with an optional JSONL trace and cProfile capture.
+        While disabled, a timed call costs one attribute check
+        '''
+        self.enabled = False
+        self.timers = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.trace_file = None
+        self.profiler = None
+
+    def enable(self, trace_path=None, profile=False):
+        self.enabled = True
+        if trace_path and self.trace_file is None:
+            self.trace_file = open(trace_path, 'a', encoding='utf-8')
+        if profile and self.profiler is None:
+            # cProfile only follows the thread that enabled it, which is the main thread here
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def record(self, name, seconds):
+        ms = 1000 * seconds
+        with self.lock:
+            stats = self.timers.get(name)
+            if stats is None:
+                stats = self.timers[name] = {'count': 0, 'total': 0.0, 'max': 0.0, 'last': 0.0}
+            stats['count'] += 1
+            stats['total'] += ms
+            stats['max'] = max(stats['max'], ms)
+            stats['last'] = ms
+            if self.trace_file:
+                self.trace_file.write(json.dumps({'time': time.time(), 'name': name, 'ms': round(ms, 3),
+                                                  'thread': threading.current_thread().name}) + '\n')
+
+    def count(self, name, amount=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    @contextmanager
+    def timer(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def timed(self, name):
+        '''
+        Decorator timing every call of a function under the given name
+        '''
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.record(name, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        # Copies of the timers, slowest total first, and the counters
+        with self.lock:
+            timers = sorted(((name, dict(stats)) for name, stats in self.timers.items()), key=lambda item: -item[1]['total'])
+            return timers, dict(self.counters)
+
+    def reset(self):
+        with self.lock:
+            self.timers = {}
+            self.counters = {}
+
+    def flush(self):
+        with self.lock:
+            if self.trace_file:
+                self.trace_file.flush()
+
+    def dump_profile(self, path):
+        # Saves the profile so far for pstats or snakeviz, and keeps profiling
+        if self.profiler is None:
+            return None
+        self.profiler.disable()
+        self.profiler.dump_stats(path)
+        self.profiler.enable()
+        return path
+
+    def close(self, profile_path=None):
+        if self.profiler and profile_path:
+            self.profiler.disable()
+            self.profiler.dump_stats(profile_path)
+        self.profiler = None
+        with self.lock:
+            if self.trace_file:
+                self.trace_file.close()
+                self.trace_file = None
+        self.enabled = False
+
+# Shared by every module, so one switch turns all of the timers on
+instruments = Instrumentation()
@@ -0,0 +1,129 @@
+import sqlite3
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS tracks (
+    id INTEGER PRIMARY KEY,
+    filename TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS playlists (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    position INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS playlist_entries (
+    playlist_id INTEGER NOT NULL REFERENCES playlists(id) ON DELETE CASCADE,
+    track_id INTEGER NOT NULL REFERENCES tracks(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (playlist_id, track_id)
+);
+CREATE INDEX IF NOT EXISTS idx_entries_order ON playlist_entries(playlist_id, position);
+CREATE INDEX IF NOT EXISTS idx_entries_track ON playlist_entries(track_id);
+CREATE TABLE IF NOT EXISTS metadata (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+'''
+
+class LibraryDB:
+    def __init__(self, db_path):
+        '''
+        Optional SQLite backend for tracks, playlists and their ordered entries.
+        Playlists are read on demand, so startup doesn't depend on how many tracks they hold,
+        and membership questions like "which playlists contain this track" are answered by an index
+        '''
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute('PRAGMA foreign_keys = ON')
+        self.conn.execute('PRAGMA journal_mode = WAL')
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def get_value(self, key, default=None):
+        row = self.conn.execute('SELECT value FROM metadata WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_value(self, key, value):
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)', (key, value))
+
+    def sync_tracks(self, files):
+        # Bring the tracks table in line with the library folder, touching only added and removed files
+        files = set(files)
+        known = {row[0] for row in self.conn.execute('SELECT filename FROM tracks')}
+        with self.conn:
+            self.conn.executemany('INSERT INTO tracks (filename) VALUES (?)', ((f,) for f in files - known))
+            self.conn.executemany('DELETE FROM tracks WHERE filename = ?', ((f,) for f in known - files))
+
+    def import_playlists(self, playlists):
+        # One-time migration of the playlists saved in settings.json, keeping only tracks that are still on disk
+        with self.conn:
+            for position, (name, tracks) in enumerate(playlists.items()):
+                self.conn.execute('INSERT OR IGNORE INTO playlists (name, position) VALUES (?, ?)', (name, position))
+                for track in tracks:
+                    if self.conn.execute('SELECT 1 FROM tracks WHERE filename = ?', (track,)).fetchone():
+                        self._insert_entry(name, track)
+
+    def get_playlist_names(self):
+        return [row[0] for row in self.conn.execute('SELECT name FROM playlists ORDER BY position')]
+
+    def get_playlist_tracks(self, name):
+        rows = self.conn.execute('''
+            SELECT tracks.filename FROM playlist_entries
+            JOIN playlists ON playlists.id = playlist_entries.playlist_id
+            JOIN tracks ON tracks.id = playlist_entries.track_id
+            WHERE playlists.name = ? ORDER BY playlist_entries.position''', (name,))
+        return [row[0] for row in rows]
+
+    def playlists_containing(self, track):
+        rows = self.conn.execute('''
+            SELECT playlists.name FROM playlist_entries
+            JOIN playlists ON playlists.id = playlist_entries.playlist_id
+            JOIN tracks ON tracks.id = playlist_entries.track_id
+            WHERE tracks.filename = ?''', (track,))
+        return {row[0] for row in rows}
+
+    def _insert_entry(self, playlist, track):
+        # Appends at the end of the playlist, adding the track itself if it was downloaded since the last sync
+        self.conn.execute('INSERT OR IGNORE INTO tracks (filename) VALUES (?)', (track,))
+        self.conn.execute('''
+            INSERT OR IGNORE INTO playlist_entries (playlist_id, track_id, position)
+            SELECT playlists.id, tracks.id,
+                (SELECT COALESCE(MAX(position), -1) + 1 FROM playlist_entries WHERE playlist_id = playlists.id)
+            FROM playlists, tracks WHERE playlists.name = ? AND tracks.filename = ?''', (playlist, track))
+
+    def add_track(self, playlist, track):
+        with self.conn:
+            self._insert_entry(playlist, track)
+
+    def remove_track(self, playlist, track):
+        with self.conn:
+            self.conn.execute('''
+                DELETE FROM playlist_entries
+                WHERE playlist_id = (SELECT id FROM playlists WHERE name = ?)
+                AND track_id = (SELECT id FROM tracks WHERE filename = ?)''', (playlist, track))
+
+    def rename_playlist(self, old, new):
+        with self.conn:
+            self.conn.execute('UPDATE playlists SET name = ? WHERE name = ?', (new, old))
+
+    def delete_track(self, track):
+        # Entries are removed along with the track by the foreign key cascade
+        with self.conn:
+            self.conn.execute('DELETE FROM tracks WHERE filename = ?', (track,))
+
+    def rename_track(self, old, new):
+        # Playlist entries refer to the track's id, so they follow the new filename
+        with self.conn:
+            self.conn.execute('UPDATE OR REPLACE tracks SET filename = ? WHERE filename = ?', (new, old))
+
+    def merge_track(self, old, new):
+        # Entries of old move to new where new isn't already in the playlist, the rest go with old's row
+        with self.conn:
+            self.conn.execute('INSERT OR IGNORE INTO tracks (filename) VALUES (?)', (new,))
+            self.conn.execute('''
+                UPDATE OR IGNORE playlist_entries SET track_id = (SELECT id FROM tracks WHERE filename = ?)
+                WHERE track_id = (SELECT id FROM tracks WHERE filename = ?)''', (new, old))
+            self.conn.execute('DELETE FROM tracks WHERE filename = ?', (old,))
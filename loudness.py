@@ -0,0 +1,123 @@
+import os
+import re
+import threading
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from background import BackgroundJob
+from metadata import read_metadata
+from processes import run
+
+REFERENCE_LUFS = -18.0 # ReplayGain 2.0's reference level, quiet enough that most tracks are turned down rather than up
+INTEGRATED = re.compile(rb'I:\s+(-?[\d.]+|-inf) LUFS')
+
+def measure_loudness(path):
+    '''
+    Integrated loudness of a file in LUFS, per EBU R128, measured by decoding it with ffmpeg's ebur128 filter.
+    Returns None if ffmpeg can't read the file or it is silent
+    '''
+    result = run(['ffmpeg', '-nostdin', '-hide_banner', '-nostats', '-vn', '-i', path,
+                  '-af', 'ebur128=framelog=quiet', '-f', 'null', '-'],
+                 stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    # The summary printed at the end has the integrated loudness of the whole file
+    matches = INTEGRATED.findall(result.stderr)
+    if result.returncode != 0 or not matches or matches[-1] == b'-inf':
+        return None
+    return float(matches[-1])
+
+def loudness_gain(lufs, reference=REFERENCE_LUFS):
+    '''
+    Volume multiplier bringing a track measured at lufs to the reference loudness
+    '''
+    return 10 ** ((reference - lufs) / 20)
+
+def _analyze_file(path, cached):
+    # Runs in a pool thread, each call waiting on its own ffmpeg process. The rest of the metadata is only read
+    # if the file has changed since cached, the (mtime, size) of its entry in the cache when it was queued
+    try:
+        stat = os.stat(path)
+        info = None if cached == (stat.st_mtime, stat.st_size) else read_metadata(path)
+        return stat.st_mtime, stat.st_size, measure_loudness(path), info
+    except Exception:
+        return None
+
+class LoudnessAnalyzer(BackgroundJob):
+    def __init__(self, filepath, metadata, batch_size=64, workers=None):
+        '''
+        Measures the loudness of tracks in the background, several ffmpeg processes at a time, and caches it
+        in the metadata cache. Files can be added at any time and are analyzed in the order they were added
+        '''
+        super().__init__()
+        self.filepath = filepath
+        self.metadata = metadata
+        self.batch_size = batch_size
+        self.workers = workers or os.cpu_count() or 1
+        self.pending = deque()
+        self.queued = set()
+        self.lock = threading.Lock() # Guards pending and whether a run is taking files from it
+        self.analyzing = False
+        self.total = 0
+        self.analyzed = 0
+
+    def add(self, files):
+        '''
+        Queue files that haven't been measured yet. Silent or unreadable files are cached as None, so they aren't retried
+        '''
+        files = [name for name in files if name not in self.queued and 'loudness' not in self.metadata.entries.get(name, {})]
+        if not files:
+            return
+        self.queued.update(files)
+        self.total += len(files)
+        # Read here rather than from the pool, which only compares them with the files
+        entries = self.metadata.entries
+        queued = [(name, (entries[name]['mtime'], entries[name]['size']) if name in entries else None) for name in files]
+        with self.lock:
+            self.pending.extend(queued)
+            if self.analyzing:
+                return
+            self.analyzing = True
+        self._start()
+
+    def _next_batch(self):
+        with self.lock:
+            if not self.pending or self.cancelled.is_set():
+                self.analyzing = False
+                return None
+            return [self.pending.popleft() for _ in range(min(self.batch_size, len(self.pending)))]
+
+    def _run(self):
+        executor = self._pool(ThreadPoolExecutor(max_workers=self.workers))
+        try:
+            while True:
+                queued = self._next_batch()
+                if queued is None:
+                    return
+                # Each file is its own future, so a cancel drops the rest of the batch at once
+                futures = [executor.submit(_analyze_file, os.path.join(self.filepath, name), cached) for name, cached in queued]
+                batch = []
+                for (name, _), future in zip(queued, futures):
+                    result = future.result()
+                    if result is not None:
+                        batch.append((name, *result))
+                self._put((len(queued), batch))
+        except Exception:
+            with self.lock:
+                self.analyzing = False
+            # cancel shuts the pool down under this run, which isn't an error
+            if not self.cancelled.is_set():
+                raise
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _apply(self, result):
+        count, batch = result
+        for name, mtime, size, lufs, info in batch:
+            if info is not None and not self.metadata.is_fresh(name, mtime, size):
+                self.metadata.put(name, mtime, size, info)
+            self.metadata.set_loudness(name, mtime, size, lufs)
+            self.queued.discard(name)
+        self.analyzed += count
+
+    def is_active(self):
+        # Runs end and start again as files are added, so this goes by whether files are left rather than by runs
+        return (self.analyzing or not self.results.empty()) and not self.cancelled.is_set()
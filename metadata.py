@@ -0,0 +1,120 @@
+import os
+import json
+from mutagen.mp3 import EasyMP3
+from settings_store import atomic_write_json
+
+TAG_FIELDS = ('title', 'artist', 'album')
+
+def read_metadata(path):
+    '''
+    Parse an MP3 file with mutagen and return the fields stored in the metadata cache
+    '''
+    audio = EasyMP3(path)
+    tags = {}
+    if audio.tags:
+        for field in TAG_FIELDS:
+            if field in audio.tags:
+                tags[field] = audio.tags[field][0]
+    return {
+        'length': audio.info.length,
+        'bitrate': audio.info.bitrate,
+        'sample rate': audio.info.sample_rate,
+        'tags': tags,
+    }
+
+def id3v2_size(data):
+    '''
+    Bytes taken by the ID3v2 tag at the start of an MP3 file's bytes, 0 if it has none
+    '''
+    if len(data) < 10 or data[:3] != b'ID3':
+        return 0
+    # The tag size is a 28-bit "synchsafe" integer, 7 bits per byte, not counting the 10 byte header or a footer
+    size = (data[6] & 0x7F) << 21 | (data[7] & 0x7F) << 14 | (data[8] & 0x7F) << 7 | (data[9] & 0x7F)
+    return 10 + size + (10 if data[5] & 0x10 else 0)
+
+class MetadataCache:
+    def __init__(self, filepath, cache_path):
+        '''
+        On-disk cache of track metadata, keyed by filename and invalidated by mtime and size,
+        so mutagen only has to parse new or changed files
+        '''
+        self.filepath = filepath
+        self.cache_path = cache_path
+        self.entries = {}
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        if os.path.exists(self.cache_path):
+            try:
+                with open(self.cache_path, 'r', encoding='utf-8') as cache_file:
+                    self.entries = json.load(cache_file)
+            except (OSError, ValueError):
+                # A corrupt cache is only a performance loss, start over
+                self.entries = {}
+                self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        atomic_write_json(self.cache_path, self.entries)
+        self.dirty = False
+
+    def _stat_key(self, filename):
+        stat = os.stat(os.path.join(self.filepath, filename))
+        return stat.st_mtime, stat.st_size
+
+    def is_fresh(self, filename, mtime, size):
+        entry = self.entries.get(filename)
+        return entry is not None and entry['mtime'] == mtime and entry['size'] == size
+
+    def get(self, filename):
+        # Return cached metadata, only going back to mutagen if the file is new or has changed
+        mtime, size = self._stat_key(filename)
+        if not self.is_fresh(filename, mtime, size):
+            self.put(filename, mtime, size, read_metadata(os.path.join(self.filepath, filename)))
+        return self.entries[filename]
+
+    def put(self, filename, mtime, size, info):
+        entry = dict(info)
+        entry['mtime'] = mtime
+        entry['size'] = size
+        self.entries[filename] = entry
+        self.dirty = True
+
+    def get_hash(self, filename):
+        # Audio hash from the duplicate finder, dropped along with the rest of the entry when the file changes
+        entry = self.entries.get(filename)
+        return entry.get('audio hash') if entry else None
+
+    def set_hash(self, filename, mtime, size, audio_hash):
+        if self.is_fresh(filename, mtime, size):
+            self.entries[filename]['audio hash'] = audio_hash
+            self.dirty = True
+
+    def get_loudness(self, filename):
+        # Integrated loudness in LUFS from the loudness analyzer, None if it isn't known
+        entry = self.entries.get(filename)
+        return entry.get('loudness') if entry else None
+
+    def set_loudness(self, filename, mtime, size, lufs):
+        if self.is_fresh(filename, mtime, size):
+            self.entries[filename]['loudness'] = lufs
+            self.dirty = True
+
+    def remove(self, filename):
+        if filename in self.entries:
+            del self.entries[filename]
+            self.dirty = True
+
+    def rename(self, old, new):
+        # A rename keeps the file's mtime and size, so its entry stays fresh
+        if old in self.entries:
+            self.entries[new] = self.entries.pop(old)
+            self.dirty = True
+
+    def prune(self, files):
+        # Drop entries for files no longer in the library
+        files = set(files)
+        for filename in [name for name in self.entries if name not in files]:
+            self.remove(filename)
@@ -1,126 +1,71 @@
-import re
 import os
 import sys
-import json
 import time
-import platform
-import threading
 import traceback
+import multiprocessing
 from tkinter import *
 from tkinter.ttk import *
 from tkinter import messagebox
 from tkinter import Scale as Scl
-from yt_dlp import YoutubeDL
-from urllib.parse import urlparse, parse_qs
-from mutagen.mp3 import MP3
-from pygame import mixer
-from tracks import Playlist, Track
+from engine import MusicEngine
+from track_list import TrackList
 from ui_updater import UIUpdatePostProcessor
-import shutil
+from instrumentation import instruments
 
 class MusicBox:
 
     def __init__(self, root):
-
-        # Directory Information
-        self.base_path = None
-        self.filepath = None
-        self.settings_path = None
-        self.__setup_directory()
-
-        # self.base_path = self.__get_user_data_dir()
-        # self.filepath = os.path.join(self.base_path, 'files')
-        # self.settings_path = os.path.join(self.base_path, 'settings.json')
-        # if not os.path.exists(self.filepath):
-        #     os.makedirs(self.filepath, exist_ok=True)
-
+        '''
+        Tkinter front-end over a MusicEngine, which holds the library, queue, settings, playback and downloads
+        '''
         # Initialize Attributes
         self.root = root
-        self.settings = {}
-
-        self.filename = ''
-        self.track_name = ''
-        self.track_pos = 0.0
-        self.tracks = {}
-        self.playlists = {}
-        self.playlist_all = Playlist('All')
-        self.current_playlist = self.playlist_all
-        self.var_playlist = StringVar()
-        self.shuffle = BooleanVar()
-        self.volume = DoubleVar()
-        self.fade = IntVar()
-        self.is_playing = False
-        self.last_play_time = None
-
-        self.cur_download = 0
+        self.engine = MusicEngine()
+        self.var_playlist = StringVar(value=self.engine.current_playlist.get_name())
+        self.shuffle = BooleanVar(value=self.engine.shuffle)
+        self.volume = DoubleVar(value=self.engine.volume)
+        self.fade = IntVar(value=self.engine.fade)
+        self.fade.trace_add('write', self._on_fade_change)
+        self.startup_time = None
+
+        self.progress_interval = 1000 // 15 # Download progress is drawn at a fixed 15 Hz
+        self.progress_version = -1
+        self.progress_job = None
         self.progress_bar_in_use = False
-        self.cancel_flag = threading.Event()
-        self.ydl_opts = {
-            'format': 'bestaudio/best',
-            'outtmpl': '%(title).82s_[%(id)s].%(ext)s'.replace(' ', '_'),
-            'restrictfilenames': True,
-            'paths': {
-                'home': self.filepath,
-            },
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                }],
-            'progress_hooks': [self._yt_progress_hook],
-        }
+        self.refresh_job = None # Playback is driven by these one-shot timers, each rescheduled through _schedule()
+        self.end_job = None
+        self.prefetch_job = None
+        self.debug_window = None
+        self.debug_job = None
+        self.dup_window = None
+        self.dup_groups = []
+        self.finding_duplicates = False
+        self.background_job = None # Next _poll_background, None while the engine is idle
+        self.peaks = None # Waveform of the current track
+        self.waveform_job = None
         # Setup Methods
         self.__setup_UI()
-        self.__load_settings()
-        self.__setup_playlists()
         self.__setup_download_frame()
         self.__setup_current_playlist_frame()
         self.__setup_player_frame()
 
         # PyGame Mixer
-        mixer.init()
-        mixer.music.set_volume(self.volume.get())
-        if self.track_name:
-            self.play_track(self.track_name)
-            self.sld_progress.set(100 * self.track_pos / self.track_length)
+        self.engine.start_audio()
+        if self.engine.track_name:
+            self.play_track(self.engine.track_name)
+            self.sld_progress.set(100 * self.engine.track_pos / self.engine.track_length)
             self.seek_track(None)
             self.play(None)
 
+        # Library indexing and loudness analysis continue in the background once the window is up.
+        # Workers that find something to do while nothing else is running wake the polling through a virtual event
+        self.root.bind('<<Background>>', self._wake_background)
+        self.engine.set_wakeup(self._notify_background)
+        self._wake_background()
+        self.root.after_idle(self._report_startup)
 
 # Setup Functions
 
-    def __setup_directory(self):
-        '''
-        Assign directory paths based on whether program running as python file or executable
-        '''
-        if getattr(sys, 'frozen', False):
-            # Running as PyInstaller EXE
-            self.base_path = os.path.dirname(sys.executable)
-        else:
-            # Running as script
-            self.base_path = os.path.dirname(os.path.abspath(__file__))
-        self.filepath = os.path.join(self.base_path, 'files')
-        self.settings_path = os.path.join(self.base_path, 'settings.json')
-        if not os.path.exists(self.filepath):
-            os.makedirs(self.filepath)
-
-    def __get_user_data_dir(self, app_name='MusicBox'):
-        '''
-        Supposed to use user directory for different operating systems.
-        Currently causes issues with ffmpeg and ffprobe audio codec
-        '''
-        home = os.path.expanduser('~')
-        system = platform.system()
-        if system == 'Windows':
-            appdata = os.getenv('APPDATA')
-            if appdata:
-                return os.path.join(appdata, app_name)
-            else:
-                return os.path.join(home, 'AppData', 'Roaming', app_name)
-        elif system == 'Darwin':  # macOS
-            return os.path.join(home, 'Library', 'Application Support', app_name)
-        else:  # Linux and others
-            return os.path.join(home, '.config', app_name)
-
     def __setup_UI(self):
         '''
         Set up main window UI
@@ -144,6 +89,9 @@ class MusicBox:
 
         # Bindings
         self.root.bind('<Escape>', self.remove_focus)
+        self.root.bind('<F9>', self.find_duplicates)
+        self.root.bind('<F12>', self.show_debug_window)
+        self.root.bind('<Map>', self._on_map)
         self.root.bind('<Key-space>', self.play)
         self.root.bind('<Up>', self.volume_up)
         self.root.bind('<Down>', self.volume_down)
@@ -156,99 +104,6 @@ class MusicBox:
         for i in range(10):
             self.root.bind(f'{i}', lambda e: self.change_playlist_kb(i))
 
-    def __load_settings(self):
-        '''
-        Loads settings from json file
-        '''
-        if os.path.exists(self.settings_path):
-            with open(self.settings_path, 'r', encoding='utf-8') as settings_file:
-                self.settings = json.load(settings_file)
-        else:
-            self.settings = {
-                'current playlist': 'All',
-                'current track': None,
-                'queue position': 0,
-                'track position': 0.0,
-                'shuffle': False,
-                'volume': 0.5,
-                'fade': 1000,
-                'playlists': {
-                    'Playlist 0': [],
-                    'Playlist 1': [],
-                    'Playlist 2': [],
-                    'Playlist 3': [],
-                    'Playlist 4': [],
-                    'Playlist 5': [],
-                    'Playlist 6': [],
-                    'Playlist 7': [],
-                    'Playlist 8': [],
-                    'Playlist 9': []
-                }
-            }
-
-        self.var_playlist.set(self.settings['current playlist'])
-        self.filename = self.settings['current track']
-        self.track_pos = float(self.settings['track position'])
-        self.shuffle.set(self.settings['shuffle'])
-        self.volume.set(float(self.settings['volume']))
-        self.fade.set(int(self.settings['fade']))
-        files = os.listdir(self.filepath)
-        if self.filename and self.filename in files:
-            self.track_name = self.clean_filename(self.filename)
-
-    def __save_settings(self):
-        '''
-        Saves settings to json file
-        '''
-        # Get current position of track for next boot
-        if self.track_name:
-            val = self.sld_progress.get()
-            self.track_pos = float(val) * (self.track_length / 100)
-        else:
-            self.track_pos = 0.0
-
-        self.settings['current playlist'] = self.current_playlist.get_name()
-        self.settings['current track'] = self.filename
-        if self.shuffle.get():
-            self.settings['queue position'] = 0
-        else:
-            self.settings['queue position'] = self.current_playlist.get_queue_position()
-        self.settings['track position'] = self.track_pos
-        self.settings['shuffle'] = self.shuffle.get()
-        self.settings['volume'] = round(self.volume.get(), 2)
-        self.settings['fade'] = self.fade.get()
-        self.settings['playlists'] = {}
-        for name, obj in self.playlists.items():
-            self.settings['playlists'][name] = obj.get_tracks()
-
-        with open(self.settings_path, 'w', encoding='utf-8') as settings_file:
-            json.dump(self.settings, settings_file, indent=4)
-
-    def __setup_playlists(self):
-        '''
-        Create "All" playlist and load saved playlists from settings
-        '''
-        # Create Track objects, and add all tracks to "All" playlist
-        files = sorted(os.listdir(self.filepath))
-        for track in files:
-            self.playlist_all.add_track(self.clean_filename(track), track)
-            self.tracks[track] = Track()
-
-        # Create Playlist objects and add their tracks, and add playlists to Track objects
-        saved_lists = self.settings['playlists']
-        cur_playlist = self.settings['current playlist']
-        for playlist, tracks in saved_lists.items():
-            self.playlists[playlist] = Playlist(playlist)
-            for track in tracks:
-                if track in files:
-                    self.playlists[playlist].add_track(self.clean_filename(track), track)
-                    self.tracks[track].add_to_playlist(playlist)
-            if playlist == cur_playlist:
-                if self.settings['shuffle']:
-                    self.playlists[playlist].shuffle_queue()
-                else:
-                    self.playlists[playlist].set_queue_pos(self.settings['queue position'])
-
     def __setup_download_frame(self):
         '''
         Sets up the Download Frame
@@ -291,24 +146,29 @@ class MusicBox:
         self.frm_current_playlist = Frame(self.root, style=self.style_name)
         self.frm_current_playlist.grid(row=1, column=1, padx=25, pady=25, sticky='nsew')
         self.frm_current_playlist.columnconfigure(0, weight=1, minsize=100)
+        self.frm_current_playlist.columnconfigure(1, weight=1, minsize=100)
         self.frm_current_playlist.rowconfigure(0, weight=0, minsize=10)
         self.frm_current_playlist.rowconfigure(1, weight=1, minsize=200)
 
+        # Variables
+        self.var_search = StringVar()
+        self.search_results = None # Tracks matching the search box, or None when not filtering
+
         # Widgets
         self.cb_playlists = Combobox(self.frm_current_playlist, textvariable=self.var_playlist)
-        self.cb_playlists['values'] = tuple([self.playlist_all.get_name()]) + tuple(name for name, _ in self.playlists.items())
-        self.lb_tracks = Listbox(self.frm_current_playlist)
-        track_names = self.current_playlist.get_queue()
-        for track in track_names:
-            self.lb_tracks.insert(END, track)
+        self.cb_playlists['values'] = tuple([self.engine.playlist_all.get_name()]) + tuple(name for name, _ in self.engine.playlists.items())
+        self.ent_search = Entry(self.frm_current_playlist, textvariable=self.var_search)
+        self.lb_tracks = TrackList(self.frm_current_playlist)
 
         # Grid
         self.cb_playlists.grid(row=0, column=0, padx=10, pady=5, sticky='nw')
-        self.lb_tracks.grid(row=1, column=0, padx=10, pady=5, sticky='nsew')
+        self.ent_search.grid(row=0, column=1, padx=10, pady=5, sticky='new')
+        self.lb_tracks.grid(row=1, column=0, columnspan=2, padx=10, pady=5, sticky='nsew')
 
         # Bindings
         self.cb_playlists.bind('<<ComboboxSelected>>', self.change_playlist)
         self.cb_playlists.bind('<Return>', self.rename_playlist)
+        self.ent_search.bind('<KeyRelease>', self.search_tracks)
         self.lb_tracks.bind('<Double-1>', lambda e: self.play_track(self.lb_tracks.get(self.lb_tracks.curselection()), True))
         self.lb_tracks.bind('<Delete>', lambda e: self.del_track(self.lb_tracks.get(self.lb_tracks.curselection())))
 
@@ -329,25 +189,34 @@ class MusicBox:
         self.frm_player.rowconfigure(2, weight=1, minsize=100)
 
         # Variables
-        self.var_title = StringVar(value=self.track_name)
+        self.var_title = StringVar(value=self.engine.track_name)
         self.var_progress = StringVar(value='0:00:00')
         self.var_length = StringVar(value='0:00:00')
 
         # Widgets
         self.lbl_title = Label(self.frm_player, textvariable=self.var_title)
         self.lbl_progress = Label(self.frm_player, textvariable=self.var_progress)
-        self.sld_progress = Scale(self.frm_player, orient=HORIZONTAL, from_=0.0, to=100.0)
+        self.frm_progress = Frame(self.frm_player)
+        self.frm_progress.columnconfigure(0, weight=1)
+        self.cnv_waveform = Canvas(self.frm_progress, borderwidth=0, highlightthickness=0, height=40, bg='white')
+        self.sld_progress = Scale(self.frm_progress, orient=HORIZONTAL, from_=0.0, to=100.0)
         self.lbl_length = Label(self.frm_player, textvariable=self.var_length)
 
         # Grid
         self.lbl_title.grid(row=0, column=0, columnspan=3, padx=5, pady=10, sticky='n')
         self.lbl_progress.grid(row=1, column=0, padx=5, pady=10, sticky='e')
-        self.sld_progress.grid(row=1, column=1, padx=5, pady=10, sticky='ew')
+        self.frm_progress.grid(row=1, column=1, padx=5, pady=10, sticky='ew')
+        self.cnv_waveform.grid(row=0, column=0, sticky='ew')
+        self.sld_progress.grid(row=1, column=0, sticky='ew')
         self.lbl_length.grid(row=1, column=2, padx=5, pady=10, sticky='w')
 
         # Bindings
         self.sld_progress.bind('<ButtonPress-1>', self._on_slider_press)
         self.sld_progress.bind('<ButtonRelease-1>', self._on_slider_release)
+        self.cnv_waveform.bind('<Configure>', lambda e: self._draw_waveform())
+        self.cnv_waveform.bind('<ButtonPress-1>', self._on_waveform_drag)
+        self.cnv_waveform.bind('<B1-Motion>', self._on_waveform_drag)
+        self.cnv_waveform.bind('<ButtonRelease-1>', self._on_waveform_release)
 
         # Inner Frames
         self.__setup_controls_frame()
@@ -441,10 +310,10 @@ class MusicBox:
         self.playlist_var_names = []
         self.var_playlists = []
         self.cbtn_playlists = []
-        for i, (playlist_name, obj) in enumerate(self.playlists.items()):
+        for i, (playlist_name, obj) in enumerate(self.engine.playlists.items()):
             self.playlist_var_names.append(StringVar(value=playlist_name))
-            if self.filename:
-                playlists = self.tracks[self.filename].get_playlists()
+            if self.engine.track_name:
+                playlists = self.engine.get_track_playlists(self.engine.filename)
             else:
                 playlists = []
             if playlist_name in playlists:
@@ -459,84 +328,119 @@ class MusicBox:
         self.cnv_playlists.bind('<Enter>', self._bind_mousewheel)
         self.cnv_playlists.bind('<Leave>', self._unbind_mousewheel)
 
+    def _report_startup(self):
+        '''
+        Records the time from launch until the window first becomes idle and interactive, shown in the debug window
+        '''
+        self.startup_time = time.perf_counter() - self.engine.start_time
+        if instruments.enabled:
+            instruments.record('first interactive frame', self.startup_time)
 
-# Download Frame Functions
+    def _notify_background(self):
+        '''
+        Called from worker threads, which can only post an event to the Tk thread
+        '''
+        try:
+            self.root.event_generate('<<Background>>', when='tail')
+        except (RuntimeError, TclError):
+            # The window is closing
+            pass
 
-    def _extract_youtube_id(self, url):
+    def _wake_background(self, event=None):
         '''
-        Helper function to extract YouTube video ID from different formats.
+        Starts polling for background results again, if it had stopped
+        '''
+        if self.background_job is None:
+            self.background_job = self.root.after_idle(self._poll_background)
 
-        Supports:
-        - https://www.youtube.com/watch?v=VIDEO_ID
-        - https://youtu.be/VIDEO_ID
-        - https://youtube.com/watch?v=VIDEO_ID
-        - https://m.youtube.com/watch?v=VIDEO_ID
-        - URLs with additional parameters
-        - Embedded URLs
+    def _poll_background(self):
+        '''
+        Picks up the results of all background work: library indexing, loudness analysis, the duplicate search,
+        downloaded tracks and changes to the library folder. Runs every 100 ms while any of it is active,
+        and stops once the engine is idle until _wake_background is called
         '''
-        if not url or not isinstance(url, str):
-            return None
+        self.background_job = None
+        try:
+            self._poll_indexer()
+            self.engine.poll_loudness()
+            self._poll_duplicates()
+            self._poll_watcher()
+            self._apply_commands()
+        finally:
+            # An error in one batch mustn't stop polling for the rest of the session
+            if self.engine.is_busy():
+                self.background_job = self.root.after(100, self._poll_background)
 
-        # Remove whitespace
-        url = url.strip()
+    def _poll_indexer(self):
+        '''
+        Shows indexing progress while the engine merges metadata from the background indexer
+        '''
+        if not self.engine.indexing:
+            return
+        done = self.engine.poll_indexer()
+        indexer = self.engine.indexer
+        downloading = self.engine.is_downloading()
+        if done:
+            if instruments.enabled:
+                instruments.record('library indexed', time.perf_counter() - self.engine.start_time)
+            if not downloading:
+                self.var_status.set('Please enter a URL')
+            return
+        if not downloading:
+            self.var_status.set(f'Indexing library... ({indexer.indexed}/{indexer.total})')
+
+    def _poll_watcher(self):
+        '''
+        Picks up files added, removed or renamed outside the program, rebuilding the track list once per batch
+        '''
+        playing = self.engine.track_name
+        if self.engine.poll_watcher():
+            if playing and not self.engine.track_name:
+                # The current track's file is gone
+                self._clear_track()
+            else:
+                self.var_title.set(self.engine.track_name)
+            self.change_playlist(None)
 
-        # Pattern for youtu.be short URLs
-        youtu_be_pattern = r'(?:youtu\.be/)([a-zA-Z0-9_-]{11})'
-        match = re.search(youtu_be_pattern, url)
-        if match:
-            return match.group(1)
 
-        # Pattern for youtube.com URLs with v parameter
-        youtube_pattern = r'(?:youtube\.com.*[?&]v=)([a-zA-Z0-9_-]{11})'
-        match = re.search(youtube_pattern, url)
-        if match:
-            return match.group(1)
+# Download Frame Functions
 
-        # Pattern for embedded URLs
-        embed_pattern = r'(?:youtube\.com/embed/)([a-zA-Z0-9_-]{11})'
-        match = re.search(embed_pattern, url)
-        if match:
-            return match.group(1)
+    def _drain_progress(self):
+        '''
+        Update progress bar and status from the latest download state, at a fixed rate while downloads run
+        '''
+        if self.engine.stop_requested:
+            self.engine.stop_for_download()
+        snapshot = self.engine.scheduler.snapshot()
+        if snapshot['version'] != self.progress_version:
+            self.progress_version = snapshot['version']
+            self.bar_progress.config(value=snapshot['percent'])
+            job = snapshot['latest']
+            if job:
+                name = self._job_name(job)
+                finished, total = snapshot['finished'], snapshot['total']
+                if job.status == 'downloading':
+                    self.var_status.set(f'Downloading {name} ({finished + 1}/{total})... {job.percent:.1f}%')
+                elif job.status == 'processing':
+                    self.var_status.set(f'{name} downloaded ({finished + 1}/{total}), processing...')
+                elif job.status == 'finished':
+                    self.var_status.set(f'{name} finished ({finished}/{total})')
+                elif job.status == 'skipped':
+                    self.var_status.set(f'{name} already downloaded, skipping')
+        if snapshot['done']:
+            self.progress_job = None
+            self._on_downloads_done(snapshot)
+            return
+        self.progress_job = self.root.after(self.progress_interval, self._drain_progress)
 
-        # Fallback: try parsing as URL and extract v parameter
-        try:
-            parsed = urlparse(url)
-            if 'youtube.com' in parsed.netloc or 'youtu.be' in parsed.netloc:
-                query_params = parse_qs(parsed.query)
-                if 'v' in query_params:
-                    video_id = query_params['v'][0]
-                    # Validate video ID format (11 characters, alphanumeric + _ -)
-                    if re.match(r'^[a-zA-Z0-9_-]{11}$', video_id):
-                        return video_id
-        except:
-            pass
-        
-        return None
-
-    def _yt_progress_hook(self, d):
-        '''
-        Update progress bar and status as track is downloaded
-        '''
-        # Check if download should be cancelled
-        if self.cancel_flag.is_set():
-            raise Exception('Download cancelled by user')
-
-        filename = d.get('filename', '')
-        if d['status'] == 'downloading':
-            # this MIGHT work for playlists
-            if filename == self.filename:
-                if mixer.music.get_busy():
-                        mixer.music.stop()
-                        mixer.music.unload()
-            total_bytes = d.get('total_bytes') or d.get('total_bytes_estimate')
-            downloaded_bytes = d.get('downloaded_bytes', 0)
-            if total_bytes:
-                percent = downloaded_bytes / total_bytes * 100
-                self.root.after(0, lambda: self.bar_progress.config(value=percent))
-                self.root.after(0, lambda: self.var_status.set(f'Downloading {self.clean_filename(os.path.basename(filename))} ({self.cur_download + 1}/?)... {percent:.1f}%'))
-        elif d['status'] == 'finished':
-            self.root.after(0, lambda: self.bar_progress.config(value=100))
-            self.root.after(0, lambda: self.var_status.set(f'{self.clean_filename(os.path.basename(filename))} finished ({self.cur_download + 1}/?), processing...'))
+    def _job_name(self, job):
+        '''
+        Helper function for a readable name of a download job, before and after its filename is known
+        '''
+        name = job.get_name()
+        if '[' in name:
+            return self.engine.clean_filename(name)
+        return name
 
     def download(self):
         '''
@@ -544,79 +448,66 @@ class MusicBox:
 
         NOTE Must be separated by a comma,
         space is optional and will be removed if necessary.
+        URLs and playlist entries are downloaded concurrently.
         In the case that the ID of any video being downloaded
         matches the currently playing track, the current track
         will be stopped and unloaded. The progress updater
         will detect this and move to the next track in the queue.
         '''
-
-        self.cancel_flag.clear()
         self.var_status.set('Preparing...')
         self.bar_progress.config(value=0)
         entry = self.ent_url.get()
         urls = entry.split(',')
 
-        # Run download in a separate thread to avoid blocking the GUI
-        self.download_thread = threading.Thread(target=self._download_thread, args=(urls,), daemon=True)
-        self.download_thread.start()
+        # Downloads run on worker threads to avoid blocking the GUI
+        self.engine.start_download(urls, [UIUpdatePostProcessor(self.engine)])
+        self._wake_background()
+        if self.progress_job:
+            self.root.after_cancel(self.progress_job)
+        self.progress_version = -1
+        self.progress_job = self.root.after(self.progress_interval, self._drain_progress)
+
+    def _apply_commands(self):
+        '''
+        Adds the files downloaded since the last call to the library, updating the track list once per batch
+        rather than rebuilding it for every file. Also shows a download starting to play as it arrives,
+        and again once it has been swapped for the library file
+        '''
+        added, changed = self.engine.apply_commands()
+        if changed:
+            self._stop_progress_updater()
+            self._show_track()
+            self._start_progress_updater()
+        if added and self.engine.current_playlist is self.engine.playlist_all:
+            if self.search_results is None and self.engine.current_playlist.get_shuffle_seed() is None:
+                # New tracks are appended to the queue the list already shows
+                self.lb_tracks.refresh()
+            else:
+                self.search_tracks(None)
 
-    def _download_thread(self, urls):
+    def _on_downloads_done(self, snapshot):
         '''
-        Download each url provided, single videos or playlists
+        Report the outcome once every job has been downloaded and processed
         '''
-        try:
-            with YoutubeDL(self.ydl_opts) as ydl:
-                ydl.add_post_processor(UIUpdatePostProcessor(self))
-                for url in urls:
-                    if self.cancel_flag.is_set():
-                        self.root.after(0, lambda: self.var_status.set(f'Download cancelled. Downloaded {self.cur_download} out of {total_entries} tracks.'))
-                        return
-                    url = url.strip()
-                    # Stop current track if needed
-                    if mixer.music.get_busy():
-                        if self._extract_youtube_id(url) == self.filename[-16:-5]:
-                            mixer.music.stop()
-                            mixer.music.unload()
-
-                    # Download (playlist or single)
-                    info = ydl.extract_info(url, download=True)
-
-                    if 'entries' in info:
-                        entries = info['entries']
-                        total_entries = len(entries)
-                        self.root.after(0, lambda: self.var_status.set(f'Playlist download complete! Downloaded {self.cur_download} out of {total_entries} tracks.'))
-                    else:
-                        # filename = ydl.prepare_filename(info)
-                        # mp3_filename = os.path.splitext(filename)[0] + '.mp3'
-                        # basename = os.path.basename(mp3_filename)
-                        self.root.after(0, lambda: self.var_status.set('Success!'))
-
-        except Exception as e:
-            if self.cancel_flag.is_set():
-                self.root.after(0, lambda: self.var_status.set('Download cancelled'))
-            else:
-                self.root.after(0, lambda: self.var_status.set('Error'))
-                self.root.after(0, lambda e=e: messagebox.showerror('Error', f'Error: {e}'))
+        finished, total = snapshot['finished'], snapshot['total'] - snapshot['skipped']
+        if self.engine.cancel_flag.is_set():
+            self.var_status.set(f'Download cancelled. Downloaded {finished} out of {total} tracks.')
+        elif self.engine.scheduler.errors:
+            self.var_status.set(f'Error. Downloaded {finished} out of {total} tracks.')
+            messagebox.showerror('Error', f'Error: {self.engine.scheduler.errors[0]}')
+        elif total > 1 or snapshot['skipped']:
+            self.var_status.set(f'Download complete! Downloaded {finished} out of {total} new tracks, skipped {snapshot["skipped"]} already downloaded.')
+        else:
+            self.bar_progress.config(value=100)
+            self.var_status.set('Success!')
 
     def cancel_download(self):
         '''
         Cancel the current download and remove any .part files
         '''
         try:
-            self.cancel_flag.set()
             self.var_status.set('Cancelling download...')
-            # If download thread is running, wait for it to finish
-            if hasattr(self, 'download_thread') and self.download_thread and self.download_thread.is_alive():
-                self.download_thread.join(timeout=2)  # Wait up to 2 seconds for thread to finish
-
-            # Remove any .part files in the download directory
-            for fname in os.listdir(self.filepath):
-                if fname.endswith('.part'):
-                    try:
-                        os.remove(os.path.join(self.filepath, fname))
-                    except Exception as e:
-                        print(f'Error removing {fname}: {e}')
-
+            self.engine.cancel_download()
             self.var_status.set('Download cancelled')
             self.bar_progress.config(value=0)
         except Exception as e:
@@ -625,60 +516,98 @@ class MusicBox:
 
 # Playback
 
-    def play_track(self, name, set_queue_pos=False):
+    def play_track(self, name, set_queue_pos=False, crossfade=False):
         '''
-        Finds the corresponding file and plays the track, while updating the UI
+        Plays the track through the engine, while updating the UI.
+        With crossfade, the previous track fades out as this one fades in
         '''
-        self.track_name = name
-        self.filename = self.current_playlist.get_track(name)
-        if set_queue_pos:
-            self.current_playlist.set_queue_pos(self.current_playlist.get_queue().index(self.track_name))
-        self.lb_tracks.selection_set(self.current_playlist.get_queue_pos())
-        self.audio_info = MP3(os.path.join(self.filepath, self.filename)).info
-        self.track_length = int(self.audio_info.length)
-        self.track_pos = 0  # Track position in ms
-        self.is_playing = False
-        self.last_play_time = None
+        self._stop_progress_updater()
+        try:
+            self.engine.play_track(name, set_queue_pos, crossfade)
+        except Exception as e:
+            messagebox.showerror('Error', e)
+            return
+        self._show_track()
+        self._start_progress_updater()
 
-        playlists = self.tracks[self.filename].get_playlists()
+    def _show_track(self):
+        '''
+        Helper function for showing the current track's title, length and playlists
+        '''
+        engine = self.engine
+        self._select_current()
+        playlists = engine.get_track_playlists(engine.filename)
         for i, var in enumerate(self.playlist_var_names):
             if var.get() in playlists:
                 self.var_playlists[i].set(i)
             else:
                 self.var_playlists[i].set(-i-1)
+        self.var_title.set(engine.track_name)
+        hours, mins, secs = self._get_track_len(engine.track_length)
+        self.var_length.set(f'{hours}:{mins:02}:{secs:02}')
+        self.sld_progress.set(0)
+        self.var_progress.set('0:00:00')
+        self._load_waveform(engine.filename)
 
-        try:
-            mixer.music.stop()
-            mixer.music.unload()
-            self.var_title.set(self.track_name)
-            mixer.music.load(os.path.join(self.filepath, self.filename))
-            hours, mins, secs = self._get_track_len(self.track_length)
-            self.var_length.set(f'{hours}:{mins:02}:{secs:02}')
-            mixer.music.play(fade_ms=self.fade.get())
-            mixer.music.pause()
-            self.start(None)
-            self.play(None)
-        except Exception as e:
-            messagebox.showerror('Error', e)
+    def _load_waveform(self, filename):
+        '''
+        Helper function for showing a track's waveform, checking back while it is built the first time the track is played
+        '''
+        if self.waveform_job is not None:
+            self.root.after_cancel(self.waveform_job)
+            self.waveform_job = None
+        self.peaks = self.engine.get_waveform(filename) if filename else None
+        self._draw_waveform()
+        if self.peaks is None and filename and self.engine.waveforms.building:
+            self.waveform_job = self.root.after(500, self._load_waveform, filename)
+
+    def _draw_waveform(self):
+        '''
+        Draws one line per pixel column from the stored peaks, so resizing never decodes the track again
+        '''
+        self.cnv_waveform.delete('wave')
+        width = self.cnv_waveform.winfo_width()
+        height = self.cnv_waveform.winfo_height()
+        if self.peaks is not None:
+            middle = height / 2
+            for x, (low, high) in enumerate(self.peaks.columns(width)):
+                self.cnv_waveform.create_line(x, middle - high * middle, x, middle - low * middle + 1, fill='medium purple', tags='wave')
+        self._draw_playhead(self.sld_progress.get() / 100)
+
+    def _draw_playhead(self, fraction):
+        x = fraction * self.cnv_waveform.winfo_width()
+        if not self.cnv_waveform.find_withtag('playhead'):
+            self.cnv_waveform.create_line(0, 0, 0, 0, fill='black', tags='playhead')
+        self.cnv_waveform.coords('playhead', x, 0, x, self.cnv_waveform.winfo_height())
+        self.cnv_waveform.tag_raise('playhead')
+
+    def _on_waveform_drag(self, event):
+        '''
+        Helper function for scrubbing by clicking or dragging on the waveform, which moves the slider until released
+        '''
+        self.progress_bar_in_use = True
+        fraction = min(max(event.x / max(self.cnv_waveform.winfo_width(), 1), 0.0), 1.0)
+        self.sld_progress.set(100 * fraction)
+        self._draw_playhead(fraction)
+
+    def _on_waveform_release(self, event):
+        self._on_waveform_drag(event)
+        self._on_slider_release(event)
 
     def start(self, event):
         '''
         Set player back to start of track
         '''
         focus = self.root.focus_get()
-        if focus != self.cb_playlists and focus != self.ent_url:
-            self.sld_progress.set(0)
-            self.var_progress.set('0:00:00')
-            mixer.music.rewind()
-            self.last_play_time = None
-            self.track_pos = 0
+        if focus not in (self.cb_playlists, self.ent_url, self.ent_search):
+            self._seek(0)
 
     def prev(self, event):
         '''
         Go back to previous track
         '''
         focus = self.root.focus_get()
-        if focus != self.cb_playlists and focus != self.ent_url and self.track_name != '':
+        if focus not in (self.cb_playlists, self.ent_url, self.ent_search) and self.engine.track_name != '':
             self.sld_progress.set(0)
             self.var_progress.set(f'0:00:00')
 
@@ -689,28 +618,20 @@ class MusicBox:
         Play/Pause track
         '''
         focus = self.root.focus_get()
-        if focus != self.cb_playlists and focus != self.ent_url and self.track_name != '':
-            if mixer.music.get_busy():
-                mixer.music.pause()
-                self.is_playing = False
-                if self.last_play_time:
-                    # Add elapsed time since last unpause to track_pos
-                    self.track_pos += (time.time() - self.last_play_time)
-                    self.last_play_time = None
+        if focus not in (self.cb_playlists, self.ent_url, self.ent_search) and self.engine.track_name != '':
+            if self.engine.play_pause():
+                self._start_progress_updater()
             else:
-                mixer.music.unpause()
-                self.is_playing = True
-                self.last_play_time = time.time()
-                self._start_progress_updater()  # Start updating progress
+                self._stop_progress_updater()
 
     def end(self, event):
         '''
         Go to end of track and fadeout, then transition to next track
         '''
         focus = self.root.focus_get()
-        if focus != self.cb_playlists and focus != self.ent_url and self.track_name != '':
+        if focus not in (self.cb_playlists, self.ent_url, self.ent_search) and self.engine.track_name != '':
             self.sld_progress.set(100)
-            hours, mins, secs = self._get_track_len(self.track_length)
+            hours, mins, secs = self._get_track_len(self.engine.track_length)
             self.var_progress.set(f'{hours}:{mins:02}:{secs:02}')
 
             self._transition(1)
@@ -720,40 +641,16 @@ class MusicBox:
         Skip ahead 5 seconds in current track
         '''
         focus = self.root.focus_get()
-        if focus != self.cb_playlists and focus != self.ent_url:
-            # Update track_pos with elapsed time
-            if self.is_playing and self.last_play_time:
-                self.track_pos += (time.time() - self.last_play_time)
-            self.track_pos = min(self.track_pos + 5, self.track_length)
-            mixer.music.rewind()
-            mixer.music.set_pos(self.track_pos)
-            hours, mins, secs = self._get_track_len(self.track_pos)
-            self.var_progress.set(f'{hours}:{mins:02}:{secs:02}')
-            self.sld_progress.set(100 * self.track_pos / self.track_length)
-            if self.is_playing:
-                self.last_play_time = time.time()
-            else:
-                self.last_play_time = None
+        if focus not in (self.cb_playlists, self.ent_url, self.ent_search) and self.engine.track_name != '':
+            self._seek(min(self.engine.get_position() + 5, self.engine.track_length))
 
     def back(self, event):
         '''
         Skip backwards 5 seconds in current track
         '''
         focus = self.root.focus_get()
-        if focus != self.cb_playlists and focus != self.ent_url:
-            # Update track_pos with elapsed time
-            if self.is_playing and self.last_play_time:
-                self.track_pos += (time.time() - self.last_play_time)
-            self.track_pos = max(self.track_pos - 5, 0)
-            mixer.music.rewind()
-            mixer.music.set_pos(self.track_pos)
-            hours, mins, secs = self._get_track_len(self.track_pos)
-            self.var_progress.set(f'{hours}:{mins:02}:{secs:02}')
-            self.sld_progress.set(100 * self.track_pos / self.track_length)
-            if self.is_playing:
-                self.last_play_time = time.time()
-            else:
-                self.last_play_time = None
+        if focus not in (self.cb_playlists, self.ent_url, self.ent_search) and self.engine.track_name != '':
+            self._seek(max(self.engine.get_position() - 5, 0))
 
     def _on_slider_press(self, event):
         '''
@@ -772,16 +669,23 @@ class MusicBox:
         '''
         When progress slider is moved, this will update the track to match the current position of the slider
         '''
-        val = self.sld_progress.get()
-        self.track_pos = float(val) * (self.track_length / 100)
-        mixer.music.rewind()
-        mixer.music.set_pos(self.track_pos)
-        hours, mins, secs = self._get_track_len(self.track_pos)
+        if self.engine.track_name:
+            val = self.sld_progress.get()
+            self._seek(float(val) * (self.engine.track_length / 100))
+
+    def _seek(self, pos):
+        '''
+        Helper function for moving the current track to a position in seconds and updating the progress display
+        '''
+        self.engine.seek(pos)
+        hours, mins, secs = self._get_track_len(pos)
         self.var_progress.set(f'{hours}:{mins:02}:{secs:02}')
-        if self.is_playing:
-            self.last_play_time = time.time()
-        else:
-            self.last_play_time = None
+        if not self.progress_bar_in_use and self.engine.track_length:
+            self.sld_progress.set(100 * pos / self.engine.track_length)
+            self._draw_playhead(pos / self.engine.track_length)
+        # The end of track timers depend on the position
+        if self.engine.is_playing:
+            self._start_progress_updater()
 
     def volume_up(self, event):
         '''
@@ -789,7 +693,7 @@ class MusicBox:
         '''
         if self.root.focus_get() == self.root:
             self.volume.set(round(min(self.volume.get() + 0.1, 1), 2))
-            mixer.music.set_volume(self.volume.get())
+            self.engine.set_volume(self.volume.get())
             self.var_volume.set(int(100 * self.volume.get()))
 
     def volume_down(self, event):
@@ -798,7 +702,7 @@ class MusicBox:
         '''
         if self.root.focus_get() == self.root:
             self.volume.set(round(max(self.volume.get() - 0.1, 0), 2))
-            mixer.music.set_volume(self.volume.get())
+            self.engine.set_volume(self.volume.get())
             self.var_volume.set(int(100 * self.volume.get()))
 
     def update_volume(self, val):
@@ -806,46 +710,96 @@ class MusicBox:
         Change volume based on slider
         '''
         val = round(float(val), 2)
-        mixer.music.set_volume(self.volume.get())
+        self.engine.set_volume(self.volume.get())
         self.volume.set(round(self.volume.get(), 2))
         self.var_volume.set(int(val * 100))
 
+    def _on_fade_change(self, *args):
+        '''
+        Helper function for passing the fade slider's value on to the engine
+        '''
+        self.engine.fade = self.fade.get()
+
     def shuffle_toggle(self):
         '''
         (Un)shuffle the current queue, updating the ordering in the listbox and preserving the current track
         '''
-        if self.shuffle.get():
-            self.current_playlist.shuffle_queue()
-        else:
-            self.current_playlist.unshuffle_queue()
+        self.engine.set_shuffle(self.shuffle.get())
         self.change_playlist(None)
 
     def _start_progress_updater(self):
         '''
-        Continuously updates progress slider to reflect current position of current track
-        '''
-        if self.is_playing:
-            if not mixer.music.get_busy():
-                # Playback finished
-                self.is_playing = False
-                self.track_pos = self.track_length
-                hours, mins, secs = self._get_track_len(self.track_length)
-                self.var_progress.set(f'{hours}:{mins:02}:{secs:02}')
-                self.sld_progress.set(100)
-                self._transition(1)
-                return
-            # Calculate current position
-            if self.last_play_time:
-                elapsed = time.time() - self.last_play_time
-                current_pos = self.track_pos + elapsed
-            else:
-                current_pos = self.track_pos
-            hours, mins, secs = self._get_track_len(current_pos)
-            self.var_progress.set(f'{hours}:{mins:02}:{secs:02}')
-            if not self.progress_bar_in_use:
-                self.sld_progress.set(100 * current_pos / self.track_length)
-            # Schedule next update
-            self.root.after(100, self._start_progress_updater)
+        (Re)schedules the progress display and the timers for the end of the current track,
+        replacing any already scheduled so they can never run twice
+        '''
+        engine = self.engine
+        if not engine.is_playing:
+            return
+        remaining = engine.time_to_transition()
+        self._schedule('prefetch_job', remaining - engine.prefetch_seconds, engine.prefetch_next)
+        self._schedule('end_job', remaining, self._on_track_end)
+        self._refresh_progress()
+
+    def _stop_progress_updater(self):
+        '''
+        Cancels the progress display and end of track timers, while paused or between tracks
+        '''
+        for job in ('refresh_job', 'end_job', 'prefetch_job'):
+            self._schedule(job, None, None)
+
+    def _schedule(self, job, seconds, callback):
+        '''
+        Helper function for replacing the timer stored in the given attribute, or just cancelling it if seconds is None
+        '''
+        handle = getattr(self, job)
+        if handle is not None:
+            self.root.after_cancel(handle)
+        if seconds is None:
+            setattr(self, job, None)
+        else:
+            setattr(self, job, self.root.after(max(int(seconds * 1000), 0), callback))
+
+    def _refresh_progress(self):
+        '''
+        Updates the progress slider and label, as often as the slider can show a change.
+        Nothing is redrawn while the window is minimized or hidden
+        '''
+        self.refresh_job = None
+        if not self.engine.is_playing or not self.root.winfo_viewable():
+            return
+        current_pos = self.engine.get_position()
+        hours, mins, secs = self._get_track_len(current_pos)
+        self.var_progress.set(f'{hours}:{mins:02}:{secs:02}')
+        if not self.progress_bar_in_use:
+            self.sld_progress.set(100 * current_pos / self.engine.track_length)
+            self._draw_playhead(current_pos / self.engine.track_length)
+        # One slider pixel's worth of track, but at least once a second for the label and at most 20 times
+        per_pixel = self.engine.track_info['length'] / max(self.sld_progress.winfo_width(), 1)
+        self._schedule('refresh_job', min(max(per_pixel, 0.05), 1.0), self._refresh_progress)
+
+    def _on_track_end(self):
+        '''
+        Fires when the current track should be ending, moving on to the next one once the player confirms it
+        '''
+        self.end_job = None
+        if not self.engine.is_playing:
+            return
+        if not self.engine.track_ended():
+            # The length from the metadata can be slightly off, check again shortly
+            self._schedule('end_job', max(self.engine.time_to_transition(), 0.05), self._on_track_end)
+            return
+        self._stop_progress_updater()
+        hours, mins, secs = self._get_track_len(self.engine.track_length)
+        self.var_progress.set(f'{hours}:{mins:02}:{secs:02}')
+        self.sld_progress.set(100)
+        self._transition(1)
+
+    def _on_map(self, event):
+        '''
+        Helper function for resuming the progress display when the window is restored
+        '''
+        if event.widget is self.root and self.engine.is_playing and self.refresh_job is None:
+            self._refresh_progress()
 
     def _get_track_len(self, length):
         '''
@@ -863,11 +817,15 @@ class MusicBox:
         '''
         Helper function for fading track out and fading next track in
         '''
-        mixer.music.fadeout(self.fade.get())
-        mixer.music.unload()
         self.lb_tracks.selection_clear(0, END)
-        track = self.current_playlist.increment_queue(dir)
-        self.play_track(track)
+        self._stop_progress_updater()
+        try:
+            self.engine.next_track(dir)
+        except Exception as e:
+            messagebox.showerror('Error', e)
+            return
+        self._show_track()
+        self._start_progress_updater()
 
 
 # Playlists
@@ -893,75 +851,155 @@ class MusicBox:
         '''
         Deletes file
         '''
-        filename = self.playlist_all.get_track(name)
-        if self.track_name == name:
-            mixer.music.stop()
-            mixer.music.unload()
-            self.var_title.set('')
-            self.var_progress.set('0:00:00')
-            self.var_length.set('0:00:00')
-            self.sld_progress.set(0)
-            self.track_name = ''
-            self.filename = ''
-        self.playlist_all.remove_track(name)
-        playlists = self.tracks[filename].get_playlists()
-        for p_name in playlists:
-            playlist = self.playlists[playlist]
-            if filename in playlist.get_tracks():
-                playlist.remove_track(name)
-        del self.tracks[filename]
+        if self.engine.track_name == name:
+            self._clear_track()
+        self.engine.delete_track(name)
         self.change_playlist(None)
-        os.remove(f'{self.filepath}/{filename}')
         self.top.destroy()
 
+    def _clear_track(self):
+        '''
+        Helper function for emptying the playback frame once the current track is gone
+        '''
+        self._stop_progress_updater()
+        self.var_title.set('')
+        self.var_progress.set('0:00:00')
+        self.var_length.set('0:00:00')
+        self.sld_progress.set(0)
+        self._load_waveform(None)
+
+    def find_duplicates(self, event):
+        '''
+        Looks for tracks with the same audio in the background, then offers to merge them
+        '''
+        if self.finding_duplicates:
+            return
+        self.finding_duplicates = True
+        self.engine.find_duplicates()
+        self._wake_background()
+
+    def _poll_duplicates(self):
+        '''
+        Shows hashing progress, and the duplicates found once the engine has finished looking
+        '''
+        if not self.finding_duplicates:
+            return
+        groups = self.engine.poll_duplicates()
+        downloading = self.engine.is_downloading()
+        if groups is None:
+            if not downloading:
+                self.var_status.set(f'Looking for duplicates... ({self.engine.dedup.hashed}/{self.engine.dedup.total})')
+            return
+        self.finding_duplicates = False
+        if not downloading:
+            self.var_status.set(f'{len(groups)} duplicate track(s) found' if groups else 'No duplicates found')
+        if groups:
+            self.show_duplicates(groups)
+
+    def show_duplicates(self, groups):
+        '''
+        Lists groups of duplicate tracks, any of which can be merged into a single file
+        '''
+        self.dup_window = Toplevel(self.root)
+        self.dup_window.title('Duplicates')
+        self.dup_window.columnconfigure(0, weight=1)
+        self.dup_window.rowconfigure(0, weight=1)
+        self.dup_groups = groups
+        self.lb_duplicates = Listbox(self.dup_window, selectmode=EXTENDED, width=80, height=15)
+        for group in groups:
+            self.lb_duplicates.insert(END, ' = '.join(group))
+        frm_buttons = Frame(self.dup_window)
+        Button(frm_buttons, text='Merge Selected', command=lambda: self.merge_duplicates(self.lb_duplicates.curselection())).pack(side=LEFT, padx=5)
+        Button(frm_buttons, text='Merge All', command=lambda: self.merge_duplicates(range(len(self.dup_groups)))).pack(side=LEFT, padx=5)
+        Button(frm_buttons, text='Close', command=self.dup_window.destroy).pack(side=LEFT, padx=5)
+        self.lb_duplicates.grid(row=0, column=0, padx=10, pady=10, sticky='nsew')
+        frm_buttons.grid(row=1, column=0, padx=10, pady=10, sticky='e')
+
+    def merge_duplicates(self, indices):
+        '''
+        Merges each chosen group into the copy in the most playlists, deleting the other files
+        '''
+        playing = self.engine.track_name
+        for index in sorted(indices, reverse=True):
+            try:
+                self.engine.merge_duplicates(self.dup_groups[index])
+            except Exception as e:
+                messagebox.showerror('Error', e)
+                break
+            del self.dup_groups[index]
+            self.lb_duplicates.delete(index)
+        if playing and not self.engine.track_name:
+            self._clear_track()
+        self.change_playlist(None)
+        if not self.dup_groups:
+            self.dup_window.destroy()
+
     def change_playlist_kb(self, num):
         '''
         Change playlist using keyboard
         '''
         focus = self.root.focus_get()
-        if focus != self.cb_playlists and focus != self.ent_url:
-            playlists = list(self.playlists.keys())
+        if focus not in (self.cb_playlists, self.ent_url, self.ent_search):
+            playlists = list(self.engine.playlists.keys())
             if num == -1:
                 self.cb_playlists.set('All')
             else:
                 self.cb_playlists.set(playlists[num])
             self.change_playlist(None)
 
+    @instruments.timed('change_playlist')
     def change_playlist(self, event):
         '''
         Updates current playlist and list of tracks in playlist frame based on currently selected playlist
         '''
-        playlist = self.cb_playlists.get()
-        if playlist == 'All':
-            self.current_playlist = self.playlist_all
-        else:
-            self.current_playlist = self.playlists[playlist]
-        self.lb_tracks.delete(0, END)
-        track_names = self.current_playlist.get_queue()
-        for track in track_names:
-            self.lb_tracks.insert(END, track)
+        self.engine.set_current_playlist(self.cb_playlists.get())
+        self.search_tracks(None)
+
+    def search_tracks(self, event):
+        '''
+        Filters the list of tracks to those matching the search box, or shows the whole queue when it is empty
+        '''
+        query = self.var_search.get().strip()
+        # Only the visible rows are rebuilt, regardless of playlist size
+        with instruments.timer('track list rebuild'):
+            if query:
+                self.search_results = self.engine.search(query)
+                self.lb_tracks.set_items(self.search_results)
+            else:
+                self.search_results = None
+                self.lb_tracks.set_items(self.engine.current_playlist.get_queue())
 
     def edit_playlists(self, index):
         '''
         Updates which playlists a track is in based on the checkboxes. A bit redundant going over all of them
         '''
-        if self.track_name != '':
+        engine = self.engine
+        if engine.pending_track is not None:
+            # A download playing as it arrives can only be added to playlists once it is in the library
+            self.var_playlists[index].set(-index-1)
+            return
+        if engine.track_name != '':
             val = self.var_playlists[index].get()
-            playlists = list(self.playlists.keys())
+            playlists = list(engine.playlists.keys())
             if val >= 0:
-                self.playlists[playlists[val]].add_track(self.track_name, self.filename)
-                self.tracks[self.filename].add_to_playlist(self.playlists[playlists[val]].get_name())
-                if playlists[val] == self.current_playlist.get_name():
-                    self.lb_tracks.insert(END, self.track_name)
+                engine.add_to_playlist(playlists[val], engine.filename)
+                if playlists[val] == engine.current_playlist.get_name():
+                    if self.search_results is None:
+                        self.lb_tracks.refresh()
+                    else:
+                        self.search_tracks(None)
             else:
                 try:
-                    self.playlists[playlists[-val-1]].remove_track(self.track_name)
-                    self.tracks[self.filename].remove_from_playlist(self.playlists[playlists[-val-1]].get_name())
-                    if playlists[-val-1] == self.current_playlist.get_name():
-                        tracks = self.lb_tracks.get(0, END)
-                        for i, track in enumerate(tracks):
-                            if track == self.track_name:
-                                self.lb_tracks.delete(i)
+                    name = playlists[-val-1]
+                    index = engine.remove_from_playlist(name, engine.filename)
+                    if name == engine.current_playlist.get_name():
+                        if engine.current_playlist.get_shuffle_seed() is not None:
+                            # A shuffled order changes when a track is removed
+                            self.search_tracks(None)
+                        elif self.search_results is None:
+                            self.lb_tracks.item_removed(index)
+                        else:
+                            self.search_tracks(None)
                 except:
                     pass
 
@@ -969,31 +1007,23 @@ class MusicBox:
         '''
         Change playlist name based on Combobox
         '''
-        oldname = self.current_playlist.get_name()
+        oldname = self.engine.current_playlist.get_name()
         newname = self.cb_playlists.get()
-        if oldname == 'All':
-            messagebox.showerror('Error', '"All" playlist name cannot be changed.')
-            self.cb_playlists.set('All')
+        if newname == oldname:
             return
-        if newname in self.playlists.keys() or newname == 'All':
-            if newname == oldname:
-                return
-            messagebox.showerror('Error', 'Playlist name already in use.')
+        try:
+            self.engine.rename_playlist(oldname, newname)
+        except ValueError as e:
+            messagebox.showerror('Error', e)
             self.cb_playlists.set(oldname)
             return
-        self.playlists[oldname].set_name(newname)
-        self.playlists = {name if name != oldname else newname: playlist for name, playlist in self.playlists.items()}
-        self.current_playlist = self.playlists[newname]
-        for track in self.current_playlist.get_tracks():
-            self.tracks[track].remove_from_playlist(oldname)
-            self.tracks[track].add_to_playlist(newname)
         for var in self.var_playlists:
             if var.get() == oldname:
                 var.set(newname)
         for var in self.playlist_var_names:
             if var.get() == oldname:
                 var.set(newname)
-        self.cb_playlists['values'] = tuple([self.playlist_all.get_name()]) + tuple({name if name != oldname else newname: name for name in self.playlists.keys()})
+        self.cb_playlists['values'] = tuple([self.engine.playlist_all.get_name()]) + tuple(self.engine.playlists.keys())
         self.remove_focus(None)
 
 
@@ -1027,16 +1057,68 @@ class MusicBox:
         '''
         Closing function to save settings
         '''
-        self.__save_settings()
-        for fname in os.listdir(self.filepath):
-            if fname.endswith('.part'):
-                try:
-                    os.remove(os.path.join(self.filepath, fname))
-                except Exception as e:
-                    print(f'Error removing {fname}: {e}')
+        self._stop_progress_updater()
+        self.engine.close()
         # Now destroy the window
         self.root.destroy()
 
+    def show_debug_window(self, event):
+        '''
+        Opens a window with the hot path timers and counters, turning instrumentation on if it wasn't already
+        '''
+        if self.debug_window is not None:
+            self.debug_window.lift()
+            return
+        instruments.enable()
+        self.debug_window = Toplevel(self.root)
+        self.debug_window.title('Instrumentation')
+        self.debug_window.protocol('WM_DELETE_WINDOW', self._close_debug_window)
+        self.debug_window.columnconfigure(0, weight=1)
+        self.debug_window.rowconfigure(0, weight=1)
+
+        columns = ('count', 'mean', 'max', 'last')
+        self.tv_timers = Treeview(self.debug_window, columns=columns, height=10)
+        self.tv_timers.heading('#0', text='Timer')
+        for column in columns:
+            self.tv_timers.heading(column, text=column if column == 'count' else f'{column} (ms)')
+            self.tv_timers.column(column, width=80, anchor='e')
+        self.var_counters = StringVar()
+        frm_buttons = Frame(self.debug_window)
+        Button(frm_buttons, text='Reset', command=instruments.reset).pack(side=LEFT, padx=5)
+        btn_profile = Button(frm_buttons, text='Save profile', command=self._save_profile)
+        btn_profile.pack(side=LEFT, padx=5)
+        if instruments.profiler is None:
+            btn_profile.state(['disabled'])
+
+        self.tv_timers.grid(row=0, column=0, padx=10, pady=10, sticky='nsew')
+        Label(self.debug_window, textvariable=self.var_counters).grid(row=1, column=0, padx=10, sticky='w')
+        frm_buttons.grid(row=2, column=0, padx=10, pady=10, sticky='e')
+        self._refresh_debug_window()
+
+    def _refresh_debug_window(self):
+        '''
+        Helper function for redrawing the timers twice a second while the debug window is open
+        '''
+        timers, counters = instruments.snapshot()
+        self.tv_timers.delete(*self.tv_timers.get_children())
+        for name, stats in timers:
+            mean = stats['total'] / stats['count']
+            self.tv_timers.insert('', END, text=name, values=(stats['count'], f'{mean:.2f}', f'{stats["max"]:.2f}', f'{stats["last"]:.2f}'))
+        self.var_counters.set('   '.join(f'{name}: {value}' for name, value in sorted(counters.items())))
+        instruments.flush()
+        self.debug_job = self.root.after(500, self._refresh_debug_window)
+
+    def _close_debug_window(self):
+        self.root.after_cancel(self.debug_job)
+        self.debug_job = None
+        self.debug_window.destroy()
+        self.debug_window = None
+
+    def _save_profile(self):
+        path = instruments.dump_profile(os.path.join(self.engine.base_path, 'profile.prof'))
+        if path:
+            messagebox.showinfo('Profile', f'Saved to {path}')
+
     def _on_frame_configure(self, event):
         '''
         Limits scrollable area to just the playlists
@@ -1045,13 +1127,18 @@ class MusicBox:
 
 # Helper Functions
 
-    def clean_filename(self, file):
+    def _select_current(self):
         '''
-        Helper function for taking raw filename with ID and extension, and trimming to only name (based on yt_dlp default filename)
+        Helper function highlighting the current track, whether or not the list is filtered
         '''
-        index = file.index('[')
-        name = file[:index-1].replace('_', ' ')
-        return name
+        if self.engine.pending_track is not None:
+            self.lb_tracks.selection_clear()
+        elif self.search_results is None:
+            self.lb_tracks.selection_set(self.engine.current_playlist.get_queue_pos())
+        elif self.engine.track_name in self.search_results:
+            self.lb_tracks.selection_set(self.search_results.index(self.engine.track_name))
+        else:
+            self.lb_tracks.selection_clear()
 
     def _resource_path(self, relative_path):
         '''
@@ -1065,6 +1152,8 @@ class MusicBox:
 
 
 if __name__ == '__main__':
+    # Required for the indexer's process pool in the PyInstaller executable
+    multiprocessing.freeze_support()
     try:
         root = Tk()
         MusicBox(root)
@@ -0,0 +1,614 @@
+import io
+import time
+import queue
+import platform
+import shutil
+import threading
+from collections import deque
+import subprocess
+import pygame
+from pygame import mixer
+from streaming import GrowingFile
+from processes import popen
+
+# ffmpeg raw sample formats matching the sizes pygame.mixer can be initialized with
+SAMPLE_FORMATS = {8: 'u8', -8: 's8', 16: 'u16le', -16: 's16le', 32: 'f32le'}
+END_EVENT = pygame.USEREVENT + 1
+
+class PlaybackClock:
+    def __init__(self):
+        '''
+        Position in the current track, from the mixer's count of audio delivered since the track
+        started playing, offset by the last seek. Unlike wall-clock time it stops while paused
+        and can't drift over a long session
+        '''
+        self.offset = 0.0
+        self.base = 0
+
+    def reset(self, offset=0.0, base=0):
+        self.offset = offset
+        self.base = base
+
+    def position(self, delivered_ms):
+        return self.offset + max(0, delivered_ms - self.base) / 1000
+
+class _OffsetFile:
+    def __init__(self, source, start):
+        '''
+        Read-only view of an MP3 file or in-memory file from a frame boundary onwards,
+        so the decoder starts there as if it were the beginning of the file
+        '''
+        self.file = open(source, 'rb') if isinstance(source, str) else source
+        self.owned = isinstance(source, str)
+        self.start = start
+        self.file.seek(start)
+
+    def read(self, size=-1):
+        return self.file.read(size)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            offset += self.start
+        return self.file.seek(offset, whence) - self.start
+
+    def tell(self):
+        return self.file.tell() - self.start
+
+    def close(self):
+        if self.owned:
+            self.file.close()
+
+class MusicPlayer:
+    def __init__(self):
+        '''
+        Plays tracks through pygame.mixer.music, which holds a single stream.
+        A transition fades the old track out before the new one fades in
+        '''
+        self.crossfades = False
+        self.clock = PlaybackClock()
+        self.volume = 1.0
+        self.gain = 1.0
+        self.source = None
+        self.seek_index = None
+        self.stream = None # The source opened part way through by the last seek
+        self.paused = False
+        # pygame's event queue needs its video subsystem, which conflicts with Tk on macOS.
+        # Without it the end of a track is detected by mixer.music no longer being busy
+        self.end_events = False
+        if platform.system() != 'Darwin':
+            try:
+                pygame.display.init()
+                mixer.music.set_endevent(END_EVENT)
+                self.end_events = True
+            except pygame.error:
+                pass
+
+    def load(self, source):
+        self._close_stream()
+        self.source = source
+        self.seek_index = None
+        mixer.music.load(source, 'mp3')
+
+    def set_seek_index(self, source, index):
+        # Indexes are built in the background, so one for a track that has since been replaced is ignored
+        if source is self.source:
+            self.seek_index = index
+
+    def _close_stream(self):
+        if self.stream:
+            mixer.music.unload()
+            self.stream.close()
+            self.stream = None
+
+    def _reopen(self, offset):
+        # Restart decoding at a frame boundary, keeping the track paused if it was
+        paused = self.paused
+        mixer.music.stop()
+        self._close_stream()
+        if isinstance(self.source, io.BytesIO) or offset:
+            self.stream = _OffsetFile(self.source, offset)
+            mixer.music.load(self.stream, 'mp3')
+        else:
+            mixer.music.load(self.source, 'mp3')
+        self.play()
+        if paused:
+            self.pause()
+
+    def play(self, fade_ms=0):
+        # Stopping or fading out the last track also posts the end event
+        if self.end_events:
+            pygame.event.clear(END_EVENT)
+        mixer.music.play(fade_ms=fade_ms)
+        self.paused = False
+        self.clock.reset()
+
+    def crossfade(self, source, fade_ms):
+        mixer.music.fadeout(fade_ms)
+        mixer.music.unload()
+        self.load(source)
+        self.play(fade_ms)
+
+    def swap(self, source):
+        # Carry on from the same position in another file with the same audio
+        position = self.get_pos()
+        paused = self.paused
+        mixer.music.stop()
+        self.load(source)
+        self.play()
+        self.seek(position)
+        if paused:
+            self.pause()
+
+    def pause(self):
+        mixer.music.pause()
+        self.paused = True
+
+    def unpause(self):
+        mixer.music.unpause()
+        self.paused = False
+
+    def stop(self):
+        mixer.music.stop()
+
+    def unload(self):
+        mixer.music.unload()
+        self._close_stream()
+        self.source = None
+        self.seek_index = None
+
+    def rewind(self):
+        if self.stream and self.stream.start:
+            self._reopen(0)
+        else:
+            mixer.music.rewind()
+        self.clock.reset(0.0, max(mixer.music.get_pos(), 0))
+
+    def set_pos(self, seconds):
+        mixer.music.set_pos(seconds)
+        self.clock.reset(seconds, max(mixer.music.get_pos(), 0))
+
+    def seek(self, seconds):
+        # With a seek index, decoding restarts at the frame just before the position, and only the
+        # remainder is skipped by the decoder. Without one, MP3 positions are only absolute from the start
+        if self.seek_index is None or self.source is None:
+            self.rewind()
+            self.set_pos(seconds)
+            return
+        frame_time, offset = self.seek_index.lookup(seconds)
+        self._reopen(offset)
+        if seconds > frame_time:
+            mixer.music.set_pos(seconds - frame_time)
+        self.clock.reset(seconds, max(mixer.music.get_pos(), 0))
+
+    def get_pos(self):
+        '''
+        Seconds into the current track
+        '''
+        delivered = mixer.music.get_pos()
+        if delivered < 0:
+            return self.clock.offset
+        return self.clock.position(delivered)
+
+    def set_volume(self, volume):
+        self.volume = volume
+        mixer.music.set_volume(min(1.0, volume * self.gain))
+
+    def set_gain(self, gain):
+        # Loudness correction for the track about to be loaded, on top of the volume. The mixer can't go past full volume
+        self.gain = gain
+        self.set_volume(self.volume)
+
+    def get_busy(self):
+        return mixer.music.get_busy()
+
+    def has_ended(self):
+        '''
+        Whether the playing track has reached its end. Only meaningful while not paused
+        '''
+        if self.end_events:
+            return bool(pygame.event.get(END_EVENT))
+        return not mixer.music.get_busy()
+
+    def fadeout(self, fade_ms):
+        mixer.music.fadeout(fade_ms)
+
+    def close(self):
+        mixer.music.unload()
+        self._close_stream()
+
+class _Stream:
+    def __init__(self, source, channel, start, frame_bytes, chunk_frames, sample_format, frequency, channels, offset=None):
+        '''
+        One track decoded by an ffmpeg subprocess in fixed-size chunks and fed to a mixer Channel,
+        so only a couple of chunks are ever held in memory. offset is the (time, byte offset) of the
+        frame to start decoding from, if the track has a seek index. A GrowingFile is copied to ffmpeg
+        as it downloads. ffmpeg is started and its decoded chunks are collected on a thread of the stream's own,
+        so a slow start, a slow disk or waiting for more of a download never holds up the feed thread
+        '''
+        self.source = source
+        self.channel = channel
+        self.start = start
+        self.frames_read = 0
+        # Queued chunks as (sound, first frame, frames), and the chunk playing with the time it started
+        self.pending = deque()
+        self.playing = None
+        self.frame_bytes = frame_bytes
+        self.chunk_bytes = chunk_frames * frame_bytes
+        self.frequency = frequency
+        self.volume = 1.0 # Fade envelope, scaled by the player's volume and the track's loudness gain
+        self.gain = 1.0
+        self.fade = None
+        self.eof = False
+        self.paused = False
+        self.stop_after_fade = False
+        self.skip_bytes = 0
+        self.reader = None
+        self.chunks = queue.Queue(maxsize=2)
+        self.process = None
+        self.closed = False
+        cmd = ['ffmpeg', '-v', 'error']
+        if isinstance(source, str):
+            cmd.append('-nostdin')
+        if offset:
+            # Start at the indexed frame, and decode and drop the rest of the way, which is exact
+            frame_time, self.skip_bytes = offset
+            if isinstance(source, str):
+                cmd += ['-skip_initial_bytes', str(self.skip_bytes)]
+            cmd += ['-i', source if isinstance(source, str) else 'pipe:0']
+            if start > frame_time:
+                cmd += ['-ss', f'{start - frame_time:.3f}']
+        else:
+            # Without an index ffmpeg estimates where to start from the bitrate, which drifts in VBR files
+            if start:
+                cmd += ['-ss', f'{start:.3f}']
+            cmd += ['-i', source if isinstance(source, str) else 'pipe:0']
+        cmd += ['-f', sample_format, '-ac', str(channels), '-ar', str(frequency), 'pipe:1']
+        if isinstance(source, GrowingFile):
+            self.reader = source.open()
+        threading.Thread(target=self._decode, args=(cmd,), daemon=True).start()
+
+    def _feed_stdin(self):
+        try:
+            if self.reader is None:
+                with self.source.getbuffer() as view:
+                    self.process.stdin.write(view[self.skip_bytes:])
+            else:
+                while True:
+                    data = self.reader.read()
+                    if not data:
+                        break
+                    self.process.stdin.write(data)
+            self.process.stdin.close()
+        except (OSError, ValueError):
+            pass
+
+    def _decode(self, cmd):
+        # Starts ffmpeg and hands its decoded chunks to read_chunk, an empty one once it is done
+        try:
+            self.process = popen(cmd, stdin=None if isinstance(self.source, str) else subprocess.PIPE,
+                                 stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        except OSError:
+            self.chunks.put(b'')
+            return
+        if self.closed:
+            # Closed while ffmpeg was starting
+            self.process.kill()
+            return
+        if not isinstance(self.source, str):
+            threading.Thread(target=self._feed_stdin, daemon=True).start()
+        try:
+            while not self.closed:
+                try:
+                    data = self.process.stdout.read(self.chunk_bytes)
+                except (OSError, ValueError):
+                    data = b''
+                while not self.closed:
+                    try:
+                        self.chunks.put(data, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if not data:
+                    return
+        finally:
+            self.process.stdout.close()
+
+    def read_chunk(self):
+        # Never waits on ffmpeg, a chunk that isn't decoded yet is tried again on the next pass
+        try:
+            data = self.chunks.get_nowait()
+        except queue.Empty:
+            return None
+        data = data[:len(data) - len(data) % self.frame_bytes]
+        if not data:
+            self.eof = True
+            return None
+        sound = mixer.Sound(buffer=data)
+        frames = len(data) // self.frame_bytes
+        self.pending.append((sound, self.frames_read, frames))
+        self.frames_read += frames
+        return sound
+
+    def update_playing(self):
+        # Note when the channel moves on to the next queued chunk
+        sound = self.channel.get_sound()
+        if sound is None or (self.playing and self.playing[0] is sound):
+            return
+        while self.pending and self.pending[0][0] is not sound:
+            self.pending.popleft()
+        if self.pending:
+            self.playing = self.pending[0] + (time.perf_counter(),)
+
+    def position(self):
+        '''
+        Seconds into the track: the first frame of the chunk being played, plus how far into it the
+        channel has got. The estimate within a chunk is capped at its length, so errors can't accumulate
+        '''
+        if self.playing is None:
+            return self.start
+        if self.is_finished():
+            return self.start + self.frames_read / self.frequency
+        sound, first, frames, started = self.playing
+        elapsed = (self.paused or time.perf_counter()) - started
+        return self.start + (first + min(elapsed * self.frequency, frames)) / self.frequency
+
+    def pause(self):
+        self.paused = time.perf_counter()
+        self.channel.pause()
+
+    def unpause(self):
+        # Fades and the position within a chunk are timed by the clock, so they are pushed back by however long the stream was paused
+        if self.paused and self.fade:
+            start, duration, begin, end = self.fade
+            self.fade = (start + time.perf_counter() - self.paused, duration, begin, end)
+        if self.paused and self.playing:
+            sound, first, frames, started = self.playing
+            self.playing = (sound, first, frames, started + time.perf_counter() - self.paused)
+        self.paused = False
+        self.channel.unpause()
+
+    def fade_to(self, volume, fade_ms, stop=False):
+        self.fade = (time.perf_counter(), max(fade_ms, 1) / 1000, self.volume, volume)
+        self.stop_after_fade = stop
+
+    def update_volume(self, master):
+        # Follow the fade envelope, returning False once a fade-out has finished
+        if self.fade:
+            start, duration, begin, end = self.fade
+            progress = min(1.0, (time.perf_counter() - start) / duration)
+            self.volume = begin + (end - begin) * progress
+            if progress >= 1.0:
+                self.fade = None
+                if self.stop_after_fade:
+                    return False
+        self.channel.set_volume(min(1.0, self.volume * master * self.gain))
+        return True
+
+    def is_finished(self):
+        return self.eof and not self.channel.get_busy()
+
+    def close(self):
+        self.closed = True
+        if self.reader is not None:
+            self.reader.close()
+        self.channel.stop()
+        process = self.process
+        if process is not None and process.poll() is None:
+            process.kill()
+
+class CrossfadePlayer:
+    def __init__(self, chunk_seconds=0.25):
+        '''
+        Plays tracks on two reserved mixer Channels, decoding them in chunks with ffmpeg,
+        so the outgoing and incoming tracks overlap for the whole fade instead of dipping in between
+        '''
+        self.crossfades = True
+        frequency, size, channels = mixer.get_init()
+        self.frequency = frequency
+        self.channels = channels
+        self.sample_format = SAMPLE_FORMATS[size]
+        self.frame_bytes = abs(size) // 8 * channels
+        self.chunk_frames = int(frequency * chunk_seconds)
+        self.chunk_seconds = chunk_seconds
+        mixer.set_reserved(2)
+        self.mixer_channels = [mixer.Channel(0), mixer.Channel(1)]
+        self.volume = 1.0
+        self.gain = 1.0
+        self.source = None
+        self.seek_index = None
+        self.current = None
+        self.outgoing = []
+        self.paused = False
+        self.lock = threading.Lock()
+        self.running = True
+        self.thread = threading.Thread(target=self._feed_thread, daemon=True)
+        self.thread.start()
+
+    @staticmethod
+    def is_available():
+        return shutil.which('ffmpeg') is not None
+
+    def _free_channel(self):
+        # Use whichever channel isn't playing, cutting short the oldest fade-out if both are
+        in_use = [stream.channel for stream in self._streams()]
+        for channel in self.mixer_channels:
+            if channel not in in_use:
+                return channel
+        oldest = self.outgoing.pop(0)
+        oldest.close()
+        return oldest.channel
+
+    def _open(self, start, fade_ms=0):
+        channel = self._free_channel()
+        # Streams only read a prefetched BytesIO through its buffer, so they all share it rather than copying it
+        source = self.source
+        offset = self.seek_index.lookup(start) if start and self.seek_index else None
+        stream = _Stream(source, channel, start, self.frame_bytes, self.chunk_frames, self.sample_format, self.frequency, self.channels, offset)
+        stream.gain = self.gain
+        if fade_ms:
+            stream.volume = 0.0
+            stream.fade_to(1.0, fade_ms)
+        stream.update_volume(self.volume)
+        return stream
+
+    def _streams(self):
+        return ([self.current] if self.current else []) + self.outgoing
+
+    def _feed_thread(self):
+        '''
+        Keeps each playing Channel's queue topped up with the next decoded chunk and applies fades
+        '''
+        while self.running:
+            with self.lock:
+                for stream in self._streams():
+                    if stream.paused:
+                        continue
+                    if not stream.update_volume(self.volume):
+                        stream.close()
+                        self.outgoing.remove(stream)
+                        continue
+                    if not stream.eof and stream.channel.get_queue() is None:
+                        sound = stream.read_chunk()
+                        if sound is not None:
+                            if stream.channel.get_busy():
+                                stream.channel.queue(sound)
+                            else:
+                                stream.channel.play(sound)
+                    stream.update_playing()
+                    if stream in self.outgoing and stream.is_finished():
+                        stream.close()
+                        self.outgoing.remove(stream)
+            time.sleep(self.chunk_seconds / 10)
+
+    def load(self, source):
+        with self.lock:
+            self._close_current()
+            self.source = source
+            self.seek_index = None
+
+    def set_seek_index(self, source, index):
+        # Indexes are built in the background, so one for a track that has since been replaced is ignored
+        with self.lock:
+            if source is self.source:
+                self.seek_index = index
+
+    def play(self, fade_ms=0):
+        with self.lock:
+            self._close_current()
+            self.current = self._open(0, fade_ms)
+            self.paused = False
+
+    def crossfade(self, source, fade_ms):
+        # The current track keeps playing while it fades out, on its own channel
+        with self.lock:
+            if self.current:
+                self.current.fade_to(0.0, fade_ms, stop=True)
+                self.outgoing.append(self.current)
+                self.current = None
+            self.source = source
+            self.seek_index = None
+            self.current = self._open(0, fade_ms)
+            self.paused = False
+
+    def _close_current(self):
+        if self.current:
+            self.current.close()
+            self.current = None
+
+    def pause(self):
+        with self.lock:
+            self.paused = True
+            for stream in self._streams():
+                stream.pause()
+
+    def unpause(self):
+        with self.lock:
+            self.paused = False
+            for stream in self._streams():
+                stream.unpause()
+
+    def stop(self):
+        with self.lock:
+            self._close_current()
+            for stream in self.outgoing:
+                stream.close()
+            self.outgoing = []
+
+    def unload(self):
+        self.stop()
+        self.source = None
+        self.seek_index = None
+
+    def rewind(self):
+        # A track that was just started is already at the beginning, so there is no need to restart ffmpeg
+        with self.lock:
+            if self.current and self.current.start == 0 and self.current.frames_read == 0:
+                return
+        self.set_pos(0)
+
+    def set_pos(self, seconds):
+        # Restart decoding at the new position, ffmpeg seeks within the file itself.
+        # A fade in progress carries over to the new stream
+        with self.lock:
+            if self.source is None:
+                return
+            previous = self.current
+            self._close_current()
+            stream = self._open(seconds)
+            if previous:
+                stream.volume = previous.volume
+                stream.gain = previous.gain
+                stream.fade = previous.fade
+            stream.update_volume(self.volume)
+            if self.paused:
+                stream.pause()
+            self.current = stream
+
+    def seek(self, seconds):
+        self.set_pos(seconds)
+
+    def swap(self, source):
+        # Carry on from the same position in another file with the same audio, e.g. a finished download
+        # replacing the one that was played while it arrived
+        position = self.get_pos()
+        with self.lock:
+            self.source = source
+            self.seek_index = None
+        self.set_pos(position)
+
+    def get_pos(self):
+        '''
+        Seconds into the current track, counted from the decoded frames the channel has played
+        '''
+        with self.lock:
+            if self.current is None:
+                return 0.0
+            self.current.update_playing()
+            return self.current.position()
+
+    def set_volume(self, volume):
+        self.volume = volume
+
+    def set_gain(self, gain):
+        # Applies to tracks loaded from now on, a track fading out keeps its own
+        self.gain = gain
+
+    def get_busy(self):
+        # Like mixer.music.get_busy, False while paused or once the track has finished
+        with self.lock:
+            return bool(self.current) and not self.paused and not self.current.is_finished()
+
+    def has_ended(self):
+        with self.lock:
+            return self.current is None or self.current.is_finished()
+
+    def fadeout(self, fade_ms):
+        with self.lock:
+            if self.current:
+                self.current.fade_to(0.0, fade_ms, stop=True)
+                self.outgoing.append(self.current)
+                self.current = None
+
+    def close(self):
+        self.running = False
+        self.stop()
@@ -0,0 +1,75 @@
+import io
+import os
+import threading
+from metadata import read_metadata
+
+class Prefetcher:
+    def __init__(self, filepath, metadata, max_bytes=64 * 1024 * 1024):
+        '''
+        Reads the next track's metadata and file contents on a background thread, so the transition
+        to it needs no file I/O or mutagen parsing on the UI thread. Files larger than max_bytes are
+        only read through once to warm the OS cache rather than kept in memory
+        '''
+        self.filepath = filepath
+        self.metadata = metadata
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.filename = None
+        self.ready = None
+        self.thread = None
+
+    def prefetch(self, filename):
+        # Start loading a file, unless it is already loaded or loading
+        with self.lock:
+            if filename == self.filename:
+                return
+            self.filename = filename
+            self.ready = None
+        self.thread = threading.Thread(target=self._prefetch_thread, args=(filename,), daemon=True)
+        self.thread.start()
+
+    def _prefetch_thread(self, filename):
+        path = os.path.join(self.filepath, filename)
+        try:
+            stat = os.stat(path)
+            # The cache is only read here, new metadata is stored by the main thread in take()
+            if self.metadata.is_fresh(filename, stat.st_mtime, stat.st_size):
+                info = None
+            else:
+                info = read_metadata(path)
+            with open(path, 'rb') as audio_file:
+                if stat.st_size <= self.max_bytes:
+                    data = audio_file.read()
+                else:
+                    while audio_file.read(1024 * 1024):
+                        pass
+                    data = None
+        except Exception as e:
+            print(f'Error prefetching {filename}: {e}')
+            return
+        with self.lock:
+            if self.filename == filename:
+                self.ready = (stat.st_mtime, stat.st_size, info, data)
+
+    def take(self, filename):
+        '''
+        Returns (metadata, audio source) for a prefetched file, or None if it wasn't prefetched or isn't ready yet.
+        The audio source is an in-memory file when the contents were kept, otherwise the path
+        '''
+        with self.lock:
+            if filename != self.filename or self.ready is None:
+                return None
+            mtime, size, info, data = self.ready
+            self.filename = None
+            self.ready = None
+        if info is not None:
+            self.metadata.put(filename, mtime, size, info)
+        source = io.BytesIO(data) if data is not None else os.path.join(self.filepath, filename)
+        if filename not in self.metadata.entries:
+            return None
+        return self.metadata.entries[filename], source
+
+    def clear(self):
+        with self.lock:
+            self.filename = None
+            self.ready = None
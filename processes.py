@@ -0,0 +1,17 @@
+import sys
+import subprocess
+
+# The windowed PyInstaller build has no console, so on Windows every ffmpeg started from it would open one
+CREATION_FLAGS = subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
+
+def popen(cmd, **kwargs):
+    '''
+    subprocess.Popen for helper programs such as ffmpeg, without a console window
+    '''
+    return subprocess.Popen(cmd, creationflags=CREATION_FLAGS, **kwargs)
+
+def run(cmd, **kwargs):
+    '''
+    subprocess.run for helper programs such as ffmpeg, without a console window
+    '''
+    return subprocess.run(cmd, creationflags=CREATION_FLAGS, **kwargs)
@@ -0,0 +1,138 @@
+import re
+from bisect import bisect_left
+
+TOKEN_PATTERN = re.compile(r'\w+')
+MIN_SUBSTRING_LENGTH = 2 # Shorter query words match anywhere only next to a longer word, since nearly every track contains them
+
+def normalize(text):
+    return ' '.join(TOKEN_PATTERN.findall(text.lower()))
+
+def trigrams(word):
+    padded = f' {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class SearchIndex:
+    def __init__(self):
+        '''
+        Incremental index over track names (and tags) answering prefix, substring and fuzzy queries.
+        Tracks are indexed by word, and the much smaller vocabulary of words is what gets searched:
+        kept sorted for prefix lookups, and indexed by trigrams for fuzzy matching
+        '''
+        self.texts = {}
+        self.words = {}
+        self.sorted_words = []
+        self.grams = {}
+        self.blob = None
+
+    def add(self, key, text):
+        if key in self.texts:
+            self.remove(key)
+        text = normalize(text)
+        self.texts[key] = text
+        for word in set(text.split()):
+            if word not in self.words:
+                self.words[word] = set()
+                self.sorted_words.insert(bisect_left(self.sorted_words, word), word)
+                self.blob = None
+                for gram in trigrams(word):
+                    self.grams.setdefault(gram, set()).add(word)
+            self.words[word].add(key)
+
+    def remove(self, key):
+        text = self.texts.pop(key, None)
+        if text is None:
+            return
+        for word in set(text.split()):
+            keys = self.words[word]
+            keys.discard(key)
+            if not keys:
+                del self.words[word]
+                del self.sorted_words[bisect_left(self.sorted_words, word)]
+                self.blob = None
+                for gram in trigrams(word):
+                    self.grams[gram].discard(word)
+                    if not self.grams[gram]:
+                        del self.grams[gram]
+
+    def __len__(self):
+        return len(self.texts)
+
+    def _keys(self, words):
+        keys = set()
+        for word in words:
+            keys |= self.words[word]
+        return keys
+
+    def _prefix_words(self, prefix):
+        i = bisect_left(self.sorted_words, prefix)
+        j = i
+        while j < len(self.sorted_words) and self.sorted_words[j].startswith(prefix):
+            j += 1
+        return self.sorted_words[i:j]
+
+    def _substring_words(self, word):
+        # Vocabulary words containing the given word, found with str.find over the whole vocabulary at once
+        if self.blob is None:
+            self.blob = '\n' + '\n'.join(self.sorted_words) + '\n'
+        words = []
+        i = self.blob.find(word)
+        while i != -1:
+            start = self.blob.rfind('\n', 0, i) + 1
+            end = self.blob.find('\n', i)
+            words.append(self.blob[start:end])
+            i = self.blob.find(word, end)
+        return words
+
+    def _fuzzy_words(self, word, threshold):
+        # Vocabulary words sharing enough trigrams with the given word (Dice coefficient), with their scores
+        word_grams = trigrams(word)
+        counts = {}
+        for gram in word_grams:
+            for candidate in self.grams.get(gram, ()):
+                counts[candidate] = counts.get(candidate, 0) + 1
+        scores = {}
+        for candidate, shared in counts.items():
+            # A padded word of length n has n trigrams
+            score = 2 * shared / (len(word_grams) + len(candidate))
+            if score >= threshold:
+                scores[candidate] = score
+        return scores
+
+    def search(self, query, fuzzy_threshold=0.35):
+        '''
+        Returns matching keys, best first: every query word matched as a word prefix,
+        then the query as a substring, then fuzzy matches on each word if nothing matched exactly
+        '''
+        query = normalize(query)
+        if not query:
+            return list(self.texts)
+        query_words = query.split()
+
+        prefix = []
+        substring = []
+        for word in query_words:
+            prefix.append(self._keys(self._prefix_words(word)))
+            # Short words are left to the check on the whole query below rather than narrowing the candidates
+            if len(word) >= MIN_SUBSTRING_LENGTH:
+                substring.append(self._keys(self._substring_words(word)))
+        # Intersecting from the smallest set keeps each step no bigger than the result
+        prefix = set.intersection(*sorted(prefix, key=len))
+        substring = set.intersection(*sorted(substring, key=len)) - prefix if substring else set()
+        if len(query_words) > 1:
+            # Words containing each query word narrow the candidates, then the whole query has to appear in the text
+            substring = {key for key in substring if query in self.texts[key]}
+        results = sorted(prefix, key=self.texts.get) + sorted(substring, key=self.texts.get)
+        if results:
+            return results
+
+        scores = None
+        for word in query_words:
+            word_scores = {}
+            for candidate, score in self._fuzzy_words(word, fuzzy_threshold).items():
+                for key in self.words[candidate]:
+                    word_scores[key] = max(word_scores.get(key, 0), score)
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {key: scores[key] + score for key, score in word_scores.items() if key in scores}
+        return [key for _, _, key in sorted((-score, self.texts[key], key) for key, score in scores.items())]
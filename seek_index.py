@@ -0,0 +1,249 @@
+import os
+import mmap
+import struct
+import threading
+from array import array
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from metadata import id3v2_size
+from settings_store import atomic_write
+
+# MPEG audio Layer III tables, indexed by the version bits of the frame header (0: MPEG 2.5, 2: MPEG 2, 3: MPEG 1)
+BITRATES = {
+    3: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    0: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+INDEX_HEADER = struct.Struct('<4sIdQ') # Magic, entry count, and the mtime and size of the file it was built from
+MAGIC = b'SEK1'
+
+def parse_header(data, pos):
+    '''
+    (frame length, samples, sample rate) of the Layer III frame header at pos, or None if there isn't one
+    '''
+    if pos + 4 > len(data) or data[pos] != 0xFF or data[pos + 1] & 0xE0 != 0xE0:
+        return None
+    version = data[pos + 1] >> 3 & 3
+    layer = data[pos + 1] >> 1 & 3
+    bitrate_index = data[pos + 2] >> 4
+    rate_index = data[pos + 2] >> 2 & 3
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    bitrate = BITRATES[version][bitrate_index] * 1000
+    sample_rate = SAMPLE_RATES[version][rate_index]
+    padding = data[pos + 2] >> 1 & 1
+    if version == 3:
+        return 144 * bitrate // sample_rate + padding, 1152, sample_rate
+    return 72 * bitrate // sample_rate + padding, 576, sample_rate
+
+def find_frame(data, pos, limit=64 * 1024):
+    '''
+    Position of the next frame header at or after pos that is followed by another, so stray 0xFF bytes aren't taken for one
+    '''
+    end = min(len(data), pos + limit)
+    while pos < end:
+        pos = data.find(b'\xff', pos, end)
+        if pos < 0:
+            return None
+        header = parse_header(data, pos)
+        if header and (pos + header[0] >= len(data) or parse_header(data, pos + header[0])):
+            return pos
+        pos += 1
+    return None
+
+def _info_frame(data, pos):
+    # Offset of a Xing/Info or VBRI tag in the first frame. Such a frame holds no audio
+    mono = data[pos + 3] >> 6 == 3
+    mpeg1 = data[pos + 1] >> 3 & 3 == 3
+    xing = pos + (4 + (17 if mono else 32) if mpeg1 else 4 + (9 if mono else 17))
+    if data[xing:xing + 4] in (b'Xing', b'Info'):
+        return 'xing', xing
+    if data[pos + 36:pos + 40] == b'VBRI':
+        return 'vbri', pos + 36
+    return None, None
+
+class SeekIndex:
+    def __init__(self, times, offsets):
+        '''
+        Table from times in a track, in seconds, to the byte offsets of the frames starting at them
+        '''
+        self.times = array('d', times)
+        self.offsets = array('Q', offsets)
+
+    def __len__(self):
+        return len(self.times)
+
+    def lookup(self, seconds):
+        '''
+        (time, offset) of the last indexed frame at or before seconds
+        '''
+        i = max(0, bisect_right(self.times, seconds) - 1)
+        return self.times[i], self.offsets[i]
+
+    def save(self, path, mtime, size):
+        with atomic_write(path, 'wb') as index_file:
+            index_file.write(INDEX_HEADER.pack(MAGIC, len(self.times), mtime, size))
+            self.times.tofile(index_file)
+            self.offsets.tofile(index_file)
+
+    @staticmethod
+    def load(path, mtime, size):
+        # Returns None if there is no index or it was built from a different version of the file
+        try:
+            with open(path, 'rb') as index_file:
+                magic, count, index_mtime, index_size = INDEX_HEADER.unpack(index_file.read(INDEX_HEADER.size))
+                if magic != MAGIC or index_mtime != mtime or index_size != size:
+                    return None
+                index = SeekIndex((), ())
+                index.times.fromfile(index_file, count)
+                index.offsets.fromfile(index_file, count)
+                return index
+        except (OSError, struct.error, EOFError):
+            return None
+
+def walk_frames(data, step):
+    '''
+    Index every frame header from the start of the audio, recording one frame per step seconds
+    '''
+    pos = find_frame(data, id3v2_size(data))
+    if pos is None:
+        return None
+    times, offsets = [], []
+    if _info_frame(data, pos)[0]:
+        pos += parse_header(data, pos)[0]
+    samples = 0
+    sample_rate = None
+    next_mark = 0.0
+    while pos is not None and pos < len(data):
+        header = parse_header(data, pos)
+        if header is None:
+            # Skip over junk, such as a broken frame or an ID3v1 tag
+            pos = find_frame(data, pos + 1)
+            continue
+        length, frame_samples, sample_rate = header
+        seconds = samples / sample_rate
+        if seconds >= next_mark:
+            times.append(seconds)
+            offsets.append(pos)
+            next_mark += step
+        samples += frame_samples
+        pos += length
+    return SeekIndex(times, offsets) if times else None
+
+def read_toc(data):
+    '''
+    Index from the Xing or VBRI table of contents written by the encoder, for files whose frames can't be walked.
+    A Xing table only has 100 entries of 1/256 of the file each, so it is much coarser than walking the frames
+    '''
+    pos = find_frame(data, id3v2_size(data))
+    if pos is None:
+        return None
+    _, samples, sample_rate = parse_header(data, pos)
+    kind, tag = _info_frame(data, pos)
+    if kind == 'xing':
+        flags = int.from_bytes(data[tag + 4:tag + 8], 'big')
+        if flags & 7 != 7:
+            return None
+        frames = int.from_bytes(data[tag + 8:tag + 12], 'big')
+        total = int.from_bytes(data[tag + 12:tag + 16], 'big')
+        duration = frames * samples / sample_rate
+        toc = data[tag + 16:tag + 116]
+        return SeekIndex([duration * i / 100 for i in range(100)], [pos + toc[i] * total // 256 for i in range(100)])
+    if kind == 'vbri':
+        count, scale, entry_size, frames_per_entry = struct.unpack('>HHHH', data[tag + 18:tag + 26])
+        times, offsets = [0.0], [pos]
+        offset = pos
+        for i in range(count):
+            start = tag + 26 + i * entry_size
+            offset += int.from_bytes(data[start:start + entry_size], 'big') * scale
+            times.append((i + 1) * frames_per_entry * samples / sample_rate)
+            offsets.append(offset)
+        return SeekIndex(times, offsets)
+    return None
+
+def build_seek_index(path, step=0.5):
+    '''
+    Build a seek index for an MP3 file by walking its frame headers through mmap, or from its table of contents
+    '''
+    with open(path, 'rb') as audio_file:
+        if os.fstat(audio_file.fileno()).st_size == 0:
+            return None
+        with mmap.mmap(audio_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return walk_frames(data, step) or read_toc(data)
+
+class SeekIndexCache:
+    def __init__(self, cache_path, filepath):
+        '''
+        Seek indexes of library tracks, one small binary file per track, rebuilt when a file changes.
+        Missing ones are built one at a time on a background thread
+        '''
+        self.cache_path = cache_path
+        self.filepath = filepath
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.lock = threading.Lock()
+        self.building = set()
+        if not os.path.exists(cache_path):
+            os.makedirs(cache_path)
+
+    def _index_path(self, filename):
+        return os.path.join(self.cache_path, filename + '.seek')
+
+    def load(self, filename):
+        # Only reads an index that has already been built, which is quick enough for the UI thread
+        try:
+            stat = os.stat(os.path.join(self.filepath, filename))
+        except OSError:
+            return None
+        return SeekIndex.load(self._index_path(filename), stat.st_mtime, stat.st_size)
+
+    def get(self, filename):
+        '''
+        Load the index of a track, building and saving it if it is missing or out of date
+        '''
+        index = self.load(filename)
+        if index is not None:
+            return index
+        path = os.path.join(self.filepath, filename)
+        stat = os.stat(path)
+        index = build_seek_index(path)
+        if index is not None:
+            index.save(self._index_path(filename), stat.st_mtime, stat.st_size)
+        return index
+
+    def request(self, filename, callback):
+        '''
+        Build a track's index in the background, unless it is already being built, calling callback with it once done
+        '''
+        with self.lock:
+            if filename in self.building:
+                return
+            self.building.add(filename)
+        self.executor.submit(self._build, filename, callback)
+
+    def _build(self, filename, callback):
+        try:
+            index = self.get(filename)
+        except Exception as e:
+            print(f'Error indexing frames of {filename}: {e}')
+            return
+        finally:
+            with self.lock:
+                self.building.discard(filename)
+        if index is not None:
+            callback(index)
+
+    def remove(self, filename):
+        try:
+            os.remove(self._index_path(filename))
+        except OSError:
+            pass
+
+    def rename(self, old, new):
+        try:
+            os.replace(self._index_path(old), self._index_path(new))
+        except OSError:
+            pass
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
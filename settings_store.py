@@ -0,0 +1,130 @@
+import os
+import json
+import threading
+from contextlib import contextmanager
+
+@contextmanager
+def atomic_write(path, mode='w', encoding='utf-8'):
+    '''
+    Open a temporary file to write in place of path, which is synced to disk and renamed over path once the
+    block finishes, so a crash never leaves a half-written file. Each writer gets its own temporary file,
+    so two threads writing the same path can't mix their data
+    '''
+    temp_path = f'{path}.{os.getpid()}-{threading.get_ident()}.tmp'
+    try:
+        with open(temp_path, mode, encoding=None if 'b' in mode else encoding) as temp_file:
+            yield temp_file
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+def atomic_write_json(path, data, **kwargs):
+    with atomic_write(path) as temp_file:
+        json.dump(data, temp_file, **kwargs)
+
+class SettingsStore:
+    def __init__(self, settings_path, compact_after=500):
+        '''
+        Settings persisted as a json snapshot plus an append-only journal of changes.
+        Each edit appends one small line instead of rewriting the whole file, and the journal
+        is folded back into the snapshot on close or once it grows past compact_after entries
+        '''
+        self.settings_path = settings_path
+        self.journal_path = os.path.splitext(settings_path)[0] + '.journal'
+        self.compact_after = compact_after
+        self.settings = None
+        self.journal_length = 0
+
+    def load(self):
+        # Returns the settings dict, or None if there are no saved settings yet
+        if os.path.exists(self.settings_path):
+            with open(self.settings_path, 'r', encoding='utf-8') as settings_file:
+                self.settings = json.load(settings_file)
+        if self.settings is not None and os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r', encoding='utf-8') as journal_file:
+                for line in journal_file:
+                    try:
+                        op = json.loads(line)
+                    except ValueError:
+                        # Only the last line can be incomplete, if the program crashed while writing it
+                        break
+                    self._apply(op)
+                    self.journal_length += 1
+        return self.settings
+
+    def reset(self, settings):
+        self.settings = settings
+        self.compact()
+
+    def _apply(self, op):
+        playlists = self.settings['playlists']
+        kind = op['op']
+        if kind == 'add':
+            # Checked so that replaying a journal over a snapshot it was already compacted into is harmless
+            if op['playlist'] in playlists and op['track'] not in playlists[op['playlist']]:
+                playlists[op['playlist']].append(op['track'])
+        elif kind == 'remove':
+            if op['playlist'] in playlists and op['track'] in playlists[op['playlist']]:
+                playlists[op['playlist']].remove(op['track'])
+        elif kind == 'rename':
+            self.settings['playlists'] = {op['new'] if name == op['old'] else name: tracks for name, tracks in playlists.items()}
+        elif kind == 'delete':
+            for tracks in playlists.values():
+                if op['track'] in tracks:
+                    tracks.remove(op['track'])
+        elif kind == 'rename track':
+            for tracks in playlists.values():
+                if op['old'] in tracks:
+                    tracks[tracks.index(op['old'])] = op['new']
+        elif kind == 'merge':
+            for tracks in playlists.values():
+                if op['old'] in tracks:
+                    if op['new'] in tracks:
+                        tracks.remove(op['old'])
+                    else:
+                        tracks[tracks.index(op['old'])] = op['new']
+
+    def _record(self, op):
+        self._apply(op)
+        with open(self.journal_path, 'a', encoding='utf-8') as journal_file:
+            journal_file.write(json.dumps(op) + '\n')
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+        self.journal_length += 1
+        if self.journal_length >= self.compact_after:
+            self.compact()
+
+    def add_track(self, playlist, track):
+        self._record({'op': 'add', 'playlist': playlist, 'track': track})
+
+    def remove_track(self, playlist, track):
+        self._record({'op': 'remove', 'playlist': playlist, 'track': track})
+
+    def rename_playlist(self, old, new):
+        self._record({'op': 'rename', 'old': old, 'new': new})
+
+    def delete_track(self, track):
+        self._record({'op': 'delete', 'track': track})
+
+    def rename_track(self, old, new):
+        self._record({'op': 'rename track', 'old': old, 'new': new})
+
+    def merge_track(self, old, new):
+        self._record({'op': 'merge', 'old': old, 'new': new})
+
+    def update(self, values):
+        # Scalar settings saved on close go straight into the snapshot rather than the journal
+        self.settings.update(values)
+
+    def compact(self):
+        # Written without indentation, which roughly halves the size of large playlists
+        atomic_write_json(self.settings_path, self.settings)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self.journal_length = 0
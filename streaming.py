@@ -0,0 +1,82 @@
+import os
+import time
+import threading
+
+class GrowingFile:
+    def __init__(self, paths, filename, duration):
+        '''
+        A download that is still being written, which can be played from the start while the rest arrives.
+        yt-dlp writes to a .part file and renames it once the download is done, so each of paths is tried in turn.
+        filename is the library file it becomes once it has been transcoded
+        '''
+        self.paths = paths
+        self.filename = filename
+        self.duration = duration
+        self.finished = threading.Event() # Every byte has been written
+        self.failed = threading.Event() # The download stopped, and nothing more will be written
+        self.closed = threading.Event() # Replaced by the library file, readers stop where they are
+
+    def open(self):
+        return GrowingFileReader(self)
+
+    def finish(self):
+        self.finished.set()
+
+    def fail(self):
+        self.failed.set()
+
+    def close(self):
+        self.closed.set()
+
+class GrowingFileReader:
+    def __init__(self, growing, poll=0.05):
+        '''
+        File object reading a GrowingFile from the start, waiting at the end of what has been written so far
+        until more arrives. The file is reopened for every read rather than held open, so the downloader
+        can still rename or delete it on Windows
+        '''
+        self.growing = growing
+        self.poll = poll
+        self.pos = 0
+        self.closed = False
+
+    def _read_once(self, size):
+        # None if the file doesn't exist under any of its names, e.g. deleted after transcoding
+        for path in self.growing.paths:
+            try:
+                with open(path, 'rb') as growing_file:
+                    growing_file.seek(self.pos)
+                    return growing_file.read(size)
+            except FileNotFoundError:
+                continue
+        return None
+
+    def read(self, size=64 * 1024):
+        growing = self.growing
+        while not (self.closed or growing.closed.is_set() or growing.failed.is_set()):
+            # Checked before reading, so data written just before the download finished isn't missed
+            finished = growing.finished.is_set()
+            data = self._read_once(size)
+            if data:
+                self.pos += len(data)
+                return data
+            if finished and data is not None:
+                return b''
+            time.sleep(self.poll)
+        return b''
+
+    def close(self):
+        self.closed = True
+
+def download_paths(d):
+    '''
+    The files a yt-dlp progress update is writing to, in the order they exist in
+    '''
+    paths = [d['tmpfilename']] if d.get('tmpfilename') else []
+    if d.get('filename') and d['filename'] not in paths:
+        paths.append(d['filename'])
+    return paths
+
+def final_filename(path, ext='mp3'):
+    # Name of the file FFmpegExtractAudio writes, which only replaces the extension
+    return os.path.splitext(os.path.basename(path))[0] + '.' + ext
@@ -0,0 +1,57 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search import SearchIndex
+
+class SearchIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = SearchIndex()
+        for name in ['Daft Punk - Around the World', 'Daft Punk - One More Time', 'Stardust - Music Sounds Better', 'Modjo - Lady']:
+            self.index.add(name, name)
+
+    def test_empty_query_returns_everything(self):
+        self.assertEqual(sorted(self.index.search('')), sorted(self.index.texts))
+        self.assertEqual(sorted(self.index.search(' - ')), sorted(self.index.texts))
+
+    def test_prefix_before_substring(self):
+        self.assertEqual(self.index.search('mus'), ['Stardust - Music Sounds Better'])
+        # 'dust' only matches inside 'stardust' until a word starts with it
+        self.assertEqual(self.index.search('dust'), ['Stardust - Music Sounds Better'])
+        self.index.add('Dusty Springfield - Son of a Preacher Man', 'Dusty Springfield - Son of a Preacher Man')
+        self.assertEqual(self.index.search('dust'), ['Dusty Springfield - Son of a Preacher Man', 'Stardust - Music Sounds Better'])
+
+    def test_every_word_has_to_match(self):
+        self.assertEqual(self.index.search('daft one'), ['Daft Punk - One More Time'])
+        self.assertEqual(self.index.search('daft lady'), [])
+
+    def test_single_letter_matches_word_starts_only(self):
+        self.assertEqual(self.index.search('l'), ['Modjo - Lady'])
+
+    def test_query_spanning_words(self):
+        self.assertEqual(self.index.search('e wo'), ['Daft Punk - Around the World'])
+        self.assertEqual(self.index.search('t pu'), ['Daft Punk - Around the World', 'Daft Punk - One More Time'])
+
+    def test_fuzzy_fallback(self):
+        self.assertEqual(self.index.search('dafy punk'), ['Daft Punk - Around the World', 'Daft Punk - One More Time'])
+        self.assertEqual(self.index.search('zzzz'), [])
+
+    def test_add_replaces_text(self):
+        self.index.add('Modjo - Lady', 'Modjo - Lady (Hear Me Tonight)')
+        self.assertEqual(self.index.search('tonight'), ['Modjo - Lady'])
+        self.assertEqual(len(self.index), 4)
+
+    def test_remove(self):
+        self.index.remove('Stardust - Music Sounds Better')
+        self.index.remove('not indexed')
+        self.assertEqual(self.index.search('music'), [])
+        self.assertNotIn('stardust', self.index.words)
+        self.assertNotIn('stardust', self.index.sorted_words)
+        self.assertFalse(any('stardust' in words for words in self.index.grams.values()))
+        self.assertEqual(self.index.sorted_words, sorted(self.index.words))
+        self.assertEqual(len(self.index), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import sys
+import struct
+import tempfile
+import unittest
+import importlib.util
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+HAS_MUTAGEN = importlib.util.find_spec('mutagen') is not None
+if HAS_MUTAGEN:
+    from seek_index import SeekIndex, read_toc, walk_frames
+
+# MPEG 1 Layer III, 128 kbps, 44.1 kHz, joint stereo: 417 byte frames of 1152 samples
+HEADER = bytes([0xFF, 0xFB, 0x90, 0x64])
+FRAME_LENGTH = 417
+FRAME_SECONDS = 1152 / 44100
+ID3_TAG = b'ID3\x04\x00\x00\x00\x00\x00\x14' + bytes(20)
+
+def frame(body=b''):
+    return HEADER + body + bytes(FRAME_LENGTH - len(HEADER) - len(body))
+
+def xing_frame(frames, total, toc):
+    # The Xing tag follows 32 bytes of side information in an MPEG 1 stereo frame
+    return frame(bytes(32) + b'Xing' + struct.pack('>III', 7, frames, total) + bytes(toc))
+
+def vbri_frame(scale, entry_size, frames_per_entry, entries):
+    table = b''.join(entry.to_bytes(entry_size, 'big') for entry in entries)
+    return frame(bytes(32) + b'VBRI' + bytes(14) + struct.pack('>HHHH', len(entries), scale, entry_size, frames_per_entry) + table)
+
+@unittest.skipUnless(HAS_MUTAGEN, 'seek_index imports metadata, which needs mutagen')
+class SeekIndexTest(unittest.TestCase):
+    def test_walk_every_frame(self):
+        data = ID3_TAG + frame() * 5
+        index = walk_frames(data, 0)
+        self.assertEqual(list(index.offsets), [len(ID3_TAG) + i * FRAME_LENGTH for i in range(5)])
+        for time, i in zip(index.times, range(5)):
+            self.assertAlmostEqual(time, i * FRAME_SECONDS)
+
+    def test_walk_records_one_frame_per_step(self):
+        index = walk_frames(frame() * 100, 0.5)
+        # The first frame at or after each half second
+        self.assertEqual([offset // FRAME_LENGTH for offset in index.offsets], [0, 20, 39, 58, 77, 96])
+
+    def test_walk_skips_info_frame_and_trailing_junk(self):
+        data = xing_frame(3, 4 * FRAME_LENGTH, range(100)) + frame() * 3 + b'TAG' + bytes(125)
+        index = walk_frames(data, 0)
+        self.assertEqual(list(index.offsets), [FRAME_LENGTH, 2 * FRAME_LENGTH, 3 * FRAME_LENGTH])
+        self.assertEqual(index.times[0], 0)
+
+    def test_walk_without_frames(self):
+        self.assertIsNone(walk_frames(ID3_TAG + bytes(1000), 0.5))
+
+    def test_xing_toc(self):
+        total = 1000 * FRAME_LENGTH
+        toc = [i * 256 // 100 for i in range(100)]
+        data = ID3_TAG + xing_frame(1000, total, toc) + frame() * 2
+        index = read_toc(data)
+        self.assertEqual(len(index), 100)
+        self.assertAlmostEqual(index.times[50], 500 * FRAME_SECONDS)
+        self.assertEqual(index.offsets[0], len(ID3_TAG))
+        self.assertEqual(index.offsets[50], len(ID3_TAG) + toc[50] * total // 256)
+
+    def test_xing_without_toc(self):
+        data = frame(bytes(32) + b'Xing' + struct.pack('>III', 3, 1000, 1000)) + frame()
+        self.assertIsNone(read_toc(data))
+
+    def test_vbri_toc(self):
+        data = vbri_frame(2, 2, 10, [100, 300, 200]) + frame()
+        index = read_toc(data)
+        self.assertEqual(list(index.offsets), [0, 200, 800, 1200])
+        for time, i in zip(index.times, range(4)):
+            self.assertAlmostEqual(time, i * 10 * FRAME_SECONDS)
+
+    def test_lookup(self):
+        index = SeekIndex([0.0, 0.5, 1.0], [10, 200, 400])
+        self.assertEqual(index.lookup(0), (0.0, 10))
+        self.assertEqual(index.lookup(0.7), (0.5, 200))
+        self.assertEqual(index.lookup(1.0), (1.0, 400))
+        self.assertEqual(index.lookup(60), (1.0, 400))
+        self.assertEqual(index.lookup(-1), (0.0, 10))
+
+    def test_save_and_load(self):
+        index = SeekIndex([0.0, 0.5], [10, 200])
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'track.mp3.seek')
+            index.save(path, 1234.5, 5000)
+            loaded = SeekIndex.load(path, 1234.5, 5000)
+            self.assertEqual(list(loaded.times), [0.0, 0.5])
+            self.assertEqual(list(loaded.offsets), [10, 200])
+            # Built from a different version of the file
+            self.assertIsNone(SeekIndex.load(path, 1234.5, 5001))
+            self.assertIsNone(SeekIndex.load(path, 1235.0, 5000))
+            self.assertIsNone(SeekIndex.load(os.path.join(folder, 'missing.seek'), 1234.5, 5000))
+            with open(path, 'r+b') as index_file:
+                index_file.truncate(10)
+            self.assertIsNone(SeekIndex.load(path, 1234.5, 5000))
+
+if __name__ == '__main__':
+    unittest.main()
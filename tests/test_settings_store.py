@@ -0,0 +1,88 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from settings_store import SettingsStore
+
+class SettingsStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'settings.json')
+        self.store = SettingsStore(self.path)
+        self.store.reset({'volume': 0.5, 'playlists': {'Road': ['a.mp3', 'b.mp3'], 'Gym': ['b.mp3']}})
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def reload(self):
+        self.store = SettingsStore(self.path)
+        return self.store.load()
+
+    def test_no_settings(self):
+        self.assertIsNone(SettingsStore(os.path.join(self.dir, 'missing.json')).load())
+
+    def test_edits_replayed_from_journal(self):
+        self.store.add_track('Road', 'c.mp3')
+        self.store.remove_track('Road', 'a.mp3')
+        self.store.rename_playlist('Gym', 'Run')
+        self.store.rename_track('b.mp3', 'B.mp3')
+        self.assertTrue(os.path.exists(self.store.journal_path))
+        settings = self.reload()
+        self.assertEqual(settings['playlists'], {'Road': ['B.mp3', 'c.mp3'], 'Run': ['B.mp3']})
+        self.assertEqual(self.store.journal_length, 4)
+
+    def test_delete_and_merge(self):
+        self.store.add_track('Gym', 'c.mp3')
+        self.store.delete_track('a.mp3')
+        # c.mp3 takes b.mp3's place where it isn't already listed
+        self.store.merge_track('b.mp3', 'c.mp3')
+        settings = self.reload()
+        self.assertEqual(settings['playlists'], {'Road': ['c.mp3'], 'Gym': ['c.mp3']})
+
+    def test_replay_is_idempotent(self):
+        # A journal replayed over a snapshot it was already folded into changes nothing
+        self.store.add_track('Road', 'c.mp3')
+        self.store.remove_track('Gym', 'b.mp3')
+        journal_path = self.store.journal_path
+        with open(journal_path, encoding='utf-8') as journal_file:
+            journal = journal_file.read()
+        self.reload()
+        self.store.compact()
+        with open(journal_path, 'w', encoding='utf-8') as journal_file:
+            journal_file.write(journal)
+        settings = self.reload()
+        self.assertEqual(settings['playlists'], {'Road': ['a.mp3', 'b.mp3', 'c.mp3'], 'Gym': []})
+
+    def test_incomplete_last_line_ignored(self):
+        self.store.add_track('Road', 'c.mp3')
+        with open(self.store.journal_path, 'a', encoding='utf-8') as journal_file:
+            journal_file.write('{"op": "add", "playl')
+        settings = self.reload()
+        self.assertEqual(settings['playlists']['Road'], ['a.mp3', 'b.mp3', 'c.mp3'])
+
+    def test_compact_folds_journal_into_snapshot(self):
+        self.store.add_track('Road', 'c.mp3')
+        self.store.update({'volume': 0.8})
+        self.store.compact()
+        self.assertFalse(os.path.exists(self.store.journal_path))
+        with open(self.path, encoding='utf-8') as settings_file:
+            saved = json.load(settings_file)
+        self.assertEqual(saved['volume'], 0.8)
+        self.assertEqual(saved['playlists']['Road'], ['a.mp3', 'b.mp3', 'c.mp3'])
+
+    def test_compacts_once_journal_is_long(self):
+        store = SettingsStore(self.path, compact_after=3)
+        store.load()
+        for name in ('c.mp3', 'd.mp3', 'e.mp3'):
+            store.add_track('Gym', name)
+        self.assertEqual(store.journal_length, 0)
+        self.assertFalse(os.path.exists(store.journal_path))
+        self.assertEqual(self.reload()['playlists']['Gym'], ['b.mp3', 'c.mp3', 'd.mp3', 'e.mp3'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,249 @@
+import os
+import sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracks import IndexedQueue, Playlist
+
+class IndexedQueueTest(unittest.TestCase):
+    def assertQueue(self, queue, expected):
+        self.assertEqual(list(queue), expected)
+        self.assertEqual(len(queue), len(expected))
+        for position, name in enumerate(expected):
+            self.assertEqual(queue[position], name)
+            self.assertEqual(queue.index(name), position)
+        if expected:
+            self.assertEqual(queue[-1], expected[-1])
+
+    def test_append_and_lookup(self):
+        queue = IndexedQueue(['a', 'b'])
+        queue.append('c')
+        self.assertQueue(queue, ['a', 'b', 'c'])
+        self.assertIn('b', queue)
+        self.assertNotIn('d', queue)
+
+    def test_remove_leaves_gap(self):
+        queue = IndexedQueue([str(i) for i in range(10)])
+        queue.remove('3')
+        queue.remove('7')
+        self.assertEqual(len(queue.slots), 10)
+        self.assertQueue(queue, ['0', '1', '2', '4', '5', '6', '8', '9'])
+
+    def test_append_after_gap(self):
+        # Appended slots have to count the gaps before them in the tree
+        queue = IndexedQueue([str(i) for i in range(6)])
+        queue.remove('1')
+        queue.remove('4')
+        for name in 'abcdefghij':
+            queue.append(name)
+        self.assertQueue(queue, ['0', '2', '3', '5'] + list('abcdefghij'))
+
+    def test_rebuild_once_gaps_outnumber_entries(self):
+        names = [str(i) for i in range(100)]
+        queue = IndexedQueue(names)
+        for name in names[:51]:
+            queue.remove(name)
+        # 51 gaps outnumber the 49 names left
+        self.assertEqual(queue.slots, names[51:])
+        for name in names[51:60]:
+            queue.remove(name)
+        self.assertQueue(queue, names[60:])
+
+    def test_keep_slots_prevents_rebuild(self):
+        names = [str(i) for i in range(100)]
+        queue = IndexedQueue(names)
+        queue.keep_slots = True
+        for name in names[:60]:
+            queue.remove(name)
+        self.assertEqual(len(queue.slots), 100)
+        self.assertQueue(queue, names[60:])
+
+    def test_errors(self):
+        queue = IndexedQueue(['a'])
+        with self.assertRaises(ValueError):
+            queue.remove('b')
+        with self.assertRaises(ValueError):
+            queue.index('b')
+        with self.assertRaises(IndexError):
+            queue[1]
+        queue.remove('a')
+        with self.assertRaises(IndexError):
+            queue[0]
+
+    def test_rename_swaps(self):
+        queue = IndexedQueue(['a', 'b', 'c'])
+        queue.rename({'a': 'b', 'b': 'a'})
+        self.assertQueue(queue, ['b', 'a', 'c'])
+
+    def test_random_edits(self):
+        rng = random.Random(2)
+        queue = IndexedQueue()
+        expected = []
+        for i in range(2000):
+            if expected and rng.random() < 0.45:
+                name = rng.choice(expected)
+                queue.remove(name)
+                expected.remove(name)
+            else:
+                queue.append(str(i))
+                expected.append(str(i))
+        self.assertQueue(queue, expected)
+
+class SameTitleTest(unittest.TestCase):
+    def setUp(self):
+        # Two uploads of the same song, which clean to the same name
+        self.playlist = Playlist('All')
+        self.playlist.add_tracks([('Intro', 'Intro_[ccccccccccc].mp3'), ('Song', 'Song_[aaaaaaaaaaa].mp3'),
+                                  ('Song', 'Song_[bbbbbbbbbbb].mp3')])
+
+    def test_listed_once(self):
+        self.assertEqual(list(self.playlist.get_queue()), ['Intro', 'Song'])
+        self.assertTrue(self.playlist.has_file('Song_[bbbbbbbbbbb].mp3'))
+
+    def test_remove_listed_file(self):
+        self.playlist.remove_file('Song_[aaaaaaaaaaa].mp3')
+        self.assertEqual(list(self.playlist.get_queue()), ['Intro', 'Song'])
+        self.assertEqual(self.playlist.get_track('Song'), 'Song_[bbbbbbbbbbb].mp3')
+        self.assertFalse(self.playlist.has_file('Song_[aaaaaaaaaaa].mp3'))
+
+    def test_remove_hidden_file(self):
+        self.playlist.remove_file('Song_[bbbbbbbbbbb].mp3')
+        self.assertEqual(list(self.playlist.get_queue()), ['Intro', 'Song'])
+        self.assertEqual(self.playlist.get_track('Song'), 'Song_[aaaaaaaaaaa].mp3')
+        self.assertFalse(self.playlist.has_file('Song_[bbbbbbbbbbb].mp3'))
+
+    def test_remove_both(self):
+        self.playlist.remove_file('Song_[aaaaaaaaaaa].mp3')
+        self.playlist.remove_file('Song_[bbbbbbbbbbb].mp3')
+        self.assertEqual(list(self.playlist.get_queue()), ['Intro'])
+        self.assertFalse(self.playlist.has_track('Song'))
+        self.assertEqual(self.playlist.files, {'Intro_[ccccccccccc].mp3': 'Intro'})
+
+    def test_merge_hidden_file(self):
+        # What merging the hidden upload into a differently named kept copy does to the playlist
+        self.playlist.rename_files({'Song_[bbbbbbbbbbb].mp3': ('Song Remastered', 'Song_Remastered_[ddddddddddd].mp3')})
+        self.assertEqual(list(self.playlist.get_queue()), ['Intro', 'Song', 'Song Remastered'])
+        self.assertEqual(self.playlist.get_track('Song'), 'Song_[aaaaaaaaaaa].mp3')
+        self.assertEqual(self.playlist.shadowed, {})
+        self.assertFalse(self.playlist.has_file('Song_[bbbbbbbbbbb].mp3'))
+
+    def test_merge_listed_file(self):
+        self.playlist.rename_files({'Song_[aaaaaaaaaaa].mp3': ('Song Remastered', 'Song_Remastered_[ddddddddddd].mp3')})
+        self.assertEqual(list(self.playlist.get_queue()), ['Intro', 'Song Remastered', 'Song'])
+        self.assertEqual(self.playlist.get_track('Song'), 'Song_[bbbbbbbbbbb].mp3')
+        self.assertEqual(self.playlist.shadowed, {})
+
+    def test_search_follows_replacement(self):
+        self.playlist.search('song')
+        self.playlist.remove_file('Song_[aaaaaaaaaaa].mp3')
+        self.assertEqual(self.playlist.search('song'), ['Song'])
+
+class RenameTest(unittest.TestCase):
+    def setUp(self):
+        self.playlist = Playlist('All')
+        self.playlist.add_tracks([('A', 'A_[aaaaaaaaaaa].mp3'), ('B', 'B_[bbbbbbbbbbb].mp3'), ('C', 'C_[ccccccccccc].mp3')])
+
+    def assertConsistent(self):
+        # Every listed name has one queue slot, and every file maps back to a name that is listed
+        playlist = self.playlist
+        self.assertEqual(sorted(playlist.get_queue()), sorted(playlist.tracks))
+        self.assertEqual(len(playlist.queue), len(playlist.tracks))
+        for file, name in playlist.files.items():
+            self.assertIn(name, playlist.tracks)
+            self.assertTrue(playlist.tracks[name] == file or file in playlist.shadowed[name])
+        for name, others in playlist.shadowed.items():
+            self.assertIn(name, playlist.tracks)
+            self.assertTrue(others)
+
+    def test_rename_in_place(self):
+        self.playlist.rename_tracks({'B': ('D', 'D_[bbbbbbbbbbb].mp3')})
+        self.assertEqual(list(self.playlist.get_queue()), ['A', 'D', 'C'])
+        self.assertConsistent()
+
+    def test_rename_onto_listed_name(self):
+        self.playlist.rename_tracks({'A': ('B', 'B_[aaaaaaaaaaa].mp3')})
+        self.assertEqual(list(self.playlist.get_queue()), ['B', 'C'])
+        self.assertEqual(self.playlist.get_track('B'), 'B_[bbbbbbbbbbb].mp3')
+        self.assertEqual(self.playlist.shadowed, {'B': ['B_[aaaaaaaaaaa].mp3']})
+        self.assertConsistent()
+        self.playlist.remove_track('C')
+        self.assertConsistent()
+
+    def test_swap(self):
+        self.playlist.rename_tracks({'A': ('B', 'B_[aaaaaaaaaaa].mp3'), 'B': ('A', 'A_[bbbbbbbbbbb].mp3')})
+        self.assertEqual(list(self.playlist.get_queue()), ['B', 'A', 'C'])
+        self.assertEqual(self.playlist.get_track('B'), 'B_[aaaaaaaaaaa].mp3')
+        self.assertConsistent()
+
+    def test_other_files_keep_old_name(self):
+        self.playlist.add_track('A', 'A_[ddddddddddd].mp3')
+        self.playlist.rename_tracks({'A': ('E', 'E_[aaaaaaaaaaa].mp3')})
+        self.assertEqual(list(self.playlist.get_queue()), ['E', 'B', 'C', 'A'])
+        self.assertEqual(self.playlist.get_track('A'), 'A_[ddddddddddd].mp3')
+        self.assertEqual(self.playlist.shadowed, {})
+        self.assertConsistent()
+
+    def test_rename_hidden_file(self):
+        self.playlist.add_track('A', 'A_[ddddddddddd].mp3')
+        self.playlist.rename_files({'A_[ddddddddddd].mp3': ('E', 'E_[ddddddddddd].mp3')})
+        self.assertEqual(list(self.playlist.get_queue()), ['A', 'B', 'C', 'E'])
+        self.assertEqual(self.playlist.get_track('A'), 'A_[aaaaaaaaaaa].mp3')
+        self.assertConsistent()
+
+    def test_position_follows_current_track(self):
+        self.playlist.set_queue_pos(1)
+        self.playlist.rename_tracks({'A': ('C', 'C_[aaaaaaaaaaa].mp3')})
+        self.assertEqual(self.playlist.get_queue()[self.playlist.get_queue_pos()], 'B')
+
+class ShuffleTest(unittest.TestCase):
+    def setUp(self):
+        self.playlist = Playlist('All')
+        self.playlist.add_tracks([(str(i), f'{i}.mp3') for i in range(50)])
+        self.playlist.shuffle_queue(seed=7)
+
+    def assertOrder(self, expected):
+        queue = self.playlist.get_queue()
+        self.assertEqual(list(queue), expected)
+        for position, name in enumerate(expected):
+            self.assertEqual(queue.index(name), position)
+
+    def test_same_seed_same_order(self):
+        other = Playlist('Other')
+        other.add_tracks([(str(i), f'{i}.mp3') for i in range(50)])
+        other.shuffle_queue(seed=7)
+        self.assertEqual(list(other.get_queue()), list(self.playlist.get_queue()))
+        self.assertEqual(sorted(self.playlist.get_queue(), key=int), [str(i) for i in range(50)])
+
+    def test_added_tracks_play_last(self):
+        order = list(self.playlist.get_queue())
+        self.playlist.add_tracks([('new 1', 'new_1.mp3'), ('new 2', 'new_2.mp3')])
+        self.assertOrder(order + ['new 1', 'new 2'])
+
+    def test_removing_keeps_order(self):
+        order = list(self.playlist.get_queue())
+        self.playlist.set_queue_pos(10)
+        current, following = order[10], order[11]
+        for name in (order[3], order[20]):
+            self.playlist.remove_track(name)
+            order.remove(name)
+        self.assertOrder(order)
+        self.assertEqual(self.playlist.increment_queue(0), current)
+        self.assertEqual(self.playlist.peek_queue(1), following)
+
+    def test_random_edits(self):
+        rng = random.Random(1)
+        order = list(self.playlist.get_queue())
+        for i in range(300):
+            if order and rng.random() < 0.5:
+                name = rng.choice(order)
+                self.playlist.remove_track(name)
+                order.remove(name)
+            else:
+                self.playlist.add_track(f'added {i}', f'added_{i}.mp3')
+                order.append(f'added {i}')
+        self.assertOrder(order)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from watcher import ChangeBatch, rename_steps
+
+class ChangeBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.batch = ChangeBatch()
+
+    def test_empty(self):
+        self.assertFalse(self.batch)
+
+    def test_written_then_renamed_is_added(self):
+        self.batch.add('tmp.mp3')
+        self.batch.rename('tmp.mp3', 'A.mp3')
+        self.assertEqual(self.batch.added, {'A.mp3'})
+        self.assertEqual(self.batch.renamed, {})
+
+    def test_renamed_twice(self):
+        self.batch.rename('A.mp3', 'B.mp3')
+        self.batch.rename('B.mp3', 'C.mp3')
+        self.assertEqual(self.batch.renamed, {'A.mp3': 'C.mp3'})
+
+    def test_renamed_back(self):
+        self.batch.rename('A.mp3', 'B.mp3')
+        self.batch.rename('B.mp3', 'A.mp3')
+        self.assertEqual(self.batch.renamed, {})
+        self.assertFalse(self.batch)
+
+    def test_swap(self):
+        self.batch.rename('A.mp3', 'T.mp3')
+        self.batch.rename('B.mp3', 'A.mp3')
+        self.batch.rename('T.mp3', 'B.mp3')
+        self.assertEqual(self.batch.renamed, {'A.mp3': 'B.mp3', 'B.mp3': 'A.mp3'})
+
+    def test_renamed_then_removed(self):
+        self.batch.rename('A.mp3', 'B.mp3')
+        self.batch.remove('B.mp3')
+        self.assertEqual(self.batch.renamed, {})
+        self.assertEqual(self.batch.removed, {'A.mp3'})
+
+    def test_added_then_removed(self):
+        self.batch.add('A.mp3')
+        self.batch.remove('A.mp3')
+        self.assertEqual(self.batch.added, set())
+        self.assertEqual(self.batch.removed, {'A.mp3'})
+
+class RenameStepsTest(unittest.TestCase):
+    def apply(self, names, renames):
+        # Renames one file at a time like the caches do, failing if a step would overwrite a file
+        names = set(names)
+        for old, new in rename_steps(renames):
+            self.assertIn(old, names)
+            self.assertNotIn(new, names)
+            names.remove(old)
+            names.add(new)
+        return names
+
+    def test_chain(self):
+        self.assertEqual(self.apply({'A', 'B'}, {'A': 'B', 'B': 'C'}), {'B', 'C'})
+
+    def test_swap(self):
+        self.assertEqual(self.apply({'A', 'B', 'C'}, {'A': 'B', 'B': 'A'}), {'A', 'B', 'C'})
+
+    def test_rotation(self):
+        steps = rename_steps({'A': 'B', 'B': 'C', 'C': 'A'})
+        self.assertEqual(self.apply({'A', 'B', 'C'}, {'A': 'B', 'B': 'C', 'C': 'A'}), {'A', 'B', 'C'})
+        self.assertEqual(len(steps), 4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+from tkinter import Listbox, END
+from tkinter import font as tkfont
+from tkinter.ttk import Frame, Scrollbar
+
+class TrackList(Frame):
+    def __init__(self, master, **kwargs):
+        '''
+        Virtualized list of track names. Only the rows currently visible are inserted into the Listbox,
+        so showing or refreshing a playlist costs the same no matter how many tracks it holds
+        '''
+        super().__init__(master, **kwargs)
+        self.items = []
+        self.offset = 0
+        self.rows = 1
+        self.selected = None
+
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(0, weight=1)
+
+        # Widgets
+        self.listbox = Listbox(self, activestyle='none', exportselection=False)
+        self.scrollbar = Scrollbar(self, orient='vertical', command=self._on_scrollbar)
+
+        # Grid
+        self.listbox.grid(row=0, column=0, sticky='nsew')
+        self.scrollbar.grid(row=0, column=1, sticky='ns')
+
+        # Bindings
+        self.listbox.bind('<Configure>', self._on_configure)
+        self.listbox.bind('<<ListboxSelect>>', self._on_select)
+        self.listbox.bind('<MouseWheel>', self._on_mousewheel)
+        self.listbox.bind('<Button-4>', lambda e: self._scroll_rows(-3))
+        self.listbox.bind('<Button-5>', lambda e: self._scroll_rows(3))
+
+    def bind(self, sequence=None, func=None, add=None):
+        # Event bindings belong on the Listbox, which is the widget the user actually clicks
+        return self.listbox.bind(sequence, func, add)
+
+    def set_items(self, items):
+        # Show a new sequence (e.g. a playlist's queue). The sequence is referenced, not copied
+        if items is not self.items:
+            self.items = items
+            self.offset = 0
+            self.selected = None
+        self.refresh()
+
+    def refresh(self):
+        # Re-render the visible window, e.g. after tracks were added to or removed from the underlying sequence
+        self.offset = max(0, min(self.offset, len(self.items) - self.rows))
+        if self.selected is not None and self.selected >= len(self.items):
+            self.selected = None
+        self._render()
+
+    def item_removed(self, index):
+        # Keep the selection on the same track when an earlier row disappears
+        if self.selected is not None:
+            if self.selected == index:
+                self.selected = None
+            elif self.selected > index:
+                self.selected -= 1
+        if index < self.offset:
+            self.offset -= 1
+        self.refresh()
+
+    def get(self, index):
+        # Accepts the tuple returned by curselection, like Listbox.get
+        if isinstance(index, tuple):
+            index = index[0]
+        return self.items[index]
+
+    def curselection(self):
+        if self.selected is None:
+            return ()
+        return (self.selected,)
+
+    def selection_set(self, index):
+        self.selected = index
+        self._render()
+
+    def selection_clear(self, first=None, last=None):
+        self.selected = None
+        self.listbox.selection_clear(0, END)
+
+    def see(self, index):
+        if index < self.offset:
+            self.offset = index
+        elif index >= self.offset + self.rows:
+            self.offset = index - self.rows + 1
+        self.refresh()
+
+    def _render(self):
+        self.listbox.delete(0, END)
+        # One extra row so the bottom of the listbox isn't left blank when it shows a partial line
+        visible = [self.items[i] for i in range(self.offset, min(len(self.items), self.offset + self.rows + 1))]
+        if visible:
+            self.listbox.insert(END, *visible)
+        if self.selected is not None and self.offset <= self.selected < self.offset + len(visible):
+            self.listbox.selection_set(self.selected - self.offset)
+        self._update_scrollbar()
+
+    def _update_scrollbar(self):
+        total = len(self.items)
+        if total <= self.rows:
+            self.scrollbar.set(0.0, 1.0)
+        else:
+            self.scrollbar.set(self.offset / total, (self.offset + self.rows) / total)
+
+    def _scroll_rows(self, num):
+        offset = max(0, min(self.offset + num, len(self.items) - self.rows))
+        if offset != self.offset:
+            self.offset = offset
+            self._render()
+        return 'break'
+
+    def _on_scrollbar(self, *args):
+        '''
+        Helper function translating scrollbar commands into a row offset
+        '''
+        if args[0] == 'moveto':
+            self.offset = max(0, min(int(float(args[1]) * len(self.items)), len(self.items) - self.rows))
+            self._render()
+        elif args[0] == 'scroll':
+            num = int(args[1])
+            if args[2] == 'pages':
+                num *= self.rows
+            self._scroll_rows(num)
+
+    def _on_mousewheel(self, event):
+        '''
+        Helper function for scrolling the visible window instead of the Listbox itself
+        '''
+        return self._scroll_rows(-3 * int(event.delta / 120) or (-1 if event.delta > 0 else 1))
+
+    def _on_configure(self, event):
+        '''
+        Helper function recalculating how many rows fit when the list is resized
+        '''
+        linespace = tkfont.Font(font=self.listbox.cget('font')).metrics('linespace')
+        rows = max(1, event.height // (linespace + 1))
+        if rows != self.rows:
+            self.rows = rows
+            self.refresh()
+
+    def _on_select(self, event):
+        '''
+        Helper function mapping a clicked row back to its position in the full sequence
+        '''
+        selection = self.listbox.curselection()
+        if selection:
+            self.selected = self.offset + selection[0]
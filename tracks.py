@@ -1,4 +1,225 @@
 import random
+from search import SearchIndex
+
+class IndexedQueue:
+    def __init__(self, items=()):
+        '''
+        Ordered sequence of unique track names with O(log n) append, remove, index and positional lookup.
+        Removed names leave a gap in the slot list, and a Fenwick tree counting the live slots turns a
+        position into a slot and back. Gaps are compacted once they outnumber the live entries, unless
+        keep_slots is set because something, e.g. a ShuffleOrder, refers to names by slot
+        '''
+        self.keep_slots = False
+        self._build(list(items))
+
+    def _build(self, items):
+        self.slots = items
+        self.slot_of = {name: slot for slot, name in enumerate(items)}
+        self.size = len(items)
+        # Fenwick tree over slots, 1-indexed, where every live slot counts as 1
+        self.tree = [0] * (self.size + 1)
+        for i in range(1, self.size + 1):
+            self.tree[i] += 1
+            parent = i + (i & -i)
+            if parent <= self.size:
+                self.tree[parent] += self.tree[i]
+
+    def _prefix(self, count):
+        # Number of live entries among the first count slots
+        total = 0
+        while count > 0:
+            total += self.tree[count]
+            count -= count & -count
+        return total
+
+    def _find_slot(self, position):
+        # Slot holding the live entry at the given position, found by descending the tree
+        slot = 0
+        step = 1 << (len(self.tree) - 1).bit_length()
+        remaining = position + 1
+        while step:
+            nxt = slot + step
+            if nxt < len(self.tree) and self.tree[nxt] < remaining:
+                slot = nxt
+                remaining -= self.tree[nxt]
+            step >>= 1
+        return slot
+
+    def append(self, name):
+        self.slots.append(name)
+        i = len(self.slots)
+        # Node i covers slots (i - lowbit(i), i], all of which already exist and are live unless there are gaps
+        if self.size == i - 1:
+            self.tree.append(i & -i)
+        else:
+            self.tree.append(1 + self._prefix(i - 1) - self._prefix(i - (i & -i)))
+        self.slot_of[name] = i - 1
+        self.size += 1
+
+    def remove(self, name):
+        if name not in self.slot_of:
+            raise ValueError(f'{name} is not in queue')
+        slot = self.slot_of.pop(name)
+        self.slots[slot] = None
+        i = slot + 1
+        while i < len(self.tree):
+            self.tree[i] -= 1
+            i += i & -i
+        self.size -= 1
+        if not self.keep_slots and len(self.slots) - self.size > max(32, self.size):
+            self.compact()
+
+    def compact(self):
+        if self.size != len(self.slots):
+            self._build([name for name in self.slots if name is not None])
+
+    def rename(self, renames):
+        # Each new name takes its old one's place in the order. All old names are freed first,
+        # so names can be swapped, but a new name mustn't be one that stays in the queue
+        slots = [(self.slot_of.pop(old), new) for old, new in renames.items()]
+        for slot, new in slots:
+            self.slots[slot] = new
+            self.slot_of[new] = slot
+
+    def index(self, name):
+        if name not in self.slot_of:
+            raise ValueError(f'{name} is not in queue')
+        slot = self.slot_of[name]
+        if self.size == len(self.slots):
+            return slot
+        return self._prefix(slot + 1) - 1
+
+    def __getitem__(self, position):
+        if position < 0:
+            position += self.size
+        if not 0 <= position < self.size:
+            raise IndexError('queue index out of range')
+        if self.size == len(self.slots):
+            return self.slots[position]
+        return self.slots[self._find_slot(position)]
+
+    def __contains__(self, name):
+        return name in self.slot_of
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for name in self.slots:
+            if name is not None:
+                yield name
+
+MASK64 = (1 << 64) - 1
+
+def _mix(value):
+    # splitmix64 finalizer, a cheap hash that is the same on every run and platform
+    value = (value + 0x9E3779B97F4A7C15) & MASK64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & MASK64
+    return value ^ (value >> 31)
+
+class ShuffleOrder:
+    def __init__(self, queue, seed, rounds=4):
+        '''
+        Shuffled view of a queue that is never materialized. The queue's slots when shuffled are permuted through a
+        Feistel network keyed by the seed, a bijection over the next power of 4, walking the cycle until it lands
+        inside them. Tracks added later play after the shuffled ones in the order they were added, and removing one
+        leaves the others where they were, so neither reshuffles what is left to play. A Fenwick tree counting
+        removed positions keeps lookups both ways at O(log n) on top of the queue's own
+        '''
+        queue.compact()
+        queue.keep_slots = True
+        self.queue = queue
+        self.seed = seed
+        self.keys = [_mix(seed * rounds + i) for i in range(rounds)]
+        self.size = len(queue) # Slots that are shuffled, later ones are in queue order after them
+        bits = max(2, (self.size - 1).bit_length())
+        self.half = (bits + 1) // 2
+        self.mask = (1 << self.half) - 1
+        self.removed = 0
+        self.removed_tree = {} # Sparse Fenwick tree over shuffled positions, 1-indexed, counting removed ones
+
+    def _encrypt(self, value):
+        while True:
+            left, right = value >> self.half, value & self.mask
+            for key in self.keys:
+                left, right = right, left ^ (_mix(right ^ key) & self.mask)
+            value = left << self.half | right
+            if value < self.size:
+                return value
+
+    def _decrypt(self, value):
+        while True:
+            left, right = value >> self.half, value & self.mask
+            for key in reversed(self.keys):
+                left, right = right ^ (_mix(left ^ key) & self.mask), left
+            value = left << self.half | right
+            if value < self.size:
+                return value
+
+    def _removed_before(self, shuffled):
+        total = 0
+        while shuffled > 0:
+            total += self.removed_tree.get(shuffled, 0)
+            shuffled -= shuffled & -shuffled
+        return total
+
+    def _find(self, position):
+        # Shuffled position of the track at the given position, skipping removed ones
+        if not self.removed:
+            return position
+        shuffled = 0
+        step = 1 << self.size.bit_length()
+        remaining = position + 1
+        while step:
+            nxt = shuffled + step
+            if nxt <= self.size:
+                live = (nxt & -nxt) - self.removed_tree.get(nxt, 0)
+                if live < remaining:
+                    shuffled = nxt
+                    remaining -= live
+            step >>= 1
+        return shuffled
+
+    def remove(self, name):
+        # Called before name is removed from the queue
+        slot = self.queue.slot_of[name]
+        if slot < self.size:
+            i = self._decrypt(slot) + 1
+            while i <= self.size:
+                self.removed_tree[i] = self.removed_tree.get(i, 0) + 1
+                i += i & -i
+            self.removed += 1
+
+    def __getitem__(self, position):
+        size = len(self.queue)
+        if position < 0:
+            position += size
+        if not 0 <= position < size:
+            raise IndexError('queue index out of range')
+        if position >= self.size - self.removed:
+            # Added after shuffling, and the same position in the queue
+            return self.queue[position]
+        return self.queue.slots[self._encrypt(self._find(position))]
+
+    def index(self, name):
+        if name not in self.queue:
+            raise ValueError(f'{name} is not in queue')
+        slot = self.queue.slot_of[name]
+        if slot >= self.size:
+            return self.queue.index(name)
+        shuffled = self._decrypt(slot)
+        return shuffled - self._removed_before(shuffled)
+
+    def __contains__(self, name):
+        return name in self.queue
+
+    def __len__(self):
+        return len(self.queue)
+
+    def __iter__(self):
+        for position in range(len(self.queue)):
+            yield self[position]
 
 class Playlist:
     def __init__(self, name):
@@ -6,10 +227,15 @@ class Playlist:
         Playlist class to hold a list of tracks and their filenames, controlling ordering of playback
         '''
         self.name = name
-        self.queue = []
+        self.queue = IndexedQueue()
         self.queue_pos = 0
+        self.order = None # ShuffleOrder over the queue while shuffled
         self.tracks = {}
+        self.files = {}
+        self.shadowed = {} # Name to other files with the same name, e.g. re-uploads, which aren't listed separately
         self.was_shuffled = False
+        self.search_index = None
+        self.search_text = None
 
     def set_name(self, name):
         self.name = name
@@ -18,12 +244,122 @@ class Playlist:
         return self.name
 
     def add_track(self, name, file):
-        self.tracks[name] = file
-        self.queue.append(name)
+        self.add_tracks([(name, file)])
+
+    def add_tracks(self, items):
+        # Append (name, file) pairs, only relocating the current track in a shuffled order once
+        current = self._current()
+        for name, file in items:
+            if name in self.tracks:
+                # Only one entry per name, another file with it takes its place if it is removed
+                self.files[file] = name
+                self.shadowed.setdefault(name, []).append(file)
+                continue
+            self.tracks[name] = file
+            self.files[file] = name
+            self.queue.append(name)
+            if self.search_index is not None:
+                self.search_index.add(name, self._get_search_text(name, file))
+        if self.order is not None and current is not None:
+            self.queue_pos = self.order.index(current)
 
     def remove_track(self, name):
-        del self.tracks[name]
-        self.queue.remove(name)
+        # Keep queue position on the same track when an earlier one is removed
+        current = self._current()
+        if self.order is None and self.queue.index(name) < self.queue_pos:
+            self.queue_pos -= 1
+        del self.files[self.tracks.pop(name)]
+        for file in self.shadowed.pop(name, ()):
+            del self.files[file]
+        self._remove_from_queue(name)
+        if self.order is not None and current is not None and current != name:
+            self.queue_pos = self.order.index(current)
+        if self.search_index is not None:
+            self.search_index.remove(name)
+
+    def remove_file(self, file):
+        # Remove a track by its file, which may share its name with another file in the playlist
+        name = self.files[file]
+        others = self.shadowed.get(name)
+        if others:
+            del self.files[file]
+            if file in others:
+                others.remove(file)
+            else:
+                # The listed file is gone, so the next one with its name is listed in its place
+                self.tracks[name] = others.pop(0)
+                self.reindex_file(self.tracks[name])
+            if not others:
+                del self.shadowed[name]
+            return
+        self.remove_track(name)
+
+    def rename_tracks(self, renames):
+        '''
+        Renamed files keep their place in the playlist and queue, renames maps listed names to (new name, new file).
+        A file renamed onto a name that stays listed becomes another file with that name instead, and other
+        files with an old name are listed under it again at the end, unless a renamed file has taken it
+        '''
+        current = self._current()
+        listed = set(self.tracks) - set(renames)
+        in_place = {}
+        onto = []
+        for name, (new_name, new_file) in renames.items():
+            del self.files[self.tracks[name]]
+            if new_name in listed:
+                onto.append((new_name, new_file))
+            else:
+                listed.add(new_name)
+                in_place[name] = (new_name, new_file)
+        left = [(name, file) for name in renames for file in self.shadowed.pop(name, ())]
+        self.queue.rename({name: new_name for name, (new_name, _) in in_place.items()})
+        tracks = {}
+        for name, file in self.tracks.items():
+            if name in in_place:
+                name, file = in_place[name]
+                self.files[file] = name
+            elif name in renames:
+                continue
+            tracks[name] = file
+        self.tracks = tracks
+        for name in renames:
+            if name not in in_place:
+                self._remove_from_queue(name)
+        if self.search_index is not None:
+            # All removed before any are added, as a new name can be another track's old one
+            for name in renames:
+                self.search_index.remove(name)
+            for new_name, new_file in in_place.values():
+                self.search_index.add(new_name, self._get_search_text(new_name, new_file))
+        self.add_tracks(onto + left)
+        if current is not None:
+            current = in_place[current][0] if current in in_place else current
+            if current in self.queue:
+                self.queue_pos = self.get_queue().index(current)
+            else:
+                self.queue_pos = min(self.queue_pos, max(len(self.queue) - 1, 0))
+
+    def rename_files(self, renames):
+        # Like rename_tracks, but renames maps files to (new name, new file). Files listed under their name keep
+        # their place, while other files sharing a name move to their new one as if they had just been added
+        listed = {}
+        moved = []
+        for file, (new_name, new_file) in renames.items():
+            name = self.files[file]
+            if self.tracks[name] == file:
+                listed[name] = (new_name, new_file)
+            else:
+                self.remove_file(file)
+                moved.append((new_name, new_file))
+        if listed:
+            self.rename_tracks(listed)
+        self.add_tracks(moved)
+
+    def has_track(self, name):
+        return name in self.tracks
+
+    def has_file(self, file):
+        return file in self.files
 
     def get_track(self, name):
         return self.tracks[name]
@@ -40,8 +376,38 @@ class Playlist:
             names.append(name)
         return names
 
+    def search(self, query, search_text=None):
+        # The index is built on the first search, then kept up to date as tracks are added and removed.
+        # search_text(name, file) can supply extra text to match, such as tags
+        if self.search_index is None:
+            self.search_text = search_text
+            self.search_index = SearchIndex()
+            for name, file in self.tracks.items():
+                self.search_index.add(name, self._get_search_text(name, file))
+        return self.search_index.search(query)
+
+    def reindex_file(self, file):
+        # Refresh the searchable text of a track, e.g. once its tags are known
+        if self.search_index is not None and file in self.files:
+            self.search_index.add(self.files[file], self._get_search_text(self.files[file], file))
+
+    def _get_search_text(self, name, file):
+        if self.search_text:
+            return self.search_text(name, file)
+        return name
+
+    def _remove_from_queue(self, name):
+        if self.order is not None:
+            self.order.remove(name)
+        self.queue.remove(name)
+
+    def _current(self):
+        queue = self.get_queue()
+        return queue[self.queue_pos] if 0 <= self.queue_pos < len(queue) else None
+
     def get_queue(self):
-        return self.queue
+        # The order tracks play in, which is the shuffled view while shuffled
+        return self.order if self.order is not None else self.queue
     
     def get_queue_pos(self):
         return self.queue_pos
@@ -51,32 +417,43 @@ class Playlist:
         
     def increment_queue(self, num):
         # Next song played in queue (or previous if given -1). Will loop the playlist, preserving order even if shuffled
+        queue = self.get_queue()
         self.queue_pos += num
-        if self.queue_pos >= len(self.queue):
+        if self.queue_pos >= len(queue):
             self.queue_pos = 0
         elif self.queue_pos < 0:
-            self.queue_pos = len(self.queue) - 1
-        track = self.queue[self.queue_pos]
+            self.queue_pos = len(queue) - 1
+        track = queue[self.queue_pos]
         return track
 
-    def shuffle_queue(self):
-        # Shuffle queue while ensuring current track is at start
-        print('Before shuffle: ' + str(self.queue_pos))
-        cur_track = self.queue[self.queue_pos]
-        random.shuffle(self.queue)
-        index = self.queue.index(cur_track)
-        self.queue.pop(index)
-        self.queue.insert(0, cur_track)
-        self.queue_pos = 0
-        print('After shuffle: ' + str(self.queue_pos))
+    def peek_queue(self, num):
+        # Track that increment_queue(num) would move to, without moving there
+        queue = self.get_queue()
+        if not queue:
+            return None
+        return queue[(self.queue_pos + num) % len(queue)]
+
+    def shuffle_queue(self, seed=None):
+        # Shuffle queue from a seed, a new one if not given, relocating position of current track.
+        # The order is generated as it is read, so this doesn't depend on the size of the playlist
+        cur_track = self._current()
+        self.order = ShuffleOrder(self.queue, random.getrandbits(32) if seed is None else seed)
+        self.queue_pos = self.order.index(cur_track) if cur_track is not None else 0
 
     def unshuffle_queue(self):
         # Unshuffle queue, relocating position of current track
-        print('Before unshuffle: ' + str(self.queue_pos))
-        cur_track = self.queue[self.queue_pos]
-        self.queue = self.get_track_names()
-        self.queue_pos = self.queue.index(cur_track)
-        print('After unshuffle: ' + str(self.queue_pos))
+        cur_track = self._current()
+        self.order = None
+        self.queue.keep_slots = False
+        self.queue_pos = self.queue.index(cur_track) if cur_track is not None else 0
+
+    def get_shuffle_seed(self):
+        return self.order.seed if self.order is not None else None
+
+    def get_unshuffled_position(self):
+        # Position of the current track in playlist order
+        cur_track = self._current()
+        return self.queue.index(cur_track) if cur_track is not None else 0
 
     def get_length(self):
         return len(self.tracks)
@@ -84,6 +461,49 @@ class Playlist:
     def get_queue_position(self):
         return self.queue_pos
 
+class LazyPlaylist(Playlist):
+    def __init__(self, name, loader):
+        '''
+        Playlist backed by the library database, whose tracks are only fetched the first time they are needed.
+        loader is called with the playlist and returns (name, file) pairs in order
+        '''
+        self.loader = loader
+        self.loaded = False
+        super().__init__(name)
+
+    def _load(self):
+        if not self.loaded:
+            self.loaded = True
+            for name, file in self.loader(self):
+                Playlist.add_track(self, name, file)
+
+    @property
+    def queue(self):
+        self._load()
+        return self._queue
+
+    @queue.setter
+    def queue(self, queue):
+        self._queue = queue
+
+    @property
+    def tracks(self):
+        self._load()
+        return self._tracks
+
+    @tracks.setter
+    def tracks(self, tracks):
+        self._tracks = tracks
+
+    @property
+    def files(self):
+        self._load()
+        return self._files
+
+    @files.setter
+    def files(self, files):
+        self._files = files
+
 class Track:
     def __init__(self):
         self.playlists = set()
@@ -1,23 +1,19 @@
 import os
-from tracks import Track
 from yt_dlp.postprocessor import PostProcessor
+from instrumentation import instruments
 
 class UIUpdatePostProcessor(PostProcessor):
-    def __init__(self, musicbox_instance):
+    def __init__(self, engine):
         '''
-        Custom post-processor to update UI as files are downloaded
+        Custom post-processor to add files to the library as they are downloaded.
+        It runs on a transcode worker, so it only queues the file for the main thread to add
         '''
         super().__init__(None)
-        self.musicbox = musicbox_instance
+        self.engine = engine
 
+    @instruments.timed('download post-process')
     def run(self, info):
         # This runs after the file is fully processed (e.g., mp3 is ready)
         filename = info['filepath']
-        basename = os.path.basename(filename)
-        # Add to playlist and tracks
-        self.musicbox.playlist_all.add_track(self.musicbox.clean_filename(basename), basename)
-        self.musicbox.tracks[basename] = Track()
-        # Update the UI (must use .after to run in main thread)
-        self.musicbox.root.after(0, lambda: self.musicbox.change_playlist(None))
-        self.musicbox.cur_download += 1
-        return [], info
\ No newline at end of file
+        self.engine.queue_downloaded_track(os.path.basename(filename))
+        return [], info
@@ -0,0 +1,257 @@
+import os
+import sys
+import time
+import ctypes
+import ctypes.util
+import select
+import struct
+import threading
+
+# inotify event masks, from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+EVENT_HEADER = struct.Struct('iIII')
+
+class ChangeBatch:
+    def __init__(self):
+        '''
+        Library changes collected since the last batch, with later events folded into earlier ones,
+        e.g. a file written under a temporary name and then renamed is a single addition
+        '''
+        self.added = set()
+        self.removed = set()
+        self.renamed = {} # Old name to new name
+        self.rescan = False # Events were lost, the whole folder has to be compared
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.renamed or self.rescan)
+
+    def add(self, name):
+        self.removed.discard(name)
+        self.added.add(name)
+
+    def remove(self, name):
+        self.added.discard(name)
+        for old, new in list(self.renamed.items()):
+            if new == name:
+                del self.renamed[old]
+                name = old
+        self.removed.add(name)
+
+    def rename(self, old, new):
+        if old in self.added:
+            self.added.discard(old)
+            self.added.add(new)
+            return
+        for first, target in self.renamed.items():
+            if target == old:
+                old = first
+                break
+        if old == new:
+            # Renamed back to where it started
+            self.renamed.pop(old, None)
+        else:
+            self.renamed[old] = new
+
+def rename_steps(renames):
+    '''
+    Orders a set of renames applied together into single renames that never move onto a name
+    another file still has to move away from, going through a temporary name to break cycles, e.g. swaps
+    '''
+    pending = dict(renames)
+    steps = []
+    while pending:
+        ready = [old for old, new in pending.items() if new not in pending]
+        if not ready:
+            old = next(iter(pending))
+            temp = old + '.renaming'
+            steps.append((old, temp))
+            pending[temp] = pending.pop(old)
+            continue
+        for old in ready:
+            steps.append((old, pending.pop(old)))
+    return steps
+
+class LibraryWatcher:
+    def __init__(self, filepath, debounce=0.5, poll_interval=2.0, rescan_interval=60.0, extension='.mp3'):
+        '''
+        Watches the library folder for files added, removed or renamed outside the program, using inotify
+        on Linux and comparing folder listings elsewhere. Changes are handed out in batches once the folder
+        has been quiet for debounce seconds, so copying many files at once is a single update.
+        When polling, the folder is only listed again once its modification time changes, or every
+        rescan_interval seconds in case a change landed within the same tick of a coarse clock
+        '''
+        self.filepath = filepath
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.rescan_interval = rescan_interval
+        self.extension = extension
+        self.lock = threading.Lock()
+        self.batch = ChangeBatch()
+        self.last_event = 0.0
+        self.stopped = threading.Event()
+        self.thread = None
+        self.fd = None
+        self.backend = None
+        self.on_change = None # Called from the watching thread when a new batch starts collecting
+
+    def start(self, entries):
+        '''
+        Start watching, given the (name, mtime, size) entries the library was loaded from
+        '''
+        if sys.platform.startswith('linux') and self._init_inotify():
+            self.backend = 'inotify'
+            target = self._inotify_thread
+        else:
+            self.backend = 'polling'
+            target = self._poll_thread
+        self.thread = threading.Thread(target=target, args=(entries,), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join(timeout=1)
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def drain(self):
+        '''
+        Returns the pending ChangeBatch once no events have arrived for the debounce time, otherwise None
+        '''
+        with self.lock:
+            if not self.batch or time.monotonic() - self.last_event < self.debounce:
+                return None
+            batch = self.batch
+            self.batch = ChangeBatch()
+        return batch
+
+    def has_pending(self):
+        # Whether changes are waiting for the folder to go quiet
+        return bool(self.batch)
+
+    def _record(self, kind, *names):
+        with self.lock:
+            first = not self.batch
+            getattr(self.batch, kind)(*names)
+            self.last_event = time.monotonic()
+        if first and self.on_change:
+            self.on_change()
+
+    def _watched(self, name):
+        return name.endswith(self.extension)
+
+    def _init_inotify(self):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd < 0:
+                return False
+            mask = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+            if libc.inotify_add_watch(fd, os.fsencode(self.filepath), mask) < 0:
+                os.close(fd)
+                return False
+        except (OSError, AttributeError):
+            return False
+        self.fd = fd
+        return True
+
+    def _inotify_thread(self, entries):
+        moves = {} # Cookie to name, for files moved away until the other half of the rename arrives
+        while not self.stopped.is_set():
+            ready, _, _ = select.select([self.fd], [], [], 0.5)
+            if not ready:
+                # A move whose destination never arrived left the folder
+                for name in moves.values():
+                    self._record('remove', name)
+                moves = {}
+                continue
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            except OSError:
+                return
+            offset = 0
+            while offset < len(data):
+                _, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+                self._inotify_event(mask, cookie, name, moves)
+
+    def _inotify_event(self, mask, cookie, name, moves):
+        if mask & IN_Q_OVERFLOW:
+            with self.lock:
+                first = not self.batch
+                self.batch.rescan = True
+                self.last_event = time.monotonic()
+            if first and self.on_change:
+                self.on_change()
+        elif mask & IN_CLOSE_WRITE:
+            # Only reported once a file is closed, so files are never picked up half written
+            if self._watched(name):
+                self._record('add', name)
+        elif mask & IN_MOVED_FROM:
+            moves[cookie] = name
+        elif mask & IN_MOVED_TO:
+            old = moves.pop(cookie, None)
+            if old is not None and self._watched(old):
+                if self._watched(name):
+                    self._record('rename', old, name)
+                else:
+                    self._record('remove', old)
+            elif self._watched(name):
+                self._record('add', name)
+        elif mask & IN_DELETE:
+            if self._watched(name):
+                self._record('remove', name)
+        elif mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            self.stopped.set()
+
+    def _scan(self):
+        files = {}
+        with os.scandir(self.filepath) as it:
+            for entry in it:
+                if entry.is_file() and self._watched(entry.name):
+                    stat = entry.stat()
+                    files[entry.name] = (stat.st_mtime, stat.st_size)
+        return files
+
+    def _poll_thread(self, entries):
+        previous = {name: (mtime, size) for name, mtime, size in entries}
+        folder_mtime = None
+        last_scan = time.monotonic()
+        changing = True # Changes come in bursts, so the folder is listed again after one is seen
+        while not self.stopped.wait(self.poll_interval):
+            try:
+                mtime = os.stat(self.filepath).st_mtime_ns
+                if mtime == folder_mtime and not changing and time.monotonic() - last_scan < self.rescan_interval:
+                    continue
+                folder_mtime = mtime
+                last_scan = time.monotonic()
+                current = self._scan()
+            except OSError:
+                continue
+            added = {name: current[name] for name in current.keys() - previous.keys()}
+            removed = {name: previous[name] for name in previous.keys() - current.keys()}
+            # A file that disappeared while one with the same mtime and size appeared was renamed
+            by_stat = {stat: name for name, stat in added.items()}
+            for name, stat in removed.items():
+                new = by_stat.pop(stat, None)
+                if new is not None:
+                    self._record('rename', name, new)
+                else:
+                    self._record('remove', name)
+            for name in by_stat.values():
+                self._record('add', name)
+            changing = bool(added or removed)
+            previous = current
@@ -0,0 +1,223 @@
+import os
+import ast
+import glob
+import mmap
+import threading
+import subprocess
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from processes import popen
+from settings_store import atomic_write
+try:
+    import numpy as np
+except ImportError:
+    # Peaks are computed and drawn with the standard library instead, in the same file format
+    np = None
+
+PEAKS_PER_SECOND = 20
+SAMPLE_RATE = 8000 # Plenty for the outline of a waveform, and keeps decoding cheap
+NPY_MAGIC = b'\x93NUMPY\x01\x00'
+
+def decode_peaks(path, peaks_per_second=PEAKS_PER_SECOND):
+    '''
+    Decode a track with ffmpeg and return the min and max sample of every 1/peaks_per_second of it,
+    as interleaved signed bytes
+    '''
+    window = SAMPLE_RATE // peaks_per_second
+    window_bytes = 2 * window
+    process = popen(['ffmpeg', '-v', 'error', '-nostdin', '-i', path, '-ac', '1', '-ar', str(SAMPLE_RATE),
+                     '-f', 's16le', 'pipe:1'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    peaks = array('b')
+    rest = b''
+    try:
+        while True:
+            data = process.stdout.read(window_bytes * 4096)
+            if not data:
+                break
+            # Reads from a pipe can stop anywhere, so a partial window is kept for the next one
+            data = rest + data
+            end = len(data) - len(data) % window_bytes
+            rest = data[end:]
+            _add_peaks(peaks, data[:end], window)
+        # The last window can be short, and a stray byte at the very end isn't a whole sample
+        _add_peaks(peaks, rest[:len(rest) - len(rest) % 2], window)
+    finally:
+        process.stdout.close()
+        process.wait()
+    return peaks
+
+def _add_peaks(peaks, data, window):
+    # Appends the min and max of each window of samples in data, the last of which can be short
+    if not data:
+        return
+    if np is not None:
+        samples = np.frombuffer(data, dtype='<i2')
+        count = -(-len(samples) // window)
+        # The last window is padded with its own last sample, which leaves its min and max unchanged
+        padded = np.full(count * window, samples[-1], dtype='<i2')
+        padded[:len(samples)] = samples
+        windows = padded.reshape(count, window)
+        pairs = np.stack([windows.min(axis=1), windows.max(axis=1)], axis=1) >> 8
+        peaks.frombytes(pairs.astype('i1').tobytes())
+    else:
+        samples = array('h', data)
+        for start in range(0, len(samples), window):
+            chunk = samples[start:start + window]
+            peaks.append(min(chunk) >> 8)
+            peaks.append(max(chunk) >> 8)
+
+def save_peaks(path, peaks):
+    '''
+    Write interleaved peaks as an (n, 2) int8 .npy file, which numpy can memory-map
+    '''
+    header = repr({'descr': '|i1', 'fortran_order': False, 'shape': (len(peaks) // 2, 2)})
+    # The header is padded so the data starts on a 64 byte boundary
+    padding = 64 - (len(NPY_MAGIC) + 2 + len(header) + 1) % 64
+    header = (header + ' ' * padding + '\n').encode('latin1')
+    with atomic_write(path, 'wb') as peaks_file:
+        peaks_file.write(NPY_MAGIC + len(header).to_bytes(2, 'little') + header)
+        peaks.tofile(peaks_file)
+
+class Peaks:
+    def __init__(self, path):
+        '''
+        A saved peak file, memory-mapped so only the parts that are drawn are read from disk.
+        The file can't be deleted or replaced on Windows until it is closed
+        '''
+        with open(path, 'rb') as peaks_file:
+            self.mmap = mmap.mmap(peaks_file.fileno(), 0, access=mmap.ACCESS_READ)
+        header_length = int.from_bytes(self.mmap[8:10], 'little')
+        header = ast.literal_eval(self.mmap[10:10 + header_length].decode('latin1'))
+        count = header['shape'][0]
+        start = 10 + header_length
+        if np is not None:
+            self.data = np.frombuffer(self.mmap, dtype='i1', count=2 * count, offset=start).reshape(count, 2)
+        else:
+            self.data = memoryview(self.mmap)[start:start + 2 * count].cast('b')
+
+    def __len__(self):
+        if self.data is None:
+            return 0
+        return len(self.data) if np is not None else len(self.data) // 2
+
+    def columns(self, width):
+        '''
+        (min, max) between -1 and 1 for each of width columns, merging the peaks that fall in each
+        '''
+        count = len(self)
+        if not count or width <= 0:
+            return []
+        edges = [i * count // width for i in range(width)]
+        if np is not None:
+            edges = np.minimum(np.array(edges), count - 1)
+            lows = np.minimum.reduceat(self.data[:, 0], edges) / 128
+            highs = np.maximum.reduceat(self.data[:, 1], edges) / 128
+            return list(zip(lows.tolist(), highs.tolist()))
+        columns = []
+        for i, start in enumerate(edges):
+            end = max(edges[i + 1] if i + 1 < width else count, start + 1)
+            start = min(start, count - 1)
+            columns.append((min(self.data[2 * start:2 * end:2]) / 128, max(self.data[2 * start + 1:2 * end:2]) / 128))
+        return columns
+
+    def close(self):
+        if self.mmap is not None:
+            if np is None:
+                self.data.release()
+            # The array has to go before the mmap can close
+            self.data = None
+            self.mmap.close()
+            self.mmap = None
+
+class WaveformCache:
+    def __init__(self, cache_path, filepath, workers=2):
+        '''
+        Peak files for library tracks, built in the background by decoding each track once.
+        A file's size and modification time are part of its peak file's name, so a changed track is never drawn stale
+        '''
+        self.cache_path = cache_path
+        self.filepath = filepath
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.lock = threading.Lock()
+        self.building = {}
+        self.loaded = None # (filename, Peaks) last loaded, kept open while the track is shown
+        if not os.path.exists(cache_path):
+            os.makedirs(cache_path)
+
+    def _peaks_path(self, filename):
+        stat = os.stat(os.path.join(self.filepath, filename))
+        return os.path.join(self.cache_path, f'{filename}.{int(stat.st_mtime)}-{stat.st_size}.npy')
+
+    def _versions(self, filename):
+        return glob.glob(os.path.join(glob.escape(self.cache_path), glob.escape(filename) + '.*.npy'))
+
+    def load(self, filename):
+        '''
+        The peaks of a track, or None if they haven't been built yet. Only one track's waveform is shown,
+        so loading closes the peaks loaded before
+        '''
+        self._evict()
+        try:
+            path = self._peaks_path(filename)
+            if not os.path.exists(path):
+                return None
+            self.loaded = (filename, Peaks(path))
+            return self.loaded[1]
+        except (OSError, ValueError):
+            return None
+
+    def _evict(self, filename=None):
+        # Closes the loaded peaks, or only filename's, so their file can be deleted or renamed
+        if self.loaded is not None and filename in (None, self.loaded[0]):
+            self.loaded[1].close()
+            self.loaded = None
+
+    def request(self, filename):
+        '''
+        Build a track's peaks in the background, unless they exist or are already being built
+        '''
+        with self.lock:
+            if filename in self.building:
+                return
+            try:
+                if os.path.exists(self._peaks_path(filename)):
+                    return
+            except OSError:
+                return
+            self.building[filename] = self.executor.submit(self._build, filename)
+
+    def _build(self, filename):
+        try:
+            path = self._peaks_path(filename)
+            for old in self._versions(filename):
+                try:
+                    os.remove(old)
+                except OSError:
+                    # Still mapped for drawing on Windows, it goes once the track is changed or removed
+                    pass
+            save_peaks(path, decode_peaks(os.path.join(self.filepath, filename)))
+        except Exception as e:
+            print(f'Error building waveform of {filename}: {e}')
+        finally:
+            with self.lock:
+                del self.building[filename]
+
+    def remove(self, filename):
+        self._evict(filename)
+        for path in self._versions(filename):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def rename(self, old, new):
+        self._evict(old)
+        for path in self._versions(old):
+            try:
+                os.replace(path, os.path.join(self.cache_path, new + path[len(os.path.join(self.cache_path, old)):]))
+            except OSError:
+                pass
+
+    def close(self):
+        self._evict()
+        self.executor.shutdown(wait=False, cancel_futures=True)